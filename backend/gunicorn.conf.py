@@ -0,0 +1,27 @@
+"""
+gunicorn -c backend/gunicorn.conf.py backend.wsgi
+
+Общий каталог метрик для воркеров (users/metrics.py). Переменная задаётся здесь,
+в мастере, до импорта prometheus_client, и наследуется воркерами.
+"""
+import os
+import shutil
+from pathlib import Path
+
+multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', str(Path(__file__).resolve().parent.parent / 'var' / 'prometheus'),
+)
+
+
+def on_starting(server):
+    # Файлы прошлого запуска дали бы уже несуществующим воркерам вечные значения
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
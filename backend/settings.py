@@ -1,6 +1,9 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from users.dbprofile import database_settings, replica_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.middleware.SlowQueryMiddleware',
+    'users.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,6 +47,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'users.middleware.ReplicaStickinessMiddleware',
+    'users.middleware.ProfilingMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -56,7 +63,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     )
 }
 
@@ -91,13 +98,77 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Профиль БД задаётся окружением: DB_PROFILE=sqlite (по умолчанию), sqlite-wal
+# или postgres; параметры профилей — в users/dbprofile.py
+
 DATABASES = {
+    'default': database_settings(os.environ, BASE_DIR),
+    **replica_settings(os.environ, BASE_DIR),
+}
+
+# Чтение каталога с реплик, запись и всё остальное — с основной БД (users/routers.py).
+# После записи клиент REPLICA_STICKY_SECONDS секунд читает с основной
+DATABASE_ROUTERS = ['users.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache
+# Для нескольких воркеров нужен общий бэкенд (file/redis/memcached), иначе
+# сброс версий каталога в одном процессе не увидят остальные
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Сколько живёт пользователь в кэше аутентификации; ограничивает устаревание
+# после массовых UPDATE, которые не вызывают сигналы
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+
+# Снимок каталога для /api/catalog/snapshot/; каталог должен быть общим для воркеров.
+# Собирает manage.py build_catalog_snapshot при деплое и --watch (или cron с --if-stale) после правок
+CATALOG_SNAPSHOT_DIR = os.environ.get('CATALOG_SNAPSHOT_DIR', BASE_DIR / 'var' / 'catalog')
+
+# Быстрая сериализация каталога из values() (users/rows.py); False — обычные сериализаторы DRF
+CATALOG_FAST_SERIALIZATION = True
+
+# Асинхронные вьюхи каталога и профиля (users/async_views.py), только под ASGI: под WSGI
+# каждая шла бы через async_to_sync. Выключены по умолчанию и под ASGI — bench_async
+# не показал выигрыша перед синхронными вьюхами
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '0') == '1'
+
+# Метрики Prometheus на /metrics (users/metrics.py). Включаются только вместе с METRICS_TOKEN:
+# без токена /metrics отдаёт 404 и метрики не собираются, с ним нужен заголовок
+# Authorization: Bearer <токен> (bearer_token в scrape_config). Несколько воркеров —
+# см. PROMETHEUS_MULTIPROC_DIR и backend/gunicorn.conf.py
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Журнал SQL дольше порога с планом запроса (users/slowqueries.py), отчёт — /admin/slow-queries/.
+# Выключен по умолчанию: каждый запрос к БД проходит через обёртку
+SLOW_QUERY_LOG = os.environ.get('DJANGO_SLOW_QUERY_LOG', '0') == '1'
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE', BASE_DIR / 'var' / 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# Профиль одного запроса (users/profiling.py): заголовок X-Profile-Token с токеном из
+# manage.py profiling_token или ?_profile=1 (?_profile=memory — и tracemalloc) для staff.
+# Отчёты — в PROFILING_DIR, имя — в заголовке ответа X-Profile-Id. Токен — на один путь
+# и на 15 минут; в каталоге остаются PROFILING_KEEP последних отчётов за PROFILING_RETENTION секунд
+PROFILING_ENABLED = os.environ.get('DJANGO_PROFILING', '1') == '1'
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'var' / 'profiles')
+PROFILING_TOKEN_MAX_AGE = 15 * 60
+PROFILING_KEEP = 100
+PROFILING_RETENTION = 7 * 24 * 60 * 60
+PROFILING_TOP = 40
+PROFILING_TRACEMALLOC_FRAMES = 1
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,7 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from users.admin import slow_queries_report
+from users.views import metrics_view
+
 urlpatterns = [
+    path('admin/slow-queries/', admin.site.admin_view(slow_queries_report), name='slow-queries'),
     path('admin/', admin.site.urls),
     path('api/', include('users.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
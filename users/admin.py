@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import User, MembershipCard, UserMembership, Tour, BonusHistory, Region, Country, City
+from django.template.response import TemplateResponse
+
+from . import slowqueries
+from .models import ROLLUP_FIELDS, User, MembershipCard, UserMembership, Tour, BonusHistory, BalanceEntry, Region, Country, City
 
 
 @admin.register(User)
@@ -8,7 +12,7 @@ class UserAdmin(admin.ModelAdmin):
     list_filter = ("is_staff", "is_active")
     search_fields = ("email", "first_name", "last_name", "ref_id")
     ordering = ("email",)
-    readonly_fields = ("ref_id",)
+    readonly_fields = ("ref_id", "balance")
 
     fieldsets = (
         (None, {"fields": ("email", "password")}),
@@ -46,16 +50,18 @@ class UserMembershipAdmin(admin.ModelAdmin):
 
 @admin.register(Region)
 class RegionAdmin(admin.ModelAdmin):
-    list_display = ("name", "display_name", "best_time")
+    list_display = ("name", "display_name", "best_time", "cities_count", "min_price")
     search_fields = ("name", "display_name", "description")
+    readonly_fields = ROLLUP_FIELDS
 
 
 @admin.register(Country)
 class CountryAdmin(admin.ModelAdmin):
-    list_display = ("name", "region", "capital", "population", "currency", "best_time")
+    list_display = ("name", "region", "capital", "population", "currency", "best_time", "cities_count", "min_price")
     list_filter = ("region", "currency")
     search_fields = ("name", "capital", "language")
     list_select_related = ("region",)
+    readonly_fields = ROLLUP_FIELDS
 
 
 @admin.register(City)
@@ -75,3 +81,34 @@ class BonusHistoryAdmin(admin.ModelAdmin):
     list_display = ("referrer", "referred_user", "amount", "created_at")
     list_filter = ("created_at",)
     search_fields = ("referrer__email", "referred_user__email")
+
+
+@admin.register(BalanceEntry)
+class BalanceEntryAdmin(admin.ModelAdmin):
+    list_display = ("user", "amount", "kind", "created_at")
+    list_filter = ("kind", "created_at")
+    search_fields = ("user__email",)
+    list_select_related = ("user",)
+
+    # Записи создаются только через BalanceEntry.post, их нельзя править или удалять
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+def slow_queries_report(request):
+    """Медленные SQL из журнала SlowQueryMiddleware, сгруппированные по отпечатку."""
+    context = {
+        **admin.site.each_context(request),
+        'title': "Медленные SQL-запросы",
+        'groups': slowqueries.report(),
+        'enabled': settings.SLOW_QUERY_LOG,
+        'threshold': settings.SLOW_QUERY_THRESHOLD_MS,
+        'log_file': slowqueries.log_path(),
+    }
+    return TemplateResponse(request, 'admin/slow_queries.html', context)
@@ -0,0 +1,204 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+from . import services
+from .cache import CACHE_HEADER, aget_versions, get_cache
+from .serializers import ProfileSerializer
+from .views import (
+    ProfileView, MembershipCardListView,
+    RegionListView, RegionDetailView, CountryListView, CountryDetailView,
+    CityListView, CityDetailView, CountryCitiesView, RegionCountriesView,
+)
+
+
+class AsyncAPIView(View):
+    """
+    Асинхронный GET поверх DRF-вьюхи sync_view: согласование формата,
+    права, заголовки и ошибки — её же, а чтение кэша и БД — через
+    асинхронные API Django, без блокировки потока воркера ASGI.
+    Включаются настройкой ASYNC_VIEWS (см. users/urls.py).
+    OPTIONS и неподдерживаемые методы (405) обслуживает sync_view — ответы как у синхронных вьюх.
+    """
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как APIView.as_view: аутентификация DRF без сессионного CSRF
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def make_view(self, request, args, kwargs):
+        view = self.sync_view()
+        view.args, view.kwargs = args, kwargs
+        view.headers = view.default_response_headers
+        view.request = view.initialize_request(request, *args, **kwargs)
+        return view
+
+    async def initial(self, view, request):
+        # APIView.initial, только аутентификация и троттлинг асинхронные
+        view.format_kwarg = view.get_format_suffix(**view.kwargs)
+        request.accepted_renderer, request.accepted_media_type = view.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = view.determine_version(request, *view.args, **view.kwargs)
+        # request.user запускает аутентификацию DRF (Request._authenticate) в синхронном потоке
+        await sync_to_async(getattr)(request, 'user')
+        view.check_permissions(request)
+        if view.get_throttles():
+            await sync_to_async(view.check_throttles)(request)
+
+    async def get(self, request, *args, **kwargs):
+        view = self.make_view(request, args, kwargs)
+        try:
+            await self.initial(view, view.request)
+            if not self.is_async_capable(view):
+                return await sync_to_async(self.sync_fallback)(request, *args, **kwargs)
+            response = await self.respond(view, view.request)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return self.finalize(view, response)
+
+    async def options(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_fallback)(request, *args, **kwargs)
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_fallback)(request, *args, **kwargs)
+
+    def sync_fallback(self, request, *args, **kwargs):
+        return self.sync_view.as_view()(request, *args, **kwargs).render()
+
+    def finalize(self, view, response):
+        # Отрендеренный HttpResponse: обработчик ASGI не будет рендерить его в отдельном потоке
+        response = view.finalize_response(view.request, response)
+        if isinstance(response, Response):
+            response.render()
+            response = HttpResponse(response.content, status=response.status_code, headers=response.headers)
+        return response
+
+    def is_async_capable(self, view):
+        return True
+
+    async def respond(self, view, request):
+        raise NotImplementedError
+
+
+# ---------- CATALOG ----------
+class AsyncCatalogView(AsyncAPIView):
+    """
+    Списки и детали каталога: кэш ответов как в CachedResponseMixin и
+    быстрая сериализация как в FastSerializationMixin. ?fields/?expand
+    и браузерный API обслуживает исходная синхронная вьюха.
+    """
+
+    def is_async_capable(self, view):
+        return view.use_fast_path()
+
+    async def respond(self, view, request):
+        cache = get_cache()
+        versions = await aget_versions(view.get_cache_scopes())
+        key = view.get_cache_key(request, versions)
+        cached = await cache.aget(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response[CACHE_HEADER] = 'HIT'
+            return response
+
+        view.read_primary_after_bump(versions)
+        response = self.finalize(view, await self.get_response(view, request))
+        if response.status_code == 200:
+            await cache.aset(key, (response.content, response['Content-Type']), view.get_cache_timeout())
+        response[CACHE_HEADER] = 'MISS'
+        return response
+
+    async def get_response(self, view, request):
+        rows, queryset = view.fast_rows()
+        if 'pk' in view.kwargs:
+            lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+            row = await aget_object_or_404(queryset, **{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+            return Response((await rows.aserialize([row]))[0])
+
+        paginator = view.paginator
+        if paginator is None:
+            return Response(await rows.aserialize([row async for row in queryset]))
+        page = await paginator.apaginate_queryset(queryset, request, view=view)
+        return view.get_paginated_response(await rows.aserialize(page))
+
+
+class AsyncMembershipCardListView(AsyncCatalogView):
+    sync_view = MembershipCardListView
+
+
+class AsyncRegionListView(AsyncCatalogView):
+    sync_view = RegionListView
+
+
+class AsyncRegionDetailView(AsyncCatalogView):
+    sync_view = RegionDetailView
+
+
+class AsyncRegionCountriesView(AsyncCatalogView):
+    sync_view = RegionCountriesView
+
+
+class AsyncCountryListView(AsyncCatalogView):
+    sync_view = CountryListView
+
+
+class AsyncCountryDetailView(AsyncCatalogView):
+    sync_view = CountryDetailView
+
+
+class AsyncCountryCitiesView(AsyncCatalogView):
+    sync_view = CountryCitiesView
+
+
+class AsyncCityListView(AsyncCatalogView):
+    sync_view = CityListView
+
+
+class AsyncCityDetailView(AsyncCatalogView):
+    sync_view = CityDetailView
+
+
+# ---------- PROFILE ----------
+async def aload_profile_sections(user):
+    """
+    Разделы ProfileSerializer одной пачкой через asyncio.gather.
+    Все запросы только читают и не зависят друг от друга. Асинхронный ORM
+    Django выполняет их в общем потоке соединения (sync_to_async с
+    thread_sensitive=True), поэтому запросы к БД идут по очереди, но event loop
+    при этом свободен для других запросов.
+    """
+    memberships, total_referrals, referral_users, bonus_history, bonus_totals, active_membership = await asyncio.gather(
+        alist(ProfileSerializer.memberships_queryset().filter(user=user)),
+        user.referrals.acount(),
+        alist(ProfileSerializer.referral_users_queryset(user)),
+        alist(ProfileSerializer.bonus_history_queryset(user)),
+        user.bonuses_received.aaggregate(**ProfileSerializer.BONUS_TOTALS),
+        services.acurrent_membership(user),
+    )
+    return {
+        'user_memberships': memberships,
+        'total_referrals': total_referrals,
+        'referral_users': referral_users,
+        'bonus_history': bonus_history,
+        'bonus_totals': bonus_totals,
+        'active_membership': active_membership,
+    }
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+class AsyncProfileView(AsyncAPIView):
+    sync_view = ProfileView
+
+    async def respond(self, view, request):
+        sections = await aload_profile_sections(request.user)
+        serializer = view.get_serializer(request.user, context={**view.get_serializer_context(), 'sections': sections})
+        return Response(serializer.data)
@@ -0,0 +1,102 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+AUTH_USER_CACHE_PREFIX = 'auth:user:'
+
+
+def auth_user_version_key(user_id):
+    return f'{AUTH_USER_CACHE_PREFIX}{user_id}'
+
+
+def auth_user_cache_key(user_id, version, token_id):
+    return f'{AUTH_USER_CACHE_PREFIX}{user_id}:{version}:{token_id}'
+
+
+def get_auth_user_version(user_id):
+    # Версия на пользователя: записи всех его токенов сбрасываются удалением одного ключа
+    key = auth_user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key) or uuid.uuid4().hex
+    return version
+
+
+def forget_auth_user(*user_ids):
+    def _forget():
+        cache.delete_many([auth_user_version_key(user_id) for user_id in user_ids])
+
+    # Как и bump(): сразу и после коммита, чтобы параллельный запрос
+    # не положил в кэш строку до фиксации транзакции
+    _forget()
+    if not transaction.get_autocommit():
+        transaction.on_commit(_forget)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, который не читает пользователя из БД на каждый запрос.
+    Поля пользователя (без пароля) хранятся в кэше Django AUTH_USER_CACHE_TIMEOUT
+    секунд под ключом пользователя и токена (jti, без него — iat) и сбрасываются
+    при сохранении/удалении (см. signals.py); is_active и отзыв токена по смене
+    пароля проверяются на каждом запросе, как в базовом классе.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        token_id = validated_token.get(api_settings.JTI_CLAIM) or validated_token.get('iat')
+        key = auth_user_cache_key(user_id, get_auth_user_version(user_id), token_id)
+        cached = cache.get(key)
+        if cached is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            cached = self.dump_user(user)
+            cache.set(key, cached, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 5 * 60))
+        return self.check_user(self.load_user(cached), validated_token, cached.get('password_hash'))
+
+    # ---------- SERIALIZATION ----------
+    def dump_user(self, user):
+        """Поля модели без пароля; для CHECK_REVOKE_TOKEN — только его md5, как в токене."""
+        fields = {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields if field.attname != 'password'
+        }
+        cached = {'db': user._state.db, 'fields': fields}
+        if api_settings.CHECK_REVOKE_TOKEN:
+            cached['password_hash'] = get_md5_hash_password(user.password)
+        return cached
+
+    def load_user(self, cached):
+        # Пароль остаётся отложенным полем: прочитать его можно только запросом в БД
+        fields = cached['fields']
+        return self.user_model.from_db(cached['db'], list(fields), list(fields.values()))
+
+    # ---------- CHECKS ----------
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def check_user(self, user, validated_token, password_hash=None):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if password_hash is None:
+                password_hash = get_md5_hash_password(user.password)
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,148 @@
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Временная тестовая БД на время бенчмарка, рабочая база не трогается.
+    Для SQLite берётся файл, а не память, чтобы блокировки записи были как в проде.
+    """
+    settings_dict = connection.settings_dict
+    directory = None
+    if connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp(prefix='bench-')
+        settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    try:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        if directory is not None:
+            # Файлы -wal/-shm и сам каталог destroy_test_db не удаляет
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_threads(count, target):
+    """Запускает target(index) в count потоках, возвращает время в секундах."""
+    def worker(index):
+        try:
+            target(index)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    """Сводка по задержкам в миллисекундах и пропускной способности."""
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+# ---------- DATASET ----------
+BENCH_PASSWORD = 'bench-password'
+
+
+def seed_catalog(rng, cities, countries, batch_size=5000):
+    """Регионы (по одному на 20 стран), страны и города; bulk_create без сигналов — агрегаты пересчитать отдельно."""
+    from .models import Region, Country, City
+
+    regions = Region.objects.bulk_create([
+        Region(name=f"region-{r}", display_name=f"Region {r}", description="", image="https://example.com/r.jpg",
+               best_time="summer", highlights=["a", "b"])
+        for r in range(max(1, countries // 20))
+    ])
+    country_rows = Country.objects.bulk_create([
+        Country(region=regions[c % len(regions)], name=f"country-{c}", description="",
+                image="https://example.com/c.jpg", capital="capital", population="1", language="uz",
+                currency="UZS", best_time="spring", highlights=["a"])
+        for c in range(countries)
+    ])
+    for start in range(0, cities, batch_size):
+        City.objects.bulk_create([
+            City(country=country_rows[i % len(country_rows)], name=f"city-{i}", description="",
+                 image="https://example.com/ct.jpg", price=rng.randint(100, 5000), best_time="autumn",
+                 rating=Decimal(rng.randint(10, 50)) / 10, highlights=["a", "b"], attractions=["c"])
+            for i in range(start, min(cities, start + batch_size))
+        ])
+    return regions, country_rows
+
+
+def seed_users(rng, users, chain_length=5, tours_per_user=2, batch_size=2000):
+    """
+    Пользователи с общим паролем BENCH_PASSWORD, цепочки рефералов по chain_length,
+    карты у каждого третьего, туры и бонусы рефереров. Нужен каталог (seed_catalog).
+    """
+    from .models import User, MembershipCard, UserMembership, City, Tour, BonusHistory
+    from .refids import allocator
+
+    password = make_password(BENCH_PASSWORD)
+    cards = [
+        MembershipCard.objects.create(name=name, code=name.lower(), duration_months=12, price=100 * (n + 1),
+                                      description="", discount_tours=2, discount_percent=10 * (n + 1),
+                                      bonus_amount=Decimal(5 * (n + 1)), monthly_limit=None)
+        for n, name in enumerate(["Silver", "Gold", "Platinum"])
+    ]
+    # Цепочки строятся уровнями: реферер каждого уровня уже сохранён на предыдущем
+    chains = -(-users // chain_length)
+    level = [None] * chains
+    for depth in range(chain_length):
+        level = User.objects.bulk_create([
+            User(email=f"user-{chain}-{depth}@example.com", password=password, ref_id=allocator.allocate(),
+                 first_name=f"User {chain}-{depth}", referrer=referrer)
+            for chain, referrer in enumerate(level) if chain * chain_length + depth < users
+        ], batch_size=batch_size)
+    rows = list(User.objects.order_by('pk'))
+
+    memberships = []
+    for user in rows[::3]:
+        membership = UserMembership(user=user, card=rng.choice(cards))
+        membership.fill_defaults()
+        memberships.append(membership)
+    UserMembership.objects.bulk_create(memberships, batch_size=batch_size)
+
+    city_ids = list(City.objects.values_list('pk', flat=True)[:1000])
+    tours = Tour.objects.bulk_create([
+        Tour(user=user, city_id=rng.choice(city_ids), title=f"tour-{n}", price=Decimal(rng.randint(100, 5000)))
+        for user in rows for n in range(tours_per_user)
+    ], batch_size=batch_size)
+    by_id = {user.pk: user for user in rows}
+    BonusHistory.objects.bulk_create([
+        BonusHistory(referrer_id=by_id[tour.user_id].referrer_id, referred_user_id=tour.user_id, tour=tour,
+                     amount=Decimal("5.00"))
+        for tour in tours if by_id[tour.user_id].referrer_id
+    ], batch_size=batch_size)
+    return rows
@@ -0,0 +1,134 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+from . import routers
+
+
+CACHE_HEADER = 'X-Cache'
+VERSION_PREFIX = 'catalog:version:'
+GLOBAL_SCOPE = 'catalog'
+RESPONSE_PREFIX = 'catalog:response:'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+# ---------- VERSIONS ----------
+# Версия — случайный токен, а не счётчик: если ключ версии вытеснят из кэша,
+# новая версия не совпадёт со старой и устаревший ответ не всплывёт.
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            token = uuid.uuid4().hex
+            cache.add(key, token, timeout=None)
+            # DummyCache ничего не хранит — тогда версия одноразовая
+            versions[key] = cache.get(key) or token
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(scopes):
+    cache = get_cache()
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            token = uuid.uuid4().hex
+            await cache.aadd(key, token, timeout=None)
+            versions[key] = await cache.aget(key) or token
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    def _bump():
+        # Время сброса в токене: по нему ответ в окне отставания реплик читает основную БД
+        token = f'{uuid.uuid4().hex}:{time.time():.3f}'
+        get_cache().set_many({VERSION_PREFIX + scope: token for scope in scopes}, timeout=None)
+
+    # Сбрасываем сразу и ещё раз после коммита, чтобы параллельный запрос
+    # не закэшировал данные до фиксации транзакции
+    _bump()
+    if not transaction.get_autocommit():
+        transaction.on_commit(_bump)
+
+
+def bumped_within(versions, seconds):
+    now = time.time()
+    for version in versions:
+        _, _, bumped_at = version.partition(':')
+        if bumped_at and now - float(bumped_at) < seconds:
+            return True
+    return False
+
+
+def bump_all():
+    bump(GLOBAL_SCOPE)
+
+
+def model_scope(model, pk=None):
+    name = model._meta.model_name
+    return name if pk is None else f'{name}:{pk}'
+
+
+# ---------- RESPONSE CACHE ----------
+class CachedResponseMixin:
+    """
+    Кэширует отрендеренный ответ GET в кэше Django.
+    cache_scopes — версии, от которых зависит ответ, например 'country:{pk}'.
+    """
+    cache_scopes = []
+    cache_timeout = None
+
+    def get_cache_scopes(self):
+        scopes = [GLOBAL_SCOPE, *(scope.format(**self.kwargs) for scope in self.cache_scopes)]
+        # ?expand= вкладывает связанные объекты (SparseFieldsViewMixin) — их версии тоже
+        expanded = getattr(self, 'expanded_cache_scopes', None)
+        return scopes + expanded() if expanded is not None else scopes
+
+    def get_cache_key(self, request, versions=None):
+        scopes = self.get_cache_scopes()
+        versions = get_versions(scopes) if versions is None else versions
+        parts = [request.get_full_path(), request.accepted_media_type, *scopes, *versions]
+        return RESPONSE_PREFIX + hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def get_cache_timeout(self):
+        return self.cache_timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+    def read_primary_after_bump(self, versions):
+        """
+        Реплика может ещё не видеть правку, из-за которой сменилась версия, а её ответ
+        лёг бы в кэш под новой версией на CATALOG_CACHE_TIMEOUT. Поэтому REPLICA_STICKY_SECONDS
+        после сброса любой версии ответа данные читаются с основной БД.
+        """
+        if settings.DATABASE_REPLICAS and bumped_within(versions, settings.REPLICA_STICKY_SECONDS):
+            routers.pin_primary()
+
+    def get(self, request, *args, **kwargs):
+        cache = get_cache()
+        versions = get_versions(self.get_cache_scopes())
+        key = self.get_cache_key(request, versions)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response[CACHE_HEADER] = 'HIT'
+            return response
+
+        self.read_primary_after_bump(versions)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.get_cache_timeout()
+            response.add_post_render_callback(
+                lambda rendered: cache.set(key, (rendered.content, rendered['Content-Type']), timeout)
+            )
+        response[CACHE_HEADER] = 'MISS'
+        return response
@@ -0,0 +1,103 @@
+"""
+Профили подключения к БД по переменным окружения (DB_PROFILE), см. backend/settings.py.
+Модуль импортируется из настроек, поэтому не трогает модели и django.conf.settings.
+"""
+from importlib.util import find_spec
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgres')
+
+
+def env_int(env, name, default):
+    return int(env.get(name, default))
+
+
+def sqlite_pragmas(env):
+    """PRAGMA на каждое новое соединение: WAL, synchronous=NORMAL, mmap и кэш страниц."""
+    return [
+        'PRAGMA journal_mode=WAL',
+        # В WAL NORMAL не теряет целостность, только последние коммиты при сбое питания
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={env_int(env, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+        # Отрицательное значение — размер в КиБ, а не в страницах
+        f"PRAGMA cache_size=-{env_int(env, 'SQLITE_CACHE_SIZE_KB', 64 * 1024)}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def database_settings(env, base_dir):
+    """
+    DATABASES['default'] для профиля:
+      sqlite      — файл без настроек, как раньше (режим по умолчанию для разработки);
+      sqlite-wal  — WAL и прочие PRAGMA, ожидание блокировки вместо ошибки,
+                    транзакции BEGIN IMMEDIATE и постоянные соединения;
+      postgres    — постоянные соединения (DB_CONN_MAX_AGE) или пул psycopg (DB_POOL=1).
+    """
+    profile = env.get('DB_PROFILE', 'sqlite')
+    if profile not in PROFILES:
+        raise ValueError(f"DB_PROFILE: допустимые значения {', '.join(PROFILES)}, получено {profile!r}")
+
+    if profile == 'postgres':
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env.get('POSTGRES_DB', 'voyage'),
+            'USER': env.get('POSTGRES_USER', 'voyage'),
+            'PASSWORD': env.get('POSTGRES_PASSWORD', ''),
+            'HOST': env.get('POSTGRES_HOST', 'localhost'),
+            'PORT': env.get('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if env.get('DB_POOL') == '1':
+            # Без пакета Django упал бы только на первом подключении, с невнятной ошибкой
+            if find_spec('psycopg_pool') is None:
+                raise ValueError("DB_POOL=1 требует пакет psycopg_pool: pip install 'psycopg[pool]'")
+            # Пул psycopg 3 (psycopg[pool]); с пулом CONN_MAX_AGE должен быть 0
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS']['pool'] = {
+                'min_size': env_int(env, 'DB_POOL_MIN_SIZE', 2),
+                'max_size': env_int(env, 'DB_POOL_MAX_SIZE', 10),
+                'timeout': env_int(env, 'DB_POOL_TIMEOUT', 10),
+            }
+        else:
+            database['CONN_MAX_AGE'] = env_int(env, 'DB_CONN_MAX_AGE', 60)
+        return database
+
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('SQLITE_PATH', base_dir / 'db.sqlite3'),
+    }
+    if profile == 'sqlite-wal':
+        database['CONN_MAX_AGE'] = env_int(env, 'DB_CONN_MAX_AGE', 60)
+        database['OPTIONS'] = {
+            # Секунды ожидания занятой блокировки записи (busy timeout)
+            'timeout': env_int(env, 'SQLITE_BUSY_TIMEOUT', 20),
+            # Блокировка записи берётся в начале транзакции: без IMMEDIATE два
+            # читателя, повышающие блокировку до записи, сразу получают "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(sqlite_pragmas(env)),
+        }
+    return database
+
+
+def replica_settings(env, base_dir):
+    """
+    Реплики только для чтения (users/routers.py): SQLITE_REPLICA_PATHS или
+    POSTGRES_REPLICA_HOSTS через запятую, остальные параметры — как у основной БД.
+    Возвращает {'replica1': {...}, ...}; в тестах реплики смотрят в тестовую основную БД.
+    """
+    primary = database_settings(env, base_dir)
+    if primary['ENGINE'].endswith('sqlite3'):
+        targets = [{'NAME': path} for path in split_list(env.get('SQLITE_REPLICA_PATHS'))]
+    else:
+        targets = []
+        for host in split_list(env.get('POSTGRES_REPLICA_HOSTS')):
+            host, _, port = host.partition(':')
+            targets.append({'HOST': host, 'PORT': port or primary['PORT']})
+    return {
+        f'replica{number}': {**primary, **target, 'TEST': {'MIRROR': 'default'}}
+        for number, target in enumerate(targets, start=1)
+    }
+
+
+def split_list(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
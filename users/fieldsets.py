@@ -0,0 +1,157 @@
+import sys
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import BaseSerializer
+
+from .cache import model_scope
+
+
+def parse_paths(value):
+    """'id,cities.name,cities.price' -> {'id': {}, 'cities': {'name': {}, 'price': {}}}"""
+    tree = {}
+    for path in (part.strip() for part in (value or '').split(',')):
+        node = tree
+        for name in filter(None, path.split('.')):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def resolve_serializer(serializer_class, module):
+    # Строка — имя класса из модуля сериализатора, чтобы ссылаться на объявленные ниже
+    if isinstance(serializer_class, str):
+        return getattr(module, serializer_class)
+    return serializer_class
+
+
+# ---------- SERIALIZER ----------
+class SparseFieldsMixin:
+    """
+    fields — только перечисленные поля ({} у поля — все его поля по умолчанию),
+    expand — вложенные объекты из Meta.expandable = {'имя': (сериализатор, many)}
+    или уточнение уже вложенных. Без обоих параметров сериализатор не меняется.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = expand or {}
+        if not fields and not expand:
+            return
+
+        expandable = getattr(self.Meta, 'expandable', {})
+        nested = {name for name, field in self.fields.items() if isinstance(field, BaseSerializer)}
+        unknown = set(expand) - set(expandable) - nested
+        if unknown:
+            allowed = sorted(set(expandable) | nested) or ['—']
+            raise ValidationError({'expand': f"Неизвестные связи: {', '.join(sorted(unknown))}. Допустимые: {', '.join(allowed)}"})
+        module = sys.modules[type(self).__module__]
+        for name in set(expand) - nested:
+            serializer_class, many = expandable[name]
+            self.fields[name] = resolve_serializer(serializer_class, module)(many=many, read_only=True)
+
+        if fields:
+            unknown = set(fields) - set(self.fields)
+            if unknown:
+                raise ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}. Допустимые: {', '.join(self.fields)}"})
+            for name in [name for name in self.fields if name not in fields and name not in expand]:
+                self.fields.pop(name)
+
+        for name, field in list(self.fields.items()):
+            child = getattr(field, 'child', field)
+            sub_fields = (fields or {}).get(name) or None
+            sub_expand = expand.get(name) or None
+            if isinstance(child, SparseFieldsMixin) and (sub_fields or sub_expand):
+                self.fields[name] = type(child)(
+                    many=child is not field, read_only=True, fields=sub_fields, expand=sub_expand,
+                )
+
+
+# ---------- QUERYSET ----------
+def optimize_queryset(queryset, serializer, extra=()):
+    """
+    only() по колонкам, которые прочитает сериализатор, и prefetch только
+    вложенных в ответ связей. Meta.method_columns = {'поле': ('связь', [колонки])}
+    описывает, что читают SerializerMethodField, кроме одноимённой колонки.
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    opts = queryset.model._meta
+    columns = {opts.pk.name, *extra}
+    relations = {}  # связь -> [вложенный сериализатор или None, доп. колонки]
+
+    for name, field in serializer.fields.items():
+        if isinstance(field, BaseSerializer):
+            relations.setdefault(field.source, [None, []])[0] = getattr(field, 'child', field)
+            continue
+        if name in getattr(serializer.Meta, 'method_columns', {}):
+            relation, related_columns = serializer.Meta.method_columns[name]
+            relations.setdefault(relation, [None, []])[1].extend(related_columns)
+            continue
+        source = name if field.source == '*' else field.source.split('.')[0]
+        try:
+            model_field = opts.get_field(source)
+        except FieldDoesNotExist:
+            continue
+        if model_field.concrete:
+            columns.add(source)
+
+    prefetches = []
+    for relation, (nested, related_columns) in relations.items():
+        model_field = opts.get_field(relation)
+        related_model = model_field.related_model
+        related = related_model.objects.order_by('pk')
+        if model_field.many_to_one:
+            columns.add(relation)
+        else:
+            related_columns = [*related_columns, model_field.field.name]
+        if nested is not None:
+            related = optimize_queryset(related, nested, extra=related_columns)
+        else:
+            related = related.only(related_model._meta.pk.name, *related_columns)
+        prefetches.append(Prefetch(relation, queryset=related))
+
+    return queryset.prefetch_related(None).only(*columns).prefetch_related(*prefetches)
+
+
+def related_scopes(model, expand):
+    """Версии кэша моделей, которые дерево expand добавляет к объектам model."""
+    for name, nested in expand.items():
+        try:
+            related_model = model._meta.get_field(name).related_model
+        except FieldDoesNotExist:
+            continue
+        if related_model is not None:
+            yield model_scope(related_model)
+            yield from related_scopes(related_model, nested)
+
+
+# ---------- VIEW ----------
+class SparseFieldsViewMixin:
+    """?fields= и ?expand= для вьюх чтения; сериализатор должен поддерживать SparseFieldsMixin."""
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_paths(self, param):
+        # Повторы параметра (?expand=a&expand=b) объединяются
+        return parse_paths(','.join(self.request.query_params.getlist(param)))
+
+    def is_sparse(self):
+        return bool(self.get_paths(self.fields_query_param) or self.get_paths(self.expand_query_param))
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_paths(self.fields_query_param) or None)
+        kwargs.setdefault('expand', self.get_paths(self.expand_query_param) or None)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.is_sparse():
+            return queryset
+        # Колонки сортировки нужны пагинации для курсора
+        ordering = [field for field in getattr(self, 'ordering_fields', {}).values() if field != 'pk']
+        return optimize_queryset(queryset, self.get_serializer(), extra=ordering)
+
+    def expanded_cache_scopes(self):
+        """Ответ с ?expand= зависит и от связанных моделей (см. CachedResponseMixin.get_cache_scopes)."""
+        model = self.get_serializer_class().Meta.model
+        return sorted(set(related_scopes(model, self.get_paths(self.expand_query_param))))
@@ -0,0 +1,38 @@
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+# Границы BIGINT: большие числа SQLite и PostgreSQL не принимают (OverflowError вместо 400)
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+
+def bounded_int(value):
+    """int() в пределах 64-битного целого; иначе ValueError, как у int()."""
+    number = int(value)
+    if not INT_MIN <= number <= INT_MAX:
+        raise ValueError(f"{value!r} вне диапазона 64-битного целого")
+    return number
+
+
+class CatalogFilterBackend(BaseFilterBackend):
+    """
+    Фильтры из query-параметров по словарю вьюхи filter_params:
+    {'min_price': ('price__gte', bounded_int), ...} — параметр, lookup и функция разбора.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        filters = {}
+        for param, (lookup, parser) in getattr(view, 'filter_params', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                filters[lookup] = parser(value)
+            except (ValueError, InvalidOperation):
+                raise ValidationError({param: f"Некорректное значение: {value}"})
+            # Decimal('NaN') и Decimal('Infinity') разбираются, но DecimalField их не принимает
+            if isinstance(filters[lookup], Decimal) and not filters[lookup].is_finite():
+                raise ValidationError({param: f"Некорректное значение: {value}"})
+        return queryset.filter(**filters)
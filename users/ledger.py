@@ -0,0 +1,64 @@
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from .authentication import forget_auth_user
+from .models import User, BalanceEntry, BalanceSnapshot
+
+
+MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+def _latest_snapshot(field):
+    return models.Subquery(
+        BalanceSnapshot.objects.filter(user=models.OuterRef('pk')).order_by('-last_entry_id').values(field)[:1]
+    )
+
+
+def _ledger_tail(aggregate):
+    # Записи журнала после последнего снимка
+    entries = BalanceEntry.objects.filter(
+        user=models.OuterRef('pk'), id__gt=Coalesce(models.OuterRef('snapshot_entry_id'), 0),
+    )
+    return models.Subquery(entries.values('user').annotate(value=aggregate).values('value')[:1])
+
+
+def users_with_ledger(first_pk, last_pk):
+    """Пользователи диапазона pk с ожидаемым по журналу балансом одним запросом."""
+    return (
+        User.objects.filter(pk__gte=first_pk, pk__lte=last_pk)
+        .annotate(snapshot_entry_id=_latest_snapshot('last_entry_id'), snapshot_balance=_latest_snapshot('balance'))
+        .annotate(
+            ledger_balance=models.ExpressionWrapper(
+                Coalesce('snapshot_balance', models.Value(0), output_field=MONEY)
+                + Coalesce(_ledger_tail(models.Sum('amount')), models.Value(0), output_field=MONEY),
+                output_field=MONEY,
+            ),
+            last_entry_id=_ledger_tail(models.Max('id')),
+        )
+        .order_by('pk')
+        .values('pk', 'balance', 'ledger_balance', 'last_entry_id')
+    )
+
+
+def reconcile_range(first_pk, last_pk, fix=False, snapshot=False):
+    """
+    Сверяет User.balance с журналом для диапазона pk.
+    Возвращает (проверено, [(pk, баланс, по журналу), ...]).
+    """
+    checked, mismatches, snapshots = 0, [], []
+    with transaction.atomic():
+        for row in users_with_ledger(first_pk, last_pk).iterator(chunk_size=2000):
+            checked += 1
+            if row['balance'] != row['ledger_balance']:
+                mismatches.append((row['pk'], row['balance'], row['ledger_balance']))
+                if fix:
+                    # Правим на разницу, а не присваиванием, чтобы не потерять параллельные начисления
+                    delta = row['ledger_balance'] - row['balance']
+                    User.objects.filter(pk=row['pk']).update(balance=models.F('balance') + delta)
+                    forget_auth_user(row['pk'])
+            if snapshot and row['last_entry_id']:
+                snapshots.append(BalanceSnapshot(
+                    user_id=row['pk'], last_entry_id=row['last_entry_id'], balance=row['ledger_balance'],
+                ))
+        BalanceSnapshot.objects.bulk_create(snapshots, batch_size=2000)
+    return checked, mismatches
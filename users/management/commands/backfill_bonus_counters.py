@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from users.models import BonusHistory, BonusMonthlyCounter
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает помесячные счётчики бонусов по истории бонусов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = (
+            BonusHistory.objects
+            .annotate(year=ExtractYear('created_at'), month=ExtractMonth('created_at'))
+            .values('referrer_id', 'year', 'month')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+
+        written = 0
+        batch = []
+        with transaction.atomic():
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(BonusMonthlyCounter(
+                    referrer_id=row['referrer_id'], year=row['year'], month=row['month'], count=row['total'],
+                ))
+                if len(batch) >= batch_size:
+                    written += self.flush(batch)
+            written += self.flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено счётчиков: {written}"))
+
+    @staticmethod
+    def flush(batch):
+        BonusMonthlyCounter.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['referrer', 'year', 'month'], update_fields=['count'],
+        )
+        written = len(batch)
+        batch.clear()
+        return written
@@ -0,0 +1,191 @@
+import json
+import logging
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import rollups, search, snapshot
+from users.benchmarks import BENCH_PASSWORD, run_threads, seed_catalog, seed_users, summarize, throwaway_database
+from users.models import Region, Country, City
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный бенчмарк всех маршрутов users/urls.py на синтетических данных (во временной БД): "
+        "p50/p95/p99, пропускная способность и число SQL-запросов по каждому маршруту, JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=100_000)
+        parser.add_argument('--countries', type=int, default=200)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--clients', type=int, default=8, help="Параллельных клиентов (потоков)")
+        parser.add_argument('--requests', type=int, default=20, help="Запросов на клиента для каждого маршрута")
+        parser.add_argument('--auth-requests', type=int, default=2,
+                            help="Запросов на клиента для входа и регистрации (хеширование пароля)")
+        parser.add_argument('--route', action='append', help="Только указанные маршруты (имя из users/urls.py)")
+        parser.add_argument('--cache', action='store_true', help="С кэшем ответов (по умолчанию DummyCache)")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Записать JSON в файл")
+
+    def handle(self, *args, **options):
+        missing = route_names() - set(ROUTES)
+        if missing:
+            raise CommandError(f"Нет сценария для маршрутов: {', '.join(sorted(missing))}")
+        selected = options['route'] or list(ROUTES)
+        unknown = set(selected) - set(ROUTES)
+        if unknown:
+            raise CommandError(f"Неизвестные маршруты: {', '.join(sorted(unknown))}")
+
+        rng = random.Random(options['seed'])
+        overrides = {}
+        if not options['cache']:
+            # Меряем вьюхи, а не попадания в кэш ответов
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        # Ошибки 500 (например, блокировки SQLite при бронировании) попадают в статусы отчёта
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        with throwaway_database(), tempfile.TemporaryDirectory(prefix='bench-snapshot-') as snapshot_dir, \
+                override_settings(CATALOG_SNAPSHOT_DIR=snapshot_dir, **overrides):
+            started = time.perf_counter()
+            dataset = self.seed(rng, options)
+            seeded = time.perf_counter() - started
+            routes = {}
+            for name in selected:
+                count = options['auth_requests'] if name in ('login', 'register') else options['requests']
+                routes[name] = self.run_route(name, dataset, options['clients'], count, options['seed'])
+                self.stderr.write(f"{name}: {routes[name]['p50_ms']} мс p50, {routes[name]['throughput']} запросов/с")
+
+        report = {
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'cache': options['cache'],
+            'clients': options['clients'],
+            'dataset': {key: options[key] for key in ('cities', 'countries', 'users')},
+            'seed_seconds': round(seeded, 1),
+            'routes': routes,
+        }
+        content = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content + '\n')
+        self.stdout.write(content)
+
+    # ---------- DATA ----------
+    def seed(self, rng, options):
+        seed_catalog(rng, options['cities'], options['countries'])
+        users = seed_users(rng, options['users'])
+        with transaction.atomic():
+            rollups.rebuild_all()
+        search.rebuild()
+        # Как при деплое: снимок каталога собирается заранее, не в запросе
+        snapshot.build()
+        return {
+            'users': users,
+            'tokens': {user.pk: str(RefreshToken.for_user(user).access_token) for user in users[:256]},
+            'regions': list(Region.objects.values_list('pk', flat=True)),
+            'countries': list(Country.objects.values_list('pk', flat=True)),
+            'cities': list(City.objects.values_list('pk', flat=True)),
+        }
+
+    # ---------- LOAD ----------
+    @staticmethod
+    def run_route(name, dataset, clients, count, seed):
+        method, needs_auth, make_request = ROUTES[name]
+        latencies, queries, statuses = [], [], Counter()
+        lock = threading.Lock()
+        tokens = list(dataset['tokens'].items())
+
+        def client_loop(index):
+            rng = random.Random(f'{seed}-{name}-{index}')
+            user_id, token = tokens[index % len(tokens)]
+            client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+            headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if needs_auth else {}
+            local = []
+            for number in range(count):
+                path, data = make_request(rng, dataset, f'{index}-{number}')
+                begin = time.perf_counter()
+                with CaptureQueriesContext(connection) as ctx:
+                    if method == 'post':
+                        response = client.post(path, data, content_type='application/json', **headers)
+                    else:
+                        response = client.get(path, data, **headers)
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                local.append((time.perf_counter() - begin, len(ctx.captured_queries), response.status_code))
+            with lock:
+                for spent, query_count, status in local:
+                    latencies.append(spent)
+                    queries.append(query_count)
+                    statuses[status] += 1
+
+        elapsed = run_threads(clients, client_loop)
+        return {
+            **summarize(latencies, elapsed),
+            'status': {str(status): total for status, total in sorted(statuses.items())},
+            'queries_mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+            'queries_max': max(queries, default=0),
+        }
+
+
+def route_names():
+    return {pattern.name for pattern in get_resolver('users.urls').url_patterns if pattern.name}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ---------- ROUTES ----------
+# имя маршрута -> (метод, нужен ли JWT, make(rng, dataset, уникальный суффикс) -> (путь, данные))
+def catalog_ordering(rng):
+    return {'limit': 50, 'ordering': rng.choice(['price', '-price', '-rating', 'name'])}
+
+
+ROUTES = {
+    'register': ('post', False, lambda rng, data, n: ('/api/user/auth/register/', {
+        'email': f'new-{n}@example.com', 'password': BENCH_PASSWORD, 'first_name': 'New', 'last_name': 'User',
+    })),
+    'login': ('post', False, lambda rng, data, n: ('/api/user/auth/login/', {
+        'email': rng.choice(data['users']).email, 'password': BENCH_PASSWORD,
+    })),
+    'me': ('get', True, lambda rng, data, n: ('/api/user/me/', {})),
+    'profile': ('get', True, lambda rng, data, n: ('/api/user/profile/', {})),
+    'bonuses': ('get', True, lambda rng, data, n: ('/api/user/bonuses/', {'limit': 20})),
+    'cards': ('get', False, lambda rng, data, n: ('/api/cards/', {})),
+    'tour-booking': ('post', True, lambda rng, data, n: ('/api/tours/', {
+        'city': rng.choice(data['cities']), 'title': f'bench-{n}',
+    })),
+    'regions-list': ('get', False, lambda rng, data, n: ('/api/regions/', {})),
+    'region-detail': ('get', False, lambda rng, data, n: (f"/api/regions/{rng.choice(data['regions'])}/", {})),
+    'region-countries': ('get', False, lambda rng, data, n: (
+        f"/api/regions/{rng.choice(data['regions'])}/countries/", catalog_ordering(rng),
+    )),
+    'countries-list': ('get', False, lambda rng, data, n: ('/api/countries/', catalog_ordering(rng))),
+    'country-detail': ('get', False, lambda rng, data, n: (f"/api/countries/{rng.choice(data['countries'])}/", {})),
+    'country-cities': ('get', False, lambda rng, data, n: (
+        f"/api/countries/{rng.choice(data['countries'])}/cities/", catalog_ordering(rng),
+    )),
+    'cities-list': ('get', False, lambda rng, data, n: ('/api/cities/', {
+        **catalog_ordering(rng), 'min_price': rng.choice([0, 1000, 4000]),
+    })),
+    'city-detail': ('get', False, lambda rng, data, n: (f"/api/cities/{rng.choice(data['cities'])}/", {})),
+    'catalog-snapshot': ('get', False, lambda rng, data, n: ('/api/catalog/snapshot/', {})),
+    'search': ('get', False, lambda rng, data, n: ('/api/search/', {'q': f'city {rng.randint(1, 999)}', 'limit': 20})),
+}
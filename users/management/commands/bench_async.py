@@ -0,0 +1,196 @@
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.benchmarks import run_threads, summarize, throwaway_database
+from users.models import User, Region, Country, City
+
+BENCH_SETTINGS = '''from backend.settings import *
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+DATABASES['default']['NAME'] = {database!r}
+CACHES = {caches!r}
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает синхронные вьюхи под gunicorn (WSGI) и асинхронные под uvicorn (ASGI): "
+        "запросов в секунду и p99 при параллельных клиентах, во временной БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=20_000)
+        parser.add_argument('--countries', type=int, default=200)
+        parser.add_argument('--clients', type=int, default=32, help="Параллельных клиентов (keep-alive)")
+        parser.add_argument('--requests', type=int, default=200, help="Запросов на клиента")
+        parser.add_argument('--workers', type=int, default=2, help="Процессов сервера")
+        parser.add_argument('--threads', type=int, default=4, help="Потоков на процесс gunicorn (WSGI)")
+        parser.add_argument('--cache', action='store_true', help="С кэшем ответов (по умолчанию DummyCache)")
+        parser.add_argument('--sync-views', action='store_true', help="Под ASGI — синхронные вьюхи DRF (ASYNC_VIEWS = False)")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        servers = {'wsgi': self.wsgi_command(options)}
+        if importlib.util.find_spec('uvicorn') is not None:
+            servers['asgi'] = self.asgi_command(options)
+        else:
+            self.stderr.write("uvicorn не установлен (pip install uvicorn) — замеряется только WSGI")
+        if connection.vendor != 'sqlite':
+            raise CommandError("Бенчмарк рассчитан на SQLite: серверам передаётся путь к временной БД")
+
+        rng = random.Random(options['seed'])
+        caches = settings.CACHES if options['cache'] else {
+            'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }
+        results = {}
+        with throwaway_database(), tempfile.TemporaryDirectory(prefix='bench-async-') as directory:
+            self.build_catalog(rng, options['cities'], options['countries'])
+            token = self.make_user()
+            connection.close()
+            Path(directory, 'bench_settings.py').write_text(
+                BENCH_SETTINGS.format(database=str(connection.settings_dict['NAME']), caches=caches)
+            )
+            paths = self.request_paths(rng, options['requests'] * options['clients'], options['cities'], options['countries'])
+            for name, command in servers.items():
+                env = {'DJANGO_ASYNC_VIEWS': '0' if options['sync_views'] or name == 'wsgi' else '1'}
+                results[name] = self.run_server(command, env, directory, paths, token, options['clients'])
+
+        self.stdout.write(json.dumps({
+            'cities': options['cities'],
+            'clients': options['clients'],
+            'workers': options['workers'],
+            'cache': options['cache'],
+            'asgi_views': 'sync' if options['sync_views'] else 'async',
+            **results,
+        }, indent=2, ensure_ascii=False))
+
+    # ---------- SERVERS ----------
+    @staticmethod
+    def wsgi_command(options):
+        return [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application', '--workers', str(options['workers']),
+                '--threads', str(options['threads']), '--bind', '127.0.0.1:{port}', '--log-level', 'warning']
+
+    @staticmethod
+    def asgi_command(options):
+        return [sys.executable, '-m', 'uvicorn', 'backend.asgi:application', '--workers', str(options['workers']),
+                '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning', '--no-access-log']
+
+    def run_server(self, command, env, directory, paths, token, clients):
+        port = free_port()
+        env = {
+            **os.environ,
+            **env,
+            'DJANGO_SETTINGS_MODULE': 'bench_settings',
+            'PYTHONPATH': os.pathsep.join([directory, str(settings.BASE_DIR)]),
+        }
+        process = subprocess.Popen([part.format(port=port) for part in command], cwd=settings.BASE_DIR, env=env)
+        try:
+            wait_for_port(port, process)
+            # Прогрев: первые запросы импортируют модули и открывают соединения с БД
+            self.run_clients(port, paths[:20], token, clients=4)
+            return self.run_clients(port, paths, token, clients)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    # ---------- CLIENTS ----------
+    @staticmethod
+    def run_clients(port, paths, token, clients):
+        latencies, routes, errors = [], {}, []
+
+        def client_loop(index):
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/json'}
+            for route, path in paths[index::clients]:
+                begin = time.perf_counter()
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                spent = time.perf_counter() - begin
+                if response.status != 200:
+                    errors.append(f'{response.status} {path}')
+                latencies.append(spent)
+                routes.setdefault(route, []).append(spent)
+            conn.close()
+
+        elapsed = run_threads(clients, client_loop)
+        return {
+            **summarize(latencies, elapsed),
+            'errors': len(errors),
+            'routes': {route: summarize(values, elapsed) for route, values in sorted(routes.items())},
+        }
+
+    @staticmethod
+    def request_paths(rng, count, cities, countries):
+        routes = [
+            ('cities-list', lambda: f'/api/cities/?limit=50&ordering={rng.choice(["price", "-rating", "name"])}'),
+            ('city-detail', lambda: f'/api/cities/{rng.randint(1, cities)}/'),
+            ('countries-list', lambda: '/api/countries/?limit=50'),
+            ('country-cities', lambda: f'/api/countries/{rng.randint(1, countries)}/cities/?limit=50'),
+            ('regions-list', lambda: '/api/regions/'),
+            ('profile', lambda: '/api/user/profile/'),
+        ]
+        # Одинаковая последовательность запросов для обоих серверов
+        return [(name, make()) for name, make in (rng.choice(routes) for _ in range(count))]
+
+    # ---------- DATA ----------
+    @staticmethod
+    def make_user():
+        user = User.objects.create_user('bench@example.com', 'pass')
+        for i in range(5):
+            User.objects.create_user(f'friend-{i}@example.com', 'pass', referrer=user)
+        return str(RefreshToken.for_user(user).access_token)
+
+    @staticmethod
+    def build_catalog(rng, cities, countries):
+        regions = Region.objects.bulk_create([
+            Region(name=f"region-{r}", display_name=f"Region {r}", description="", image="https://example.com/r.jpg",
+                   best_time="summer")
+            for r in range(max(1, countries // 20))
+        ])
+        country_rows = Country.objects.bulk_create([
+            Country(region=regions[c % len(regions)], name=f"country-{c}", description="",
+                    image="https://example.com/c.jpg", capital="capital", population="1", language="uz",
+                    currency="UZS", best_time="spring")
+            for c in range(countries)
+        ])
+        City.objects.bulk_create([
+            City(country=country_rows[i % len(country_rows)], name=f"city-{i}", description="",
+                 image="https://example.com/ct.jpg", price=rng.randint(100, 5000), best_time="autumn",
+                 rating=rng.randint(10, 50) / 10, highlights=["a", "b"], attractions=["c"])
+            for i in range(cities)
+        ], batch_size=2000)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Сервер не поднялся на порту {port} за {timeout} с")
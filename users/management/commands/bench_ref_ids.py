@@ -0,0 +1,56 @@
+import json
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError
+
+from users.benchmarks import run_threads, throwaway_database
+from users.models import User
+from users.refids import allocator
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк регистраций в секунду с выдачей ref_id в нескольких потоках (во временной БД)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--users', type=int, default=200, help="Регистраций на поток")
+        parser.add_argument('--block-size', type=int, default=allocator.block_size)
+
+    def handle(self, *args, **options):
+        threads, per_thread = options['threads'], options['users']
+        allocator.block_size = options['block_size']
+        allocator.discard_block()
+        stats = {'collisions': 0, 'lock_retries': 0}
+        lock = threading.Lock()
+
+        def register(index):
+            for number in range(per_thread):
+                while True:
+                    try:
+                        # Без пароля: меряем выдачу ref_id и вставку, а не хеширование
+                        User.objects.create_user(f"bench-{index}-{number}@example.com")
+                        break
+                    except IntegrityError:
+                        with lock:
+                            stats['collisions'] += 1
+                        break
+                    except OperationalError:
+                        with lock:
+                            stats['lock_retries'] += 1
+
+        with throwaway_database():
+            elapsed = run_threads(threads, register)
+            created = User.objects.count()
+            distinct = User.objects.values('ref_id').distinct().count()
+        allocator.discard_block()
+
+        self.stdout.write(json.dumps({
+            'threads': threads,
+            'registrations': created,
+            'seconds': round(elapsed, 3),
+            'registrations_per_second': round(created / elapsed, 1) if elapsed else 0.0,
+            'duplicate_ref_ids': created - distinct,
+            'block_size': allocator.block_size,
+            **stats,
+        }, indent=2))
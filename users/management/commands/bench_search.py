@@ -0,0 +1,88 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from users import search
+from users.benchmarks import run_threads, summarize, throwaway_database
+from users.models import Region, Country, City
+
+WORDS = [
+    "горы", "море", "пляж", "крепость", "мечеть", "рынок", "музей", "озеро", "водопад", "пустыня",
+    "каньон", "дворец", "сад", "собор", "базар", "река", "долина", "вулкан", "остров", "храм",
+]
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк задержки /api/search/ на синтетическом каталоге (во временной БД)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=100_000)
+        parser.add_argument('--countries', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=200, help="Запросов на поток")
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Кэш ответов отключён: меряем сам поиск, а не попадания в кэш
+        dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with throwaway_database(), override_settings(CACHES=dummy_cache):
+            started = time.perf_counter()
+            self.build_catalog(rng, options['cities'], options['countries'])
+            counts = search.rebuild()
+            indexed = time.perf_counter() - started
+
+            queries = [self.random_query(rng) for _ in range(options['queries'])]
+            latencies = []
+
+            def client_loop(index):
+                client = Client(SERVER_NAME='localhost')
+                local = []
+                for query in queries:
+                    begin = time.perf_counter()
+                    client.get('/api/search/', {'q': query, 'limit': 20})
+                    local.append(time.perf_counter() - begin)
+                latencies.extend(local)
+
+            elapsed = run_threads(options['threads'], client_loop)
+
+        self.stdout.write(json.dumps({
+            'documents': counts,
+            'build_and_index_seconds': round(indexed, 1),
+            'threads': options['threads'],
+            **summarize(latencies, elapsed),
+        }, indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def random_query(rng):
+        words = rng.sample(WORDS, rng.choice([1, 1, 2]))
+        # Часть запросов — префиксы, как при наборе в строке поиска
+        return ' '.join(word[:rng.randint(3, len(word))] for word in words)
+
+    @staticmethod
+    def build_catalog(rng, cities, countries):
+        # bulk_create не вызывает сигналы: индекс строится одним rebuild()
+        def text():
+            return ' '.join(rng.choices(WORDS, k=12))
+
+        regions = Region.objects.bulk_create([
+            Region(name=f"region-{r}", display_name=f"Region {r}", description=text(),
+                   image="https://example.com/r.jpg", best_time="summer", highlights=rng.sample(WORDS, 3))
+            for r in range(max(1, countries // 20))
+        ])
+        country_rows = Country.objects.bulk_create([
+            Country(region=regions[c % len(regions)], name=f"country-{c}", description=text(),
+                    image="https://example.com/c.jpg", capital="capital", population="1", language="uz",
+                    currency="UZS", best_time="spring", highlights=rng.sample(WORDS, 3))
+            for c in range(countries)
+        ])
+        City.objects.bulk_create((
+            City(country=country_rows[i % len(country_rows)], name=f"city-{i}", description=text(),
+                 image="https://example.com/ct.jpg", price=rng.randint(100, 5000), best_time="autumn",
+                 highlights=rng.sample(WORDS, 3), attractions=rng.sample(WORDS, 4),
+                 rating=rng.randint(10, 50) / 10)
+            for i in range(cities)
+        ), batch_size=2000)
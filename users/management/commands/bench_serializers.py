@@ -0,0 +1,83 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from users.benchmarks import throwaway_database
+from users.models import Region, Country, City
+from users.renderers import FastJSONRenderer
+from users.rows import row_serializer_for
+from users.serializers import CitySerializer, CountryListSerializer, CatalogSnapshotSerializer
+
+
+def best_of(rounds, render):
+    timings, content = [], None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        content = render()
+        timings.append(time.perf_counter() - started)
+    return min(timings), content
+
+
+class Command(BaseCommand):
+    help = "Сравнивает сериализаторы DRF и быстрый путь users/rows.py на синтетическом каталоге (во временной БД)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=20_000)
+        parser.add_argument('--countries', type=int, default=200)
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.build_catalog(options['cities'], options['countries'])
+            cases = {
+                'cities': (CitySerializer, City.objects.order_by('pk'), City.objects.order_by('pk')),
+                'countries': (CountryListSerializer, Country.objects.order_by('pk'), Country.objects.order_by('pk')),
+                'snapshot': (
+                    CatalogSnapshotSerializer,
+                    Region.objects.order_by('pk').prefetch_related(
+                        Prefetch('countries', queryset=Country.objects.order_by('pk')),
+                        Prefetch('countries__cities', queryset=City.objects.order_by('pk')),
+                    ),
+                    Region.objects.order_by('pk'),
+                ),
+            }
+            report = {name: self.compare(options['rounds'], *case) for name, case in cases.items()}
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def compare(self, rounds, serializer_class, queryset, fast_queryset):
+        rows = row_serializer_for(serializer_class)
+        drf_seconds, expected = best_of(rounds, lambda: JSONRenderer().render(
+            serializer_class(queryset.all(), many=True).data
+        ))
+        fast_seconds, actual = best_of(rounds, lambda: FastJSONRenderer().render(
+            rows.serialize(rows.values(fast_queryset.all()))
+        ))
+        return {
+            'bytes': len(expected),
+            'identical': expected == actual,
+            'drf_ms': round(drf_seconds * 1000, 1),
+            'fast_ms': round(fast_seconds * 1000, 1),
+            'speedup': round(drf_seconds / fast_seconds, 1) if fast_seconds else None,
+        }
+
+    @staticmethod
+    def build_catalog(cities, countries):
+        region = Region.objects.create(
+            name="bench", display_name="Bench", description="Регион", image="https://example.com/r.jpg", best_time="-",
+        )
+        country_rows = Country.objects.bulk_create([
+            Country(region=region, name=f"country-{c}", description="Страна", image="https://example.com/c.jpg",
+                    capital="capital", population="1", language="uz", currency="UZS", best_time="spring",
+                    highlights=["горы", "море"], min_price=100, max_rating="4.5")
+            for c in range(countries)
+        ])
+        City.objects.bulk_create((
+            City(country=country_rows[i % len(country_rows)], name=f"city-{i}", description="Город " * 20,
+                 image="https://example.com/ct.jpg", price=100 + i % 900, best_time="autumn",
+                 highlights=["крепость", "базар"], attractions=[{"name": "музей", "price": 10}],
+                 rating=f"{i % 50 / 10:.1f}")
+            for i in range(cities)
+        ), batch_size=2000)
@@ -0,0 +1,120 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.db.backends.signals import connection_created
+
+from users import services
+from users.benchmarks import run_threads, summarize, throwaway_database
+from users.dbprofile import database_settings
+from users.models import User, MembershipCard, UserMembership, Region, Country, City, Tour, BonusHistory
+
+# Профили, которые сравниваются на текущем движке БД (env для database_settings)
+PROFILES = {
+    'sqlite': {
+        'sqlite': {'DB_PROFILE': 'sqlite'},
+        'sqlite-wal': {'DB_PROFILE': 'sqlite-wal'},
+    },
+    'postgresql': {
+        'postgres': {'DB_PROFILE': 'postgres', 'DB_CONN_MAX_AGE': '0'},
+        'postgres-persistent': {'DB_PROFILE': 'postgres'},
+        'postgres-pool': {'DB_PROFILE': 'postgres', 'DB_POOL': '1'},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк конкурентного бронирования (создание Tour) под профилями БД из DB_PROFILE, "
+        "во временной БД: задержка, пропускная способность, ошибки блокировок, новые соединения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bookings', type=int, default=50, help="Бронирований на поток")
+        parser.add_argument('--profile', action='append', help="Только указанные профили")
+
+    def handle(self, *args, **options):
+        profiles = PROFILES.get(connection.vendor, {})
+        if options['profile']:
+            profiles = {name: env for name, env in profiles.items() if name in options['profile']}
+
+        results = {}
+        for name, env in profiles.items():
+            results[name] = self.run_profile(env, options['threads'], options['bookings'])
+        self.stdout.write(json.dumps({
+            'vendor': connection.vendor,
+            'threads': options['threads'],
+            'bookings_per_thread': options['bookings'],
+            **results,
+        }, indent=2, ensure_ascii=False))
+
+    def run_profile(self, env, threads, bookings):
+        profile = database_settings({**os.environ, **env}, settings.BASE_DIR)
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict.get(key) for key in ('OPTIONS', 'CONN_MAX_AGE')}
+        # Словарь настроек общий для соединений всех потоков
+        settings_dict.update(OPTIONS=profile.get('OPTIONS', {}), CONN_MAX_AGE=profile.get('CONN_MAX_AGE', 0))
+        connection.close()
+        try:
+            with throwaway_database():
+                return self.contend(threads, bookings)
+        finally:
+            settings_dict.update(saved)
+            connection.close()
+
+    def contend(self, threads, bookings):
+        city = self.make_city()
+        # Общий реферер с картой: каждая бронь ещё и начисляет ему бонус — горячие строки баланса и счётчика
+        referrer = User.objects.create_user('referrer@example.com', 'pass')
+        card = MembershipCard.objects.create(name='Gold', code='gold', duration_months=12, price=100, description='',
+                                             bonus_amount=5, monthly_limit=None)
+        UserMembership.objects.create(user=referrer, card=card)
+        users = [User.objects.create_user(f'traveler-{i}@example.com', 'pass', referrer=referrer) for i in range(threads)]
+        connection.close()
+
+        latencies, errors, connects = [], [], []
+
+        def count_connect(sender, **kwargs):
+            connects.append(1)
+
+        def client_loop(index):
+            for i in range(bookings):
+                begin = time.perf_counter()
+                try:
+                    services.book_tour(users[index], city, f'tour-{index}-{i}')
+                except OperationalError as exc:
+                    errors.append(str(exc))
+                latencies.append(time.perf_counter() - begin)
+                # Как конец запроса: при CONN_MAX_AGE = 0 соединение закрывается
+                close_old_connections()
+
+        connection_created.connect(count_connect)
+        try:
+            elapsed = run_threads(threads, client_loop)
+        finally:
+            connection_created.disconnect(count_connect)
+
+        return {
+            **summarize(latencies, elapsed),
+            'tours_created': Tour.objects.count(),
+            'bonuses_created': BonusHistory.objects.count(),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:3],
+            'connections_opened': len(connects),
+            'options': connection.settings_dict.get('OPTIONS'),
+            'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+        }
+
+    @staticmethod
+    def make_city():
+        region = Region.objects.create(name='region', display_name='Region', description='',
+                                       image='https://example.com/r.jpg', best_time='summer')
+        country = Country.objects.create(region=region, name='country', description='', image='https://example.com/c.jpg',
+                                         capital='capital', population='1', language='uz', currency='UZS',
+                                         best_time='spring')
+        return City.objects.create(country=country, name='city', description='', image='https://example.com/ct.jpg',
+                                   price=1000, best_time='autumn', rating=4)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает снимок каталога для /api/catalog/snapshot/ (JSON, gzip, brotli). "
+        "Запускается при деплое и после правок каталога: --watch или cron с --if-stale"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true', help="Только если снимка нет или каталог менялся")
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help="Не завершаться: проверять версию каталога каждые SECONDS секунд")
+
+    def handle(self, *args, **options):
+        if options['watch'] is not None and options['watch'] <= 0:
+            raise CommandError("--watch должен быть положительным")
+        if options['watch'] is None:
+            if not options['if_stale'] or snapshot.is_stale(snapshot.read_manifest()):
+                self.build()
+            return
+        while True:
+            if snapshot.is_stale(snapshot.read_manifest()):
+                self.build()
+            time.sleep(options['watch'])
+
+    def build(self):
+        manifest = snapshot.build()
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {manifest['hash']} ({manifest['size']} байт) в {snapshot.snapshot_dir()}"
+        ))
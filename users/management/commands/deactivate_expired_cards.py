@@ -1,18 +1,75 @@
-from django.core.management.base import BaseCommand
-from django.db import models
-from django.utils.timezone import now
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils.timezone import localdate
 from users.models import UserMembership
+from users.services import forget_current_membership
+
+
+def expired_memberships(today):
+    """Активные карты с истёкшим сроком: диапазон по частичному индексу (end_date, id)."""
+    return UserMembership.objects.filter(is_active=True, end_date__lt=today)
+
+
+def exhausted_memberships(today):
+    """Активные непросроченные карты, у которых израсходованы все скидочные туры."""
+    return (
+        UserMembership.objects.filter(is_active=True)
+        .filter(models.Q(end_date__gte=today) | models.Q(end_date__isnull=True))
+        .annotate(total_tours=models.F('card__discount_tours') + models.F('card__extra_discount_tours'))
+        .filter(total_tours__gt=0, used_tours__gte=models.F('total_tours'))
+    )
+
+
+def keyset_batches(queryset, field, batch_size):
+    """Пачки (значение field, pk, user_id) по возрастанию (field, pk); в памяти одна пачка."""
+    queryset = queryset.order_by(*dict.fromkeys([field, 'pk']))
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            value, pk = last
+            after = models.Q(pk__gt=pk)
+            if field != 'pk':
+                after = models.Q(**{f'{field}__gt': value}) | (models.Q(**{field: value}) & after)
+            page = page.filter(after)
+        rows = list(page.values_list(field, 'pk', 'user_id')[:batch_size])
+        if not rows:
+            return
+        last = rows[-1][:2]
+        yield rows
 
 
 class Command(BaseCommand):
     help = "Деактивирует истёкшие или полностью использованные карты пользователей"
 
-    def handle(self, *args, **kwargs):
-        expired_cards = UserMembership.objects.filter(is_active=True).filter(
-            models.Q(end_date__lt=now().date()) | models.Q(used_tours__gte=models.F("card__max_tours"))
-        )
-        count = expired_cards.count()
-        for card in expired_cards:
-            card.is_active = False
-            card.save()
-        self.stdout.write(self.style.SUCCESS(f"Деактивировано {count} карт"))
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Карт в одном UPDATE")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, ничего не меняя")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        if batch_size < 1:
+            raise CommandError("--batch-size должен быть положительным")
+
+        today = localdate()
+        started = time.monotonic()
+        total = 0
+        # Два прохода вместо одного OR: срок — по индексу end_date, исчерпанные туры — обход по pk
+        passes = [keyset_batches(expired_memberships(today), 'end_date', batch_size),
+                  keyset_batches(exhausted_memberships(today), 'pk', batch_size)]
+        for batches in passes:
+            for rows in batches:
+                if dry_run:
+                    total += len(rows)
+                else:
+                    with transaction.atomic():
+                        ids = [pk for _, pk, _ in rows]
+                        total += UserMembership.objects.filter(pk__in=ids, is_active=True).update(is_active=False)
+                    forget_current_membership(*{user_id for _, _, user_id in rows})
+                self.stdout.write(f"Обработано {total} карт, {time.monotonic() - started:.1f} с")
+
+        verb = "Будет деактивировано" if dry_run else "Деактивировано"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} карт за {time.monotonic() - started:.1f} с"))
@@ -0,0 +1,207 @@
+import contextlib
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from users.models import User, MembershipCard, UserMembership
+from users.refids import allocator, is_valid_ref_id
+
+
+def _init_worker():
+    django.setup()
+
+
+def hash_passwords(passwords):
+    return [make_password(password or None) for password in passwords]
+
+
+def read_records(path, fmt):
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует пользователей и их карты из CSV/JSONL пачками. "
+        "Поля: email, password, first_name, last_name, ref_id, ref_code, card, end_date"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="По умолчанию — по расширению файла")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Процессов для хеширования паролей")
+        parser.add_argument('--checkpoint', help="Файл прогресса, по умолчанию <path>.checkpoint")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1 or options['workers'] < 1:
+            raise CommandError("--batch-size и --workers должны быть положительными")
+        if not os.path.exists(path):
+            raise CommandError(f"Файл не найден: {path}")
+
+        self.checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        self.progress = self.load_checkpoint()
+        self.cards = {card.code: card for card in MembershipCard.objects.all()}
+        self.ref_map = {}
+        self.stats = {'users': 0, 'memberships': 0, 'skipped': 0}
+        started = time.monotonic()
+
+        records = islice(read_records(path, fmt), self.progress['records'], None)
+        if self.progress['records']:
+            self.stdout.write(f"Продолжаем с записи {self.progress['records']}")
+
+        # Хеш следующей пачки считается в пуле, пока текущая пишется в БД
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            pending = None
+            for batch in batched(records, self.batch_size):
+                future = pool.submit(hash_passwords, [record.get('password') for record in batch])
+                if pending:
+                    self.write_batch(*pending)
+                pending = (batch, future)
+            if pending:
+                self.write_batch(*pending)
+
+        self.resolve_pending_referrals()
+        # Пустой файл не даёт ни одной пачки — и файла прогресса
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано пользователей: {self.stats['users']}, карт: {self.stats['memberships']}, "
+            f"пропущено: {self.stats['skipped']} за {elapsed:.1f} с"
+        ))
+
+    # ---------- CHECKPOINT ----------
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as source:
+                return json.load(source)
+        return {'records': 0, 'pending_referrals': []}
+
+    def save_checkpoint(self):
+        temporary = f"{self.checkpoint_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump(self.progress, target)
+        os.replace(temporary, self.checkpoint_path)
+
+    # ---------- BATCH ----------
+    def write_batch(self, batch, hashed_future):
+        passwords = hashed_future.result()
+        with transaction.atomic():
+            emails = [User.objects.normalize_email(record.get('email') or '') for record in batch]
+            # Уже загруженные при прошлом запуске строки пропускаются
+            existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+            self.load_referrers({record.get('ref_code') for record in batch} - {None, ''})
+            # ref_id из файла: один занятый уронил бы IntegrityError всю пачку
+            file_ref_ids = {record.get('ref_id') for record in batch} - {None, ''}
+            taken_ref_ids = set(User.objects.filter(ref_id__in=file_ref_ids).values_list('ref_id', flat=True))
+
+            users, cards = [], []
+            for record, email, password in zip(batch, emails, passwords):
+                if not email or email in existing:
+                    self.stats['skipped'] += 1
+                    continue
+                ref_id = record.get('ref_id') or None
+                if ref_id is not None and not is_valid_ref_id(ref_id):
+                    self.reject(email, f"некорректный ref_id {ref_id}")
+                    continue
+                if ref_id in taken_ref_ids:
+                    self.reject(email, f"ref_id {ref_id} уже занят")
+                    continue
+                if ref_id is None:
+                    # Номер из блока аллокатора мог совпасть с ref_id из этой же пачки
+                    while (ref_id := allocator.allocate()) in file_ref_ids:
+                        pass
+                taken_ref_ids.add(ref_id)
+                existing.add(email)
+                ref_code = record.get('ref_code') or None
+                referrer_id = self.ref_map.get(ref_code)
+                if ref_code and referrer_id is None:
+                    self.progress['pending_referrals'].append([email, ref_code])
+                users.append(User(
+                    email=email,
+                    password=password,
+                    first_name=record.get('first_name') or '',
+                    last_name=record.get('last_name') or '',
+                    ref_id=ref_id,
+                    referrer_id=referrer_id,
+                ))
+                cards.append((record.get('card') or None, record.get('end_date') or None))
+
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            memberships = [
+                membership for user, (code, end_date) in zip(users, cards)
+                if (membership := self.build_membership(user, code, end_date))
+            ]
+            UserMembership.objects.bulk_create(memberships, batch_size=self.batch_size)
+
+        self.ref_map.update((user.ref_id, user.pk) for user in users)
+        self.stats['users'] += len(users)
+        self.stats['memberships'] += len(memberships)
+        self.progress['records'] += len(batch)
+        self.save_checkpoint()
+        self.stdout.write(f"Обработано записей: {self.progress['records']}")
+
+    def reject(self, email, reason):
+        self.stats['skipped'] += 1
+        self.stderr.write(f"{email}: {reason}, строка пропущена")
+
+    def load_referrers(self, ref_codes):
+        missing = [code for code in ref_codes if code not in self.ref_map]
+        if missing:
+            self.ref_map.update(User.objects.filter(ref_id__in=missing).values_list('ref_id', 'pk'))
+
+    def build_membership(self, user, code, end_date):
+        if not code:
+            return None
+        card = self.cards.get(code)
+        if card is None:
+            self.stderr.write(f"{user.email}: неизвестная карта {code}")
+            return None
+        try:
+            end_date = date.fromisoformat(end_date) if end_date else None
+        except ValueError:
+            self.stderr.write(f"{user.email}: некорректная дата {end_date}")
+            return None
+        membership = UserMembership(user=user, card=card, end_date=end_date)
+        membership.fill_defaults()
+        return membership
+
+    def resolve_pending_referrals(self):
+        # Рефереры, которые шли в файле позже приглашённых
+        pending = self.progress['pending_referrals']
+        for chunk in batched(pending, self.batch_size):
+            self.load_referrers({code for _, code in chunk})
+            users = User.objects.in_bulk([email for email, _ in chunk], field_name='email')
+            updates = []
+            for email, code in chunk:
+                if code in self.ref_map and email in users:
+                    users[email].referrer_id = self.ref_map[code]
+                    updates.append(users[email])
+                else:
+                    self.stderr.write(f"{email}: реферер {code} не найден")
+            User.objects.bulk_update(updates, ['referrer'])
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "Выдаёт подписанный токен для заголовка X-Profile-Token: запрос к указанному пути "
+        "профилируется (см. users/profiling.py), токен действует PROFILING_TOKEN_MAX_AGE секунд"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь запроса без строки параметров, например /api/cities/")
+        parser.add_argument('--memory', action='store_true', help="Дополнительно tracemalloc")
+
+    def handle(self, *args, **options):
+        token = profiling.make_token(options['path'], memory=options['memory'])
+        self.stdout.write(token)
+        self.stderr.write(
+            f"curl -H 'X-Profile-Token: {token}' ...{options['path']}; "
+            f"отчёт — {settings.PROFILING_DIR}/<X-Profile-Id>.txt"
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users import cache, rollups
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты цен и рейтингов стран и регионов и проверяет их"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Только проверить, ничего не меняя")
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                rollups.rebuild_all()
+            cache.bump_all()
+            self.stdout.write("Агрегаты пересчитаны")
+
+        drift = rollups.find_drift()
+        for model, pk, field, stored, expected in drift:
+            self.stderr.write(f"{model} #{pk}: {field} = {stored}, ожидается {expected}")
+        if drift:
+            raise CommandError(f"Найдено расхождений: {len(drift)}")
+        self.stdout.write(self.style.SUCCESS("Агрегаты согласованы"))
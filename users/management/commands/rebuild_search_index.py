@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import cache, search
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковый индекс регионов, стран и городов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size должен быть положительным")
+        started = time.monotonic()
+        counts = search.rebuild(options['chunk_size'])
+        cache.bump_all()
+        summary = ', '.join(f"{kind}: {count}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Проиндексировано {summary} за {time.monotonic() - started:.1f} с"
+        ))
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from users.ledger import reconcile_range
+from users.models import User
+
+
+def _init_worker():
+    # Нужно при запуске процессов через spawn; при fork Django уже настроен
+    django.setup()
+
+
+def _reconcile(args):
+    return reconcile_range(*args)
+
+
+class Command(BaseCommand):
+    help = "Сверяет балансы пользователей с журналом операций по частям, при необходимости в нескольких процессах"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Пользователей в одной части (по диапазону pk)")
+        parser.add_argument('--workers', type=int, default=1, help="Число процессов")
+        parser.add_argument('--fix', action='store_true', help="Исправить баланс по журналу")
+        parser.add_argument('--snapshot', action='store_true', help="Записать снимки балансов после сверки")
+
+    def handle(self, *args, **options):
+        chunk_size, workers = options['chunk_size'], options['workers']
+        if chunk_size < 1 or workers < 1:
+            raise CommandError("--chunk-size и --workers должны быть положительными")
+
+        bounds = User.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            self.stdout.write("Пользователей нет")
+            return
+
+        chunks = [
+            (start, start + chunk_size - 1, options['fix'], options['snapshot'])
+            for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+        ]
+        started = time.monotonic()
+        if workers == 1:
+            results = map(_reconcile, chunks)
+        else:
+            # Дочерние процессы не должны унаследовать открытые соединения
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            results = executor.map(_reconcile, chunks)
+
+        checked, mismatched = 0, 0
+        for chunk_checked, mismatches in results:
+            checked += chunk_checked
+            mismatched += len(mismatches)
+            for pk, balance, expected in mismatches:
+                self.stderr.write(f"Пользователь #{pk}: баланс {balance}, по журналу {expected}")
+        if workers > 1:
+            executor.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Проверено {checked} пользователей за {elapsed:.1f} с, расхождений: {mismatched}")
+        if mismatched and not options['fix']:
+            raise CommandError("Балансы не совпадают с журналом")
+        self.stdout.write(self.style.SUCCESS("Сверка завершена"))
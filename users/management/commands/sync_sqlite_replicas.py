@@ -0,0 +1,33 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную SQLite-базу в файлы реплик (SQLITE_REPLICA_PATHS) — "
+        "замена репликации для локальной проверки роутера реплик"
+    )
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("Только для SQLite: реплики PostgreSQL наполняет потоковая репликация")
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("Реплики не настроены: задайте SQLITE_REPLICA_PATHS")
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    # backup() даёт согласованную копию и при одновременной записи
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f"{alias}: {connections[alias].settings_dict['NAME']}"))
+        finally:
+            source.close()
@@ -0,0 +1,74 @@
+"""
+Метрики запросов в формате Prometheus для /metrics.
+
+В одном процессе значения живут в памяти. Под несколькими воркерами gunicorn/uvicorn
+задайте общий каталог PROMETHEUS_MULTIPROC_DIR (до старта процессов, см. backend/gunicorn.conf.py):
+каждый воркер пишет свои значения в mmap-файлы без межпроцессных блокировок,
+а /metrics складывает файлы всех воркеров.
+"""
+import os
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # без prometheus_client метрики не собираются, /metrics отдаёт 404
+    prometheus_client = None
+
+
+# Вьюха по имени маршрута, а не по пути: число рядов не растёт с id в URL
+UNMATCHED = 'unmatched'
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+if prometheus_client is not None:
+    REQUESTS = prometheus_client.Counter(
+        'http_requests', "Запросы по маршруту, методу и статусу", ['view', 'method', 'status'],
+    )
+    LATENCY = prometheus_client.Histogram(
+        'http_request_duration_seconds', "Время ответа (для потоковых ответов — до начала отдачи тела)",
+        ['view', 'method'],
+    )
+    DB_QUERIES = prometheus_client.Histogram(
+        'http_request_db_queries', "SQL-запросов на один HTTP-запрос", ['view'],
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+    )
+    DB_DURATION = prometheus_client.Histogram(
+        'http_request_db_duration_seconds', "Суммарное время SQL на один HTTP-запрос", ['view'],
+    )
+    RESPONSE_SIZE = prometheus_client.Histogram(
+        'http_response_size_bytes', "Размер тела ответа", ['view'],
+        buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, float('inf')),
+    )
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNMATCHED
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        # FileResponse знает длину файла; генераторы без Content-Length не учитываются
+        return int(response.get('Content-Length', 0))
+    return len(response.content)
+
+
+def observe(request, response, duration, queries):
+    """queries — QueryStats запроса."""
+    view = view_label(request)
+    method = request.method if request.method in METHODS else 'other'
+    REQUESTS.labels(view, method, str(response.status_code)).inc()
+    LATENCY.labels(view, method).observe(duration)
+    DB_QUERIES.labels(view).observe(queries.count)
+    DB_DURATION.labels(view).observe(queries.duration)
+    RESPONSE_SIZE.labels(view).observe(response_size(response))
+
+
+def render():
+    """(тело, Content-Type) для /metrics."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Свежий реестр: значения текущего процесса уже лежат в его файлах
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,134 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, profiling, routers, slowqueries
+from .querybudget import QueryStats
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes между запросами: после записи клиент получает cookie и
+    REPLICA_STICKY_SECONDS секунд (больше отставания реплики) читает с основной БД.
+    Небезопасные методы сразу читают с основной БД: цены и остатки для записи
+    не должны браться с отстающей реплики. Синхронный и асинхронный: под ASGI
+    не добавляет переход в поток асинхронным вьюхам.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        token = self.begin(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            routers.end(token)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        # Синхронный код под sync_to_async получает копию контекста с тем же RoutingState
+        token = self.begin(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            routers.end(token)
+
+    def begin(self, request):
+        return routers.begin(pinned=request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES)
+
+    def finish(self, response):
+        if routers.current_state().wrote:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Число запросов, время ответа, SQL (число и время), размер ответа и статус
+    по имени маршрута — для /metrics (users/metrics.py). Работает только при заданном
+    METRICS_TOKEN. Стоит первым в MIDDLEWARE, чтобы время включало остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_TOKEN or metrics.prometheus_client is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with QueryStats() as queries:
+            response = self.get_response(request)
+        metrics.observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Журнал медленных SQL (users/slowqueries.py): включается SLOW_QUERY_LOG, иначе
+    не стоит ничего. Стоит первым, чтобы EXPLAIN после ответа не попадал в метрики запроса.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with slowqueries.SlowQueryRecorder(settings.SLOW_QUERY_THRESHOLD_MS / 1000) as recorder:
+            response = self.get_response(request)
+        if recorder.slow:
+            recorder.flush(metrics.view_label(request))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    cProfile (и tracemalloc) для одного запроса по подписанному заголовку или флагу staff
+    (users/profiling.py). Без флага — только проверка заголовка и строки запроса;
+    под ASGI работает асинхронно и не переводит запросы в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        options = profiling.requested(request)
+        if options is None:
+            return self.get_response(request)
+        return profiling.run(self.get_response, request, memory=options['memory'])
+
+    async def __acall__(self, request):
+        # Проверка staff может читать БД — только для запросов с флагом
+        options = await sync_to_async(profiling.requested)(request) if profiling.flagged(request) else None
+        if options is None:
+            return await self.get_response(request)
+        return await profiling.arun(self.get_response, request, memory=options['memory'])
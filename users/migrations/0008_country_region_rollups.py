@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:10
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_rollups(apps, schema_editor):
+    Country = apps.get_model('users', 'Country')
+    Region = apps.get_model('users', 'Region')
+    City = apps.get_model('users', 'City')
+
+    def stat(queryset, group_by, aggregate):
+        return models.Subquery(queryset.values(group_by).annotate(value=aggregate).values('value')[:1])
+
+    cities = City.objects.filter(country=models.OuterRef('pk'))
+    Country.objects.update(
+        min_price=stat(cities, 'country', models.Min('price')),
+        max_price=stat(cities, 'country', models.Max('price')),
+        max_rating=stat(cities, 'country', models.Max('rating')),
+        cities_count=Coalesce(stat(cities, 'country', models.Count('id')), 0),
+    )
+    countries = Country.objects.filter(region=models.OuterRef('pk'))
+    Region.objects.update(
+        min_price=stat(countries, 'region', models.Min('min_price')),
+        max_price=stat(countries, 'region', models.Max('max_price')),
+        max_rating=stat(countries, 'region', models.Max('max_rating')),
+        cities_count=Coalesce(stat(countries, 'region', models.Sum('cities_count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_remove_bonushistory_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='country',
+            name='cities_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='max_price',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='max_rating',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='min_price',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='cities_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='max_price',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='max_rating',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='min_price',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_city_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bonushistory',
+            index=models.Index(fields=['referrer', 'created_at', 'id'], name='bonus_referrer_created_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_bonushistory_referrer_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BonusMonthlyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('referrer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bonus_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Счётчик бонусов за месяц',
+                'verbose_name_plural': 'Счётчики бонусов за месяц',
+                'unique_together': {('referrer', 'year', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def open_ledger(apps, schema_editor):
+    """Переносит бонусы в журнал и добавляет корректировку до текущего баланса."""
+    User = apps.get_model('users', 'User')
+    BonusHistory = apps.get_model('users', 'BonusHistory')
+    BalanceEntry = apps.get_model('users', 'BalanceEntry')
+
+    batch = []
+    for bonus in BonusHistory.objects.order_by('pk').iterator(chunk_size=2000):
+        batch.append(BalanceEntry(user_id=bonus.referrer_id, amount=bonus.amount, kind='bonus', bonus_id=bonus.pk))
+        if len(batch) >= 2000:
+            BalanceEntry.objects.bulk_create(batch)
+            batch = []
+    BalanceEntry.objects.bulk_create(batch)
+
+    bonus_sums = models.Subquery(
+        BalanceEntry.objects.filter(user=models.OuterRef('pk')).values('user')
+        .annotate(total=models.Sum('amount')).values('total')[:1]
+    )
+    users = User.objects.annotate(ledger=Coalesce(bonus_sums, models.Value(0), output_field=models.DecimalField()))
+    adjustments = [
+        BalanceEntry(user_id=user.pk, amount=user.balance - user.ledger, kind='adjustment')
+        for user in users.exclude(balance=models.F('ledger')).iterator(chunk_size=2000)
+    ]
+    BalanceEntry.objects.bulk_create(adjustments, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_bonusmonthlycounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Отрицательная сумма = списание', max_digits=12)),
+                ('kind', models.CharField(choices=[('bonus', 'Бонус'), ('debit', 'Списание'), ('adjustment', 'Корректировка')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bonus', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_entry', to='users.bonushistory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Операция по балансу',
+                'verbose_name_plural': 'Операции по балансу',
+                'indexes': [models.Index(fields=['user', 'id'], name='balance_entry_user_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Снимок баланса',
+                'verbose_name_plural': 'Снимки баланса',
+                'indexes': [models.Index(fields=['user', '-last_entry_id'], name='balance_snapshot_user_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
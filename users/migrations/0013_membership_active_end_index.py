@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usermembership',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['end_date', 'id'], name='membership_active_end_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_membership_active_end_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usermembership',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-end_date'], name='membership_user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_membership_user_active_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Последовательность номеров',
+                'verbose_name_plural': 'Последовательности номеров',
+            },
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='ref_id',
+            field=models.CharField(blank=True, max_length=10, unique=True),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:25
+
+from django.db import migrations, models
+
+
+# Внешнее содержимое FTS5 — сама таблица users_searchdocument, триггеры
+# держат индекс в актуальном состоянии при любых INSERT/UPDATE/DELETE
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE users_searchdocument_fts USING fts5(
+        name, text, kind UNINDEXED, content='users_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER users_searchdocument_ai AFTER INSERT ON users_searchdocument BEGIN
+        INSERT INTO users_searchdocument_fts(rowid, name, text, kind) VALUES (new.id, new.name, new.text, new.kind);
+    END""",
+    """CREATE TRIGGER users_searchdocument_ad AFTER DELETE ON users_searchdocument BEGIN
+        INSERT INTO users_searchdocument_fts(users_searchdocument_fts, rowid, name, text, kind)
+        VALUES ('delete', old.id, old.name, old.text, old.kind);
+    END""",
+    """CREATE TRIGGER users_searchdocument_au AFTER UPDATE ON users_searchdocument BEGIN
+        INSERT INTO users_searchdocument_fts(users_searchdocument_fts, rowid, name, text, kind)
+        VALUES ('delete', old.id, old.name, old.text, old.kind);
+        INSERT INTO users_searchdocument_fts(rowid, name, text, kind) VALUES (new.id, new.name, new.text, new.kind);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS users_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS users_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS users_searchdocument_au",
+    "DROP TABLE IF EXISTS users_searchdocument_fts",
+]
+# Выражение совпадает с users.search.PG_VECTOR
+POSTGRES_INDEX = [
+    """CREATE INDEX users_searchdocument_tsv_idx ON users_searchdocument USING GIN (
+        (setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', text), 'B'))
+    )""",
+]
+POSTGRES_DROP = ["DROP INDEX IF EXISTS users_searchdocument_tsv_idx"]
+
+
+def flatten(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from flatten(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from flatten(item)
+
+
+def execute(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_index(apps, schema_editor):
+    execute(schema_editor, {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX})
+
+    SearchDocument = apps.get_model('users', 'SearchDocument')
+    documents = []
+    for kind in ('region', 'country', 'city'):
+        for instance in apps.get_model('users', kind).objects.order_by('pk').iterator():
+            parts = [instance.description]
+            for field in ('highlights', 'attractions'):
+                parts.extend(flatten(getattr(instance, field, None)))
+            documents.append(SearchDocument(
+                kind=kind, object_id=instance.pk, name=instance.name,
+                text='\n'.join(part for part in parts if part),
+            ))
+    SearchDocument.objects.bulk_create(documents, batch_size=2000)
+
+
+def drop_index(apps, schema_editor):
+    execute(schema_editor, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_refidsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('region', 'Регион'), ('country', 'Страна'), ('city', 'Город')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=100)),
+                ('text', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='search_document_object_unique')],
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,14 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from datetime import timedelta, date, datetime
-import random
-import string
+from datetime import timedelta, date
 import uuid
 
 
 def generate_ref_id():
-    digits = ''.join(random.choices(string.digits, k=7))
-    return f"VT-{digits}"
+    # Уникальный номер из последовательности, см. users/refids.py
+    from .refids import allocator
+    return allocator.allocate()
 
 
 # ---------- USER MANAGER ----------
@@ -19,8 +19,6 @@ class UserManager(BaseUserManager):
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
-        if not user.ref_id:
-            user.ref_id = generate_ref_id()
         user.save(using=self._db)
         return user
 
@@ -30,14 +28,29 @@ class UserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
     
 
+# ---------- REF ID SEQUENCE ----------
+class RefIdSequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+    class Meta:
+        verbose_name = "Последовательность номеров"
+        verbose_name_plural = "Последовательности номеров"
+
+
 # ---------- USER ----------
 class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=100, blank=True)
     last_name = models.CharField(max_length=100, blank=True)
-    ref_id = models.CharField(max_length=10, unique=True, default=generate_ref_id)
+    # Присваивается в save(), чтобы User() не обращался к БД
+    ref_id = models.CharField(max_length=10, unique=True, blank=True)
     referrer = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='referrals')
-    balance = models.IntegerField(default=0)
+    # Кэш суммы BalanceEntry; меняется только через BalanceEntry.post
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -47,6 +60,22 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    def save(self, *args, **kwargs):
+        if not self.ref_id:
+            self.ref_id = generate_ref_id()
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # Полное сохранение не пишет balance: в объекте может быть значение до
+            # параллельного BalanceEntry.post, и UPDATE затёр бы начисление
+            kwargs['update_fields'] = self.non_ledger_fields()
+        super().save(*args, **kwargs)
+
+    def non_ledger_fields(self):
+        deferred = self.get_deferred_fields()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name != 'balance' and field.attname not in deferred
+        ]
+
     def __str__(self):
         return self.email
 
@@ -91,23 +120,46 @@ class UserMembership(models.Model):
     used_tours = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
 
-    def save(self, *args, **kwargs):
+    def fill_defaults(self):
+        # Отдельно от save(), чтобы bulk_create при импорте давал те же значения
         if not self.unique_code:
             self.unique_code = f"VT-{uuid.uuid4().hex[:8].upper()}"
         if not self.end_date and self.card.duration_months:
             self.end_date = date.today() + timedelta(days=30 * self.card.duration_months)
         if self.end_date and self.end_date < date.today():
             self.is_active = False
+
+    def save(self, *args, **kwargs):
+        self.fill_defaults()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.email} - {self.card.name} ({self.unique_code})"
 
     class Meta:
+        indexes = [
+            # Для deactivate_expired_cards: только активные карты, по сроку
+            models.Index(fields=['end_date', 'id'], condition=models.Q(is_active=True), name='membership_active_end_idx'),
+            models.Index(fields=['user', '-end_date'], condition=models.Q(is_active=True), name='membership_user_active_idx'),
+        ]
         verbose_name = "Карта пользователя"
         verbose_name_plural = "Карты пользователей"
 
 
+# ---------- CATALOG ROLLUPS ----------
+ROLLUP_FIELDS = ('min_price', 'max_price', 'max_rating', 'cities_count')
+
+
+def save_without_rollups(instance, kwargs):
+    # Роллапы меняет только users/rollups.py, обычный save не должен затирать их устаревшими значениями
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in ROLLUP_FIELDS
+        ]
+    return kwargs
+
+
 # ---------- REGION ----------
 class Region(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -117,6 +169,15 @@ class Region(models.Model):
     highlights = models.JSONField(default=list, blank=True)
     best_time = models.CharField(max_length=100)
 
+    # Денормализованные агрегаты по городам, см. users/rollups.py
+    min_price = models.IntegerField(blank=True, null=True, editable=False)
+    max_price = models.IntegerField(blank=True, null=True, editable=False)
+    max_rating = models.DecimalField(max_digits=3, decimal_places=1, blank=True, null=True, editable=False)
+    cities_count = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **save_without_rollups(self, kwargs))
+
     def __str__(self):
         return self.display_name
 
@@ -138,6 +199,15 @@ class Country(models.Model):
     best_time = models.CharField(max_length=100)
     highlights = models.JSONField(default=list, blank=True)
 
+    # Денормализованные агрегаты по городам, см. users/rollups.py
+    min_price = models.IntegerField(blank=True, null=True, editable=False)
+    max_price = models.IntegerField(blank=True, null=True, editable=False)
+    max_rating = models.DecimalField(max_digits=3, decimal_places=1, blank=True, null=True, editable=False)
+    cities_count = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **save_without_rollups(self, kwargs))
+
     def __str__(self):
         return self.name
 
@@ -160,12 +230,48 @@ class City(models.Model):
 
     class Meta:
         unique_together = ['country', 'name']
+        # Под фильтры и keyset-сортировку каталога (поле, id)
+        indexes = [
+            models.Index(fields=['price', 'id'], name='city_price_idx'),
+            models.Index(fields=['rating', 'id'], name='city_rating_idx'),
+            models.Index(fields=['name', 'id'], name='city_name_idx'),
+            models.Index(fields=['country', 'price', 'id'], name='city_country_price_idx'),
+            models.Index(fields=['country', 'rating', 'id'], name='city_country_rating_idx'),
+        ]
         verbose_name = "Город"
         verbose_name_plural = "Города"
 
     def __str__(self):
         return f"{self.name}, {self.country.name}"
 
+
+# ---------- SEARCH ----------
+class SearchDocument(models.Model):
+    """
+    Текст региона/страны/города для полнотекстового поиска, см. users/search.py.
+    Индекс (FTS5 в SQLite, GIN в Postgres) создаётся миграцией поверх этой таблицы.
+    """
+    class Kind(models.TextChoices):
+        REGION = "region", "Регион"
+        COUNTRY = "country", "Страна"
+        CITY = "city", "Город"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    name = models.CharField(max_length=100)
+    text = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_document_object_unique'),
+        ]
+        verbose_name = "Поисковый документ"
+        verbose_name_plural = "Поисковые документы"
+
+
 # ---------- TOUR ----------
 class Tour(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tours")
@@ -175,30 +281,13 @@ class Tour(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        city_price = self.city.price
-        if is_new:
-            membership = self.user.user_memberships.filter(is_active=True).order_by('-end_date').first()
-            if membership:
-                used = membership.used_tours
-                discount = 0
-
-                if used < membership.card.discount_tours:
-                    discount = membership.card.discount_percent
-                elif used < membership.card.discount_tours + membership.card.extra_discount_tours:
-                    discount = membership.card.extra_discount_percent
-
-                self.price = city_price * (100 - discount) / 100
-
-                if discount > 0:
-                    membership.used_tours += 1
-                    membership.save()
-            else:
-                self.price = city_price
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
 
-        super().save(*args, **kwargs)
-
-        if is_new:
+        from .services import tour_price
+        with transaction.atomic():
+            self.price = tour_price(self.user, self.city)
+            super().save(*args, **kwargs)
             BonusHistory.process_bonus(self.user, self)
 
     def __str__(self):
@@ -226,7 +315,8 @@ class BonusHistory(models.Model):
         referrer = user.referrer
 
         # Берём активную карту реферера
-        ref_membership = referrer.user_memberships.filter(is_active=True).order_by('-end_date').first()
+        from .services import current_membership
+        ref_membership = current_membership(referrer)
         if not ref_membership:
             return
 
@@ -234,30 +324,112 @@ class BonusHistory(models.Model):
         bonus_amount = ref_membership.card.bonus_amount
         monthly_limit = ref_membership.card.monthly_limit
 
-        # Проверка лимита на месяц
-        if monthly_limit is not None:
-            current_month = datetime.now().month
-            bonuses_this_month = BonusHistory.objects.filter(
-                referrer=referrer,
-                created_at__month=current_month
-            ).count()
-            if bonuses_this_month >= monthly_limit:
+        with transaction.atomic():
+            # Проверка лимита на месяц: счётчик увеличивается только если лимит не исчерпан
+            if not BonusMonthlyCounter.increment(referrer, limit=monthly_limit):
                 return
 
-        BonusHistory.objects.create(
-            referrer=referrer,
-            referred_user=user,
-            tour=tour,
-            amount=bonus_amount,
-        )
-
-        referrer.balance += bonus_amount
-        referrer.save()
+            bonus = BonusHistory.objects.create(
+                referrer=referrer,
+                referred_user=user,
+                tour=tour,
+                amount=bonus_amount,
+            )
+            BalanceEntry.post(referrer, bonus_amount, BalanceEntry.Kind.BONUS, bonus=bonus)
 
 
     def __str__(self):
         return f"{self.referrer.email} <- {self.referred_user.email} (${self.amount})"
 
     class Meta:
+        indexes = [
+            models.Index(fields=['referrer', 'created_at', 'id'], name='bonus_referrer_created_idx'),
+        ]
         verbose_name = "История бонусов"
-        verbose_name_plural = "История бонусов"
\ No newline at end of file
+        verbose_name_plural = "История бонусов"
+
+
+# ---------- BONUS MONTHLY COUNTER ----------
+class BonusMonthlyCounter(models.Model):
+    referrer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bonus_counters")
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def increment(cls, referrer, limit=None, day=None):
+        """
+        Атомарно увеличивает счётчик бонусов за месяц.
+        Возвращает False, если лимит уже исчерпан.
+        """
+        day = day or timezone.localdate()
+        counter, _ = cls.objects.get_or_create(referrer=referrer, year=day.year, month=day.month)
+        counters = cls.objects.filter(pk=counter.pk)
+        if limit is not None:
+            counters = counters.filter(count__lt=limit)
+        return counters.update(count=models.F('count') + 1) > 0
+
+    def __str__(self):
+        return f"{self.referrer.email}: {self.month:02d}.{self.year} ({self.count})"
+
+    class Meta:
+        unique_together = ['referrer', 'year', 'month']
+        verbose_name = "Счётчик бонусов за месяц"
+        verbose_name_plural = "Счётчики бонусов за месяц"
+
+
+
+# ---------- BALANCE LEDGER ----------
+class BalanceEntry(models.Model):
+    class Kind(models.TextChoices):
+        BONUS = "bonus", "Бонус"
+        DEBIT = "debit", "Списание"
+        ADJUSTMENT = "adjustment", "Корректировка"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="balance_entries")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, help_text="Отрицательная сумма = списание")
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    bonus = models.OneToOneField(BonusHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name="balance_entry")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def post(cls, user, amount, kind, bonus=None):
+        """
+        Добавляет запись в журнал и атомарно меняет User.balance.
+        Списание не проходит, если на балансе недостаточно средств.
+        """
+        with transaction.atomic():
+            users = User.objects.filter(pk=user.pk)
+            if amount < 0:
+                users = users.filter(balance__gte=-amount)
+            if not users.update(balance=models.F('balance') + amount):
+                raise ValueError("Недостаточно средств на балансе")
+            return cls.objects.create(user=user, amount=amount, kind=kind, bonus=bonus)
+
+    def __str__(self):
+        return f"{self.user.email}: {self.amount} ({self.get_kind_display()})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='balance_entry_user_idx'),
+        ]
+        verbose_name = "Операция по балансу"
+        verbose_name_plural = "Операции по балансу"
+
+
+class BalanceSnapshot(models.Model):
+    """Проверенный баланс на момент записи last_entry_id, сверка читает журнал только после неё."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="balance_snapshots")
+    last_entry_id = models.BigIntegerField(default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.email}: {self.balance} (до #{self.last_entry_id})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-last_entry_id'], name='balance_snapshot_user_idx'),
+        ]
+        verbose_name = "Снимок баланса"
+        verbose_name_plural = "Снимки баланса"
@@ -0,0 +1,190 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import bounded_int
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по паре (поле сортировки, pk).
+    Следующая страница выбирается условием WHERE по ключу последней строки,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+
+    Вьюха задаёт ordering_fields: {'price': 'price', ...} — параметр ?ordering=
+    и поле модели, по которому идёт сортировка, и, при желании, default_ordering.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'limit'
+    page_size = 50
+    max_page_size = 200
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.finish_page([row async for row in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.pk_name = queryset.model._meta.pk.name
+        field, descending = self.ordering
+        cursor = self.cursor = self.decode_cursor(request, queryset.model, field)
+        reverse = bool(cursor and cursor['r'])
+        descending_now = descending != reverse
+
+        queryset = queryset.order_by(*self.order_expressions(field, descending_now, nulls_last=not reverse))
+        if cursor:
+            queryset = queryset.filter(self.after(field, cursor['v'], cursor['id'], descending_now, nulls_last=not reverse))
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, rows):
+        cursor = self.cursor
+        reverse = bool(cursor and cursor['r'])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_row = rows[-1] if rows and (has_more or reverse) else None
+        self.previous_row = rows[0] if rows and (cursor and not reverse or reverse and has_more) else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_row, reverse=False)),
+            ('previous', self.get_link(self.previous_row, reverse=True)),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    # ---------- ORDERING ----------
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            raise ValidationError({self.page_size_query_param: 'Ожидается целое число'})
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        fields = getattr(view, 'ordering_fields', {})
+        param = request.query_params.get(self.ordering_query_param) or getattr(view, 'default_ordering', None)
+        if not param:
+            return 'pk', False
+        name = param.lstrip('-')
+        if name not in fields:
+            raise ValidationError({self.ordering_query_param: f"Допустимые значения: {', '.join(sorted(fields))}"})
+        return fields[name], param.startswith('-')
+
+    @staticmethod
+    def order_expressions(field, descending, nulls_last):
+        if field == 'pk':
+            return ['-pk' if descending else 'pk']
+        nulls = {'nulls_last': True} if nulls_last else {'nulls_first': True}
+        expression = F(field).desc(**nulls) if descending else F(field).asc(**nulls)
+        return [expression, '-pk' if descending else 'pk']
+
+    @staticmethod
+    def after(field, value, pk, descending, nulls_last):
+        pk_after = Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+        if field == 'pk':
+            return pk_after
+        if value is None:
+            condition = Q(**{f'{field}__isnull': True}) & pk_after
+            return condition if nulls_last else condition | Q(**{f'{field}__isnull': False})
+        lookup = 'lt' if descending else 'gt'
+        condition = Q(**{f'{field}__{lookup}': value}) | (Q(**{field: value}) & pk_after)
+        if nulls_last:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    # ---------- CURSOR ----------
+    def decode_cursor(self, request, model, field):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            cursor = {'v': cursor['v'], 'id': bounded_int(cursor['id']), 'r': bool(cursor['r'])}
+            if field != 'pk' and cursor['v'] is not None:
+                cursor['v'] = model._meta.get_field(field).to_python(cursor['v'])
+        # OverflowError — int() от Infinity в JSON курсора
+        except (TypeError, ValueError, OverflowError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def get_link(self, row, reverse):
+        if row is None:
+            return None
+        field = self.ordering[0]
+        # Строки values() — словари, см. users/rows.py
+        if isinstance(row, dict):
+            value, pk = (None if field == 'pk' else row[field]), row[self.pk_name]
+        else:
+            value, pk = (None if field == 'pk' else getattr(row, field)), row.pk
+        payload = json.dumps({'v': value, 'id': pk, 'r': reverse}, default=str)
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class SearchPagination(BasePagination):
+    """
+    Страницы ранжированной выдачи по ?limit и ?offset, без COUNT:
+    берётся limit + 1 строка, лишняя говорит о наличии следующей страницы.
+    """
+    limit_query_param = 'limit'
+    offset_query_param = 'offset'
+    default_limit = 20
+    max_limit = 100
+    max_offset = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_int(request, self.limit_query_param, self.default_limit, 1, self.max_limit)
+        self.offset = self.get_int(request, self.offset_query_param, 0, 0, self.max_offset)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_int(self, request, param, default, minimum, maximum):
+        try:
+            value = int(request.query_params.get(param, default))
+        except (TypeError, ValueError):
+            raise ValidationError({param: 'Ожидается целое число'})
+        return max(minimum, min(value, maximum))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.offset + self.limit) if self.has_next else None),
+            ('previous', self.get_link(max(0, self.offset - self.limit)) if self.offset else None),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return KeysetPagination.get_paginated_response_schema(self, schema)
+
+    def get_link(self, offset):
+        url = replace_query_param(self.base_url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, offset)
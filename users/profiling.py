@@ -0,0 +1,171 @@
+"""
+Профиль одного запроса по требованию (см. ProfilingMiddleware).
+
+Включается заголовком X-Profile-Token с подписанным токеном (manage.py profiling_token)
+или флагом ?_profile=1 для staff (сессия админки или JWT). Токен выдаётся на один путь
+и живёт PROFILING_TOKEN_MAX_AGE секунд. ?_profile=memory и токен с --memory
+дополнительно включают tracemalloc. Профиль cProfile (.prof — для pstats/snakeviz) и
+текстовая сводка (.txt) пишутся в PROFILING_DIR, ссылка на них — заголовок ответа
+X-Profile-Id; хранятся PROFILING_KEEP последних отчётов не старше PROFILING_RETENTION секунд.
+
+cProfile видит только поток запроса; tracemalloc общий на процесс, поэтому
+при параллельных запросах в сводку памяти попадают и их выделения.
+"""
+import cProfile
+import io
+import pstats
+import secrets
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+SALT = 'users.profiling'
+TOKEN_META = 'HTTP_X_PROFILE_TOKEN'
+QUERY_FLAG = '_profile'
+RESPONSE_HEADER = 'X-Profile-Id'
+
+_tracemalloc_lock = threading.Lock()
+
+
+def profiles_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def make_token(path, memory=False):
+    # Путь в подписи: перехваченный заголовок не профилирует остальные маршруты
+    return signing.dumps({'path': path, 'memory': memory}, salt=SALT)
+
+
+def read_token(value):
+    try:
+        return signing.loads(value, salt=SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def flagged(request):
+    """Профиль запрошен заголовком или флагом в строке запроса; без БД, годится для event loop."""
+    return TOKEN_META in request.META or QUERY_FLAG in request.META.get('QUERY_STRING', '')
+
+
+def requested(request):
+    """None, если профиль не запрошен, иначе {'memory': bool}. Без флага — два поиска в словаре META."""
+    token = request.META.get(TOKEN_META)
+    if token:
+        payload = read_token(token)
+        if payload is None or payload.get('path') != request.path:
+            return None
+        return {'memory': payload['memory']}
+    if QUERY_FLAG in request.META.get('QUERY_STRING', ''):
+        value = request.GET.get(QUERY_FLAG)
+        if value and is_staff(request):
+            return {'memory': value == 'memory'}
+    return None
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    # Клиенты API приходят с JWT, а не с сессией: аутентифицируем заранее, только при флаге
+    from .authentication import CachedJWTAuthentication
+
+    try:
+        result = CachedJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+@contextmanager
+def session(memory=False):
+    """cProfile (и tracemalloc) на время блока; после выхода в словаре — аргументы save()."""
+    # tracemalloc один на процесс: второй параллельный запрос с memory профилируется без него
+    memory = memory and _tracemalloc_lock.acquire(blocking=False)
+    if memory and tracemalloc.is_tracing():  # трассировку включил кто-то другой — не выключаем её
+        _tracemalloc_lock.release()
+        memory = False
+    result = {'profile': cProfile.Profile()}
+    try:
+        if memory:
+            tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+        started = time.perf_counter()
+        result['profile'].enable()
+        try:
+            yield result
+        finally:
+            result['profile'].disable()
+            result['elapsed'] = time.perf_counter() - started
+            if memory:
+                result['snapshot'] = tracemalloc.take_snapshot()
+                result['peak'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    finally:
+        if memory:
+            _tracemalloc_lock.release()
+
+
+def run(get_response, request, memory=False):
+    """Выполняет запрос под cProfile (и tracemalloc), сохраняет отчёт; возвращает ответ с X-Profile-Id."""
+    with session(memory) as result:
+        response = get_response(request)
+    response[RESPONSE_HEADER] = save(request, response, **result)
+    return response
+
+
+async def arun(get_response, request, memory=False):
+    """
+    run() для асинхронной цепочки. cProfile видит поток event loop: в профиль попадают
+    и другие запросы этого цикла, а код под sync_to_async — только как ожидание.
+    """
+    with session(memory) as result:
+        response = await get_response(request)
+    response[RESPONSE_HEADER] = await sync_to_async(save)(request, response, **result)
+    return response
+
+
+def save(request, response, elapsed, profile, snapshot=None, peak=None):
+    reference = f"{timezone.now():%Y%m%d-%H%M%S}-{secrets.token_hex(4)}"
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile.dump_stats(directory / f'{reference}.prof')
+
+    top = settings.PROFILING_TOP
+    summary = io.StringIO()
+    summary.write(f"{request.method} {request.get_full_path()} -> {response.status_code}, {elapsed * 1000:.1f} мс\n\n")
+    pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(top)
+    if snapshot is not None:
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        summary.write(f"\nПамять: пик {peak / 1024:.1f} КиБ, top {top} по строкам:\n")
+        for stat in snapshot.statistics('lineno')[:top]:
+            summary.write(f"{stat}\n")
+    (directory / f'{reference}.txt').write_text(summary.getvalue(), encoding='utf-8')
+    prune(directory)
+    return reference
+
+
+def prune(directory):
+    """Удаляет отчёты старше PROFILING_RETENTION и всё сверх PROFILING_KEEP последних."""
+    reports = {}
+    for path in directory.glob('*.prof'):
+        try:
+            reports[path.stem] = path.stat().st_mtime
+        except FileNotFoundError:  # удалил параллельный запрос
+            continue
+    expired = time.time() - settings.PROFILING_RETENTION
+    newest = sorted(reports, key=reports.get, reverse=True)
+    for position, reference in enumerate(newest):
+        if position >= settings.PROFILING_KEEP or reports[reference] < expired:
+            for suffix in ('.prof', '.txt'):
+                (directory / f'{reference}{suffix}').unlink(missing_ok=True)
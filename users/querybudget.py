@@ -0,0 +1,115 @@
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+
+@dataclass
+class Query:
+    sql: str
+    params: object
+    duration: float
+    origin: list = field(default_factory=list)
+
+
+def project_frames(limit=3, skip=()):
+    """
+    Последние limit кадров стека из кода проекта (без Django, библиотек и skip),
+    например ['users/serializers.py:138 in get_bonus_history'].
+    """
+    base = str(settings.BASE_DIR)
+    frames = []
+    for frame in traceback.extract_stack():
+        filename = frame.filename
+        if not filename.startswith(base) or 'site-packages' in filename or filename in skip:
+            continue
+        frames.append(f"{Path(filename).relative_to(base)}:{frame.lineno} in {frame.name}")
+    return frames[-limit:]
+
+
+def fingerprint(sql):
+    """SQL без литералов: одинаковые запросы с разными значениями совпадают."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*(\?\s*,\s*)+\?\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class QueryLog:
+    """
+    Все запросы к БД внутри блока: SQL, время и место в коде проекта.
+    В отличие от CaptureQueriesContext, не требует DEBUG и помнит, откуда пришёл запрос.
+
+        with QueryLog() as log:
+            client.get('/api/regions/')
+        print(format_queries(log.queries))
+    """
+
+    def __init__(self, using='default', frames=3):
+        self.connection = connections[using]
+        self.frames = frames
+        self.queries = []
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            origin = project_frames(self.frames, skip=(__file__,))
+            self.queries.append(Query(sql, params, time.perf_counter() - started, origin))
+
+    def __len__(self):
+        return len(self.queries)
+
+
+class QueryStats:
+    """
+    Только число и суммарное время запросов ко всем БД внутри блока — без SQL и стека,
+    поэтому годится для каждого запроса в проде (см. MetricsMiddleware).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def format_queries(queries):
+    """Нумерованный список запросов с местом вызова; повторы одного запроса (N+1) отмечены."""
+    repeats = Counter(fingerprint(query.sql) for query in queries)
+    lines = []
+    for number, query in enumerate(queries, start=1):
+        times = repeats[fingerprint(query.sql)]
+        lines.append(f"{number}. {query.sql}" + (f"  [повторяется {times} раз]" if times > 1 else ""))
+        lines.extend(f"     {frame}" for frame in reversed(query.origin or ["(вне кода проекта)"]))
+    return '\n'.join(lines)
@@ -0,0 +1,149 @@
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import User, RefIdSequence
+
+
+REF_ID_PREFIX = "VT-"
+REF_ID_DIGITS = 7
+REF_ID_SPACE = 10 ** REF_ID_DIGITS
+SEQUENCE_NAME = 'ref_id'
+
+# Сеть Фейстеля на 24 битах (2^24 > 10^7) с «прогулкой по циклу»:
+# биекция на [0, 10^7), поэтому разные номера дают разные ref_id
+HALF_BITS = 12
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+
+@lru_cache(maxsize=1)
+def _round_keys():
+    digest = hashlib.sha256(f"ref-id:{settings.SECRET_KEY}".encode()).digest()
+    return [int.from_bytes(digest[i * 4:i * 4 + 4], 'big') for i in range(ROUNDS)]
+
+
+def _round(value, key):
+    return ((value * 0x9E37 + key) ^ (value >> 5)) & HALF_MASK
+
+
+def _feistel(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in keys:
+        left, right = right, left ^ _round(right, key)
+    return (left << HALF_BITS) | right
+
+
+def _feistel_inverse(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in reversed(keys):
+        left, right = right ^ _round(left, key), left
+    return (left << HALF_BITS) | right
+
+
+def scramble(number):
+    keys = _round_keys()
+    value = _feistel(number, keys)
+    while value >= REF_ID_SPACE:
+        value = _feistel(value, keys)
+    return value
+
+
+def unscramble(value):
+    keys = _round_keys()
+    number = _feistel_inverse(value, keys)
+    while number >= REF_ID_SPACE:
+        number = _feistel_inverse(number, keys)
+    return number
+
+
+def format_ref_id(value):
+    return f"{REF_ID_PREFIX}{value:0{REF_ID_DIGITS}d}"
+
+
+REF_ID_PATTERN = re.compile(rf"{re.escape(REF_ID_PREFIX)}\d{{{REF_ID_DIGITS}}}")
+
+
+def is_valid_ref_id(value):
+    return REF_ID_PATTERN.fullmatch(value) is not None
+
+
+# ---------- ALLOCATOR ----------
+class RefIdAllocator:
+    """
+    Выдаёт уникальные ref_id из блоков последовательности RefIdSequence.
+    Блок резервируется одним UPDATE на block_size регистраций, дальше номера
+    выдаются из памяти процесса под блокировкой потока.
+
+    Блок, зарезервированный внутри чужой транзакции, до её коммита считается
+    временным: если транзакция (или точка сохранения) откатилась, откатился и
+    UPDATE последовательности, и те же номера получит другой процесс — такой
+    блок выбрасывается при следующей выдаче.
+    """
+
+    def __init__(self, block_size=100):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pending = []
+        # (соединение, колбэк on_commit) временного блока; None — блок зафиксирован
+        self._uncommitted = None
+
+    def allocate(self):
+        with self._lock:
+            if self._pending and not self._block_is_durable():
+                self._pending = []
+            if not self._pending:
+                self._pending = self._reserve_block()
+            return self._pending.pop()
+
+    def discard_block(self):
+        with self._lock:
+            self._pending = []
+            self._uncommitted = None
+
+    def _block_is_durable(self):
+        if self._uncommitted is None:
+            return True
+        connection, callback = self._uncommitted
+        # Откат транзакции или точки сохранения снимает её колбэки on_commit
+        return connection is transaction.get_connection() and any(
+            entry[1] is callback for entry in connection.run_on_commit
+        )
+
+    def _track_commit(self, connection):
+        def committed():
+            if self._uncommitted is mark:
+                self._uncommitted = None
+
+        mark = (connection, committed)
+        self._uncommitted = mark
+        transaction.on_commit(committed)
+
+    def _reserve_block(self):
+        connection = transaction.get_connection()
+        while True:
+            with transaction.atomic():
+                RefIdSequence.objects.get_or_create(name=SEQUENCE_NAME)
+                RefIdSequence.objects.filter(pk=SEQUENCE_NAME).update(next_value=F('next_value') + self.block_size)
+                end = RefIdSequence.objects.values_list('next_value', flat=True).get(pk=SEQUENCE_NAME)
+            self._uncommitted = None
+            if connection.in_atomic_block:
+                self._track_commit(connection)
+            start = end - self.block_size
+            if start >= REF_ID_SPACE:
+                raise RuntimeError("Номера ref_id исчерпаны")
+
+            ref_ids = [format_ref_id(scramble(n)) for n in range(start, min(end, REF_ID_SPACE))]
+            # Старые ref_id выдавались случайно и могут попасть в блок
+            taken = set(User.objects.filter(ref_id__in=ref_ids).values_list('ref_id', flat=True))
+            free = [ref_id for ref_id in reversed(ref_ids) if ref_id not in taken]
+            if free:
+                return free
+
+
+allocator = RefIdAllocator()
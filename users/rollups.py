@@ -0,0 +1,109 @@
+from django.db import models
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import ROLLUP_FIELDS, Region, Country, City
+
+
+RATING_FIELD = models.DecimalField(max_digits=3, decimal_places=1)
+
+
+def city_stats():
+    """Агрегаты по городам страны, которые хранятся в Country."""
+    return {
+        'min_price': models.Min('price'),
+        'max_price': models.Max('price'),
+        'max_rating': models.Max('rating'),
+        'cities_count': models.Count('id'),
+    }
+
+
+def country_stats():
+    """Агрегаты по роллапам стран, которые хранятся в Region."""
+    return {
+        'min_price': models.Min('min_price'),
+        'max_price': models.Max('max_price'),
+        'max_rating': models.Max('max_rating'),
+        'cities_count': Coalesce(models.Sum('cities_count'), 0),
+    }
+
+
+# ---------- INCREMENTAL ----------
+def add_city(city):
+    """Быстрый путь для нового города: сдвигаем границы без пересчёта."""
+    price = models.Value(city.price, output_field=models.IntegerField())
+    rating = models.Value(city.rating, output_field=RATING_FIELD)
+    changes = {
+        'min_price': Least(Coalesce('min_price', price), price),
+        'max_price': Greatest(Coalesce('max_price', price), price),
+        'max_rating': Greatest(Coalesce('max_rating', rating), rating),
+        'cities_count': models.F('cities_count') + 1,
+    }
+    Country.objects.filter(pk=city.country_id).update(**changes)
+    Region.objects.filter(countries__pk=city.country_id).update(**changes)
+
+
+def refresh_country(country_id):
+    stats = City.objects.filter(country_id=country_id).aggregate(**city_stats())
+    Country.objects.filter(pk=country_id).update(**stats)
+
+
+def refresh_region(region_id):
+    stats = Country.objects.filter(region_id=region_id).aggregate(**country_stats())
+    Region.objects.filter(pk=region_id).update(**stats)
+
+
+def refresh_countries(*country_ids):
+    """Пересчитывает страны и их регионы, пропуская повторы и None."""
+    country_ids = {pk for pk in country_ids if pk is not None}
+    for country_id in country_ids:
+        refresh_country(country_id)
+    region_ids = Country.objects.filter(pk__in=country_ids).values_list('region_id', flat=True)
+    for region_id in set(region_ids):
+        refresh_region(region_id)
+
+
+# ---------- FULL REBUILD ----------
+def rebuild_all():
+    """Пересчитывает роллапы всех стран и регионов двумя UPDATE."""
+    Country.objects.update(**_subquery_stats(City.objects.filter(country=models.OuterRef('pk')), 'country', city_stats()))
+    Region.objects.update(**_subquery_stats(Country.objects.filter(region=models.OuterRef('pk')), 'region', country_stats()))
+
+
+def _subquery_stats(queryset, group_by, stats):
+    result = {}
+    for name, aggregate in stats.items():
+        subquery = models.Subquery(queryset.values(group_by).annotate(value=aggregate).values('value')[:1])
+        result[name] = Coalesce(subquery, 0) if name == 'cities_count' else subquery
+    return result
+
+
+def find_drift():
+    """Возвращает список (модель, pk, поле, сохранено, ожидается) для расхождений."""
+    drift = []
+    countries = Country.objects.annotate(**{f'expected_{name}': agg for name, agg in _expected_country_stats().items()})
+    regions = Region.objects.annotate(**{f'expected_{name}': agg for name, agg in _expected_region_stats().items()})
+    for queryset in (countries, regions):
+        for obj in queryset.iterator():
+            for name in ROLLUP_FIELDS:
+                stored, expected = getattr(obj, name), getattr(obj, f'expected_{name}')
+                if stored != expected:
+                    drift.append((type(obj).__name__, obj.pk, name, stored, expected))
+    return drift
+
+
+def _expected_country_stats():
+    return {
+        'min_price': models.Min('cities__price'),
+        'max_price': models.Max('cities__price'),
+        'max_rating': models.Max('cities__rating'),
+        'cities_count': models.Count('cities'),
+    }
+
+
+def _expected_region_stats():
+    return {
+        'min_price': models.Min('countries__cities__price'),
+        'max_price': models.Max('countries__cities__price'),
+        'max_rating': models.Max('countries__cities__rating'),
+        'cities_count': models.Count('countries__cities'),
+    }
@@ -0,0 +1,83 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# Модели, которые только читаются на публичных страницах и терпят отставание реплики
+REPLICATED_MODELS = {'users.region', 'users.country', 'users.city', 'users.membershipcard'}
+
+
+class RoutingState:
+    """
+    Состояние на время запроса: pinned — читать с основной БД, wrote — была запись,
+    replica — реплика, выбранная для всех чтений запроса.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_state = ContextVar('replica_routing_state', default=None)
+
+
+def current_state():
+    state = _state.get()
+    if state is None:
+        # Вне запроса (команды, фоновая сборка снимка) чтения идут с основной БД:
+        # производные данные не должны собираться с отстающей реплики.
+        # Состояние своё у каждого потока и контекста, а не общее на модуль
+        state = RoutingState(pinned=True)
+        _state.set(state)
+    return state
+
+
+def pin_primary():
+    """Остаток запроса читает с основной БД."""
+    current_state().pinned = True
+
+
+def begin(pinned=False):
+    """Новое состояние для запроса; вернуть токен в end()."""
+    return _state.set(RoutingState(pinned))
+
+
+def end(token):
+    _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение REPLICATED_MODELS — со случайной реплики из DATABASE_REPLICAS,
+    всё остальное и любые записи — с основной БД.
+    Запись закрепляет за основной БД все последующие чтения того же запроса
+    (read-your-writes); между запросами это делает ReplicaStickinessMiddleware.
+    Без реплик роутер ничего не меняет.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in REPLICATED_MODELS:
+            return 'default'
+        state = current_state()
+        if state.pinned:
+            return 'default'
+        # Одна реплика на запрос: у разных реплик разное отставание, смешивать их нельзя
+        if state.replica not in replicas:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current_state()
+        state.pinned = state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и на основной БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему на реплики приносит репликация
+        return False if db in settings.DATABASE_REPLICAS else None
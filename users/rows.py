@@ -0,0 +1,215 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.shortcuts import get_object_or_404
+from rest_framework import serializers
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .renderers import FastJSONRenderer, orjson
+
+
+# to_representation этих полей для значений из values() ничего не меняет
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+    serializers.JSONField, serializers.PrimaryKeyRelatedField,
+)
+VALUE, ALWAYS, RELATED = range(3)
+# JSON-колонки читаются текстом и разбираются orjson: JSONField.from_db_value идёт через json.loads
+load_json = orjson.loads if orjson is not None else json.loads
+
+
+class Column:
+    """SerializerMethodField, который читает колонку: convert(значение), в том числе для None."""
+
+    def __init__(self, column, convert):
+        self.column = column
+        self.convert = convert
+
+
+class RelatedList:
+    """SerializerMethodField со списком значений колонки связанных объектов."""
+
+    def __init__(self, relation, column):
+        self.relation = relation
+        self.column = column
+
+
+def or_zero(value):
+    return value or 0
+
+
+# ---------- ROW SERIALIZER ----------
+class RowSerializer:
+    """
+    Только чтение: те же словари, что и у ModelSerializer, но из строк values(),
+    без экземпляров моделей и полей DRF на каждый объект.
+    Вложенные сериализаторы и Meta.row_fields (Column/RelatedList для
+    SerializerMethodField) догружаются одним запросом на связь.
+    """
+
+    def __init__(self, serializer):
+        serializer = getattr(serializer, 'child', serializer)
+        self.model = serializer.Meta.model
+        opts = self.model._meta
+        self.pk = opts.pk.name
+        self.columns = [self.pk]
+        self.expressions = {}
+        self.plan = []     # (имя, колонка или связь, convert, режим)
+        self.related = {}  # связь -> (FK в связанной модели, RowSerializer или колонка)
+        row_fields = getattr(serializer.Meta, 'row_fields', {})
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            spec = row_fields.get(name)
+            if isinstance(spec, Column):
+                self.add_column(spec.column)
+                self.plan.append((name, spec.column, spec.convert, ALWAYS))
+            elif isinstance(spec, RelatedList) or isinstance(field, serializers.BaseSerializer):
+                relation = spec.relation if spec else field.source
+                remote = opts.get_field(relation)
+                if remote.many_to_one or remote.one_to_one:
+                    raise ImproperlyConfigured(f"{type(serializer).__name__}.{name}: поддерживаются только обратные связи")
+                target = spec.column if spec else RowSerializer(field)
+                self.related[relation] = (remote.field.name, target)
+                self.plan.append((name, relation, None, RELATED))
+            elif isinstance(field, serializers.SerializerMethodField) or '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(f"{type(serializer).__name__}.{name}: опишите поле в Meta.row_fields")
+            elif isinstance(field, serializers.JSONField) and opts.get_field(field.source).get_internal_type() == 'JSONField':
+                alias = f'_{field.source}_json'
+                self.expressions[alias] = Cast(field.source, TextField())
+                self.plan.append((name, alias, load_json, VALUE))
+            else:
+                self.add_column(field.source)
+                convert = None if isinstance(field, PASSTHROUGH_FIELDS) else field.to_representation
+                self.plan.append((name, field.source, convert, VALUE))
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def values(self, queryset, extra=()):
+        columns = [*self.columns, *(column for column in extra if column not in self.columns)]
+        return queryset.prefetch_related(None).values(*columns, **self.expressions)
+
+    def related_querysets(self, rows):
+        ids = [row[self.pk] for row in rows]
+        for relation, (foreign_key, target) in self.related.items():
+            related_model = self.model._meta.get_field(relation).related_model
+            queryset = related_model.objects.filter(**{f'{foreign_key}__in': ids}).order_by('pk')
+            if isinstance(target, RowSerializer):
+                yield relation, foreign_key, target, target.values(queryset, extra=[foreign_key])
+            else:
+                yield relation, foreign_key, None, queryset.values_list(foreign_key, target)
+
+    def fetch_related(self, rows):
+        groups = {}
+        for relation, foreign_key, target, queryset in self.related_querysets(rows):
+            grouped = groups[relation] = defaultdict(list)
+            if target is not None:
+                children = list(queryset)
+                for child, data in zip(children, target.serialize(children)):
+                    grouped[child[foreign_key]].append(data)
+            else:
+                for parent_id, value in queryset:
+                    grouped[parent_id].append(value)
+        return groups
+
+    async def afetch_related(self, rows):
+        groups = {}
+        for relation, foreign_key, target, queryset in self.related_querysets(rows):
+            grouped = groups[relation] = defaultdict(list)
+            if target is not None:
+                children = [child async for child in queryset]
+                for child, data in zip(children, await target.aserialize(children)):
+                    grouped[child[foreign_key]].append(data)
+            else:
+                async for parent_id, value in queryset:
+                    grouped[parent_id].append(value)
+        return groups
+
+    def serialize(self, rows):
+        rows = list(rows)
+        return self.build(rows, self.fetch_related(rows) if self.related and rows else {})
+
+    async def aserialize(self, rows):
+        """serialize() для асинхронных вьюх: rows — уже прочитанный список."""
+        return self.build(rows, await self.afetch_related(rows) if self.related and rows else {})
+
+    def build(self, rows, groups):
+        pk = self.pk
+        result = []
+        for row in rows:
+            item = {}
+            for name, source, convert, mode in self.plan:
+                if mode == RELATED:
+                    item[name] = groups[source].get(row[pk], [])
+                    continue
+                value = row[source]
+                if mode == ALWAYS:
+                    value = convert(value)
+                elif convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            result.append(item)
+        return result
+
+
+_row_serializers = {}
+
+
+def row_serializer_for(serializer_class):
+    if serializer_class not in _row_serializers:
+        _row_serializers[serializer_class] = RowSerializer(serializer_class())
+    return _row_serializers[serializer_class]
+
+
+# ---------- VIEW ----------
+class FastSerializationMixin:
+    """
+    Списки и детали каталога через RowSerializer и orjson вместо ModelSerializer.
+    ?fields/?expand, браузерный API и CATALOG_FAST_SERIALIZATION = False
+    идут обычным путём DRF; результат одинаковый байт в байт. Ставится вместе
+    с SparseFieldsViewMixin: ?fields/?expand разбирает он же (is_sparse).
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_renderers(self):
+        if not getattr(settings, 'CATALOG_FAST_SERIALIZATION', True):
+            return [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+        return super().get_renderers()
+
+    def use_fast_path(self):
+        return (
+            getattr(settings, 'CATALOG_FAST_SERIALIZATION', True)
+            and self.request.accepted_renderer.format == 'json'
+            and not self.is_sparse()
+        )
+
+    def fast_rows(self):
+        rows = row_serializer_for(self.get_serializer_class())
+        ordering = [field for field in getattr(self, 'ordering_fields', {}).values() if field != 'pk']
+        return rows, rows.values(self.filter_queryset(self.get_queryset()), extra=ordering)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_path():
+            return super().list(request, *args, **kwargs)
+        rows, queryset = self.fast_rows()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page))
+        return Response(rows.serialize(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_path():
+            return super().retrieve(request, *args, **kwargs)
+        rows, queryset = self.fast_rows()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return Response(rows.serialize([row])[0])
@@ -0,0 +1,170 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import SearchDocument, Region, Country, City
+
+
+# Имена объектов, созданных миграцией 0016
+FTS_TABLE = 'users_searchdocument_fts'
+# Вес названия выше, чем у описания, достопримечательностей и т. п.
+NAME_WEIGHT, TEXT_WEIGHT = 10.0, 1.0
+PG_CONFIG = 'simple'
+# Выражение должно совпадать с GIN-индексом из миграции, иначе индекс не используется
+PG_VECTOR = (
+    f"(setweight(to_tsvector('{PG_CONFIG}', name), 'A') || setweight(to_tsvector('{PG_CONFIG}', text), 'B'))"
+)
+
+MAX_TERMS = 8
+INDEXED_FIELDS = {'name', 'description', 'highlights', 'attractions'}
+SEARCH_MODELS = {
+    SearchDocument.Kind.REGION: Region,
+    SearchDocument.Kind.COUNTRY: Country,
+    SearchDocument.Kind.CITY: City,
+}
+KIND_BY_MODEL = {model: kind for kind, model in SEARCH_MODELS.items()}
+
+
+# ---------- DOCUMENTS ----------
+def flatten(value):
+    """Строки из JSON-полей highlights/attractions: списки строк или словарей."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from flatten(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from flatten(item)
+
+
+def build_document(instance, kind=None):
+    parts = [instance.description]
+    for field in ('highlights', 'attractions'):
+        parts.extend(flatten(getattr(instance, field, None)))
+    return SearchDocument(
+        kind=kind or KIND_BY_MODEL[type(instance)],
+        object_id=instance.pk,
+        name=instance.name,
+        text='\n'.join(part for part in parts if part),
+    )
+
+
+def index_object(instance):
+    document = build_document(instance)
+    SearchDocument.objects.update_or_create(
+        kind=document.kind, object_id=document.object_id,
+        defaults={'name': document.name, 'text': document.text},
+    )
+
+
+def unindex_object(instance):
+    SearchDocument.objects.filter(kind=KIND_BY_MODEL[type(instance)], object_id=instance.pk).delete()
+
+
+def rebuild(chunk_size=2000):
+    """Пересобирает все документы; возвращает {kind: количество}."""
+    counts = {}
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for kind, model in SEARCH_MODELS.items():
+            fields = [field for field in ('id', 'name', 'description', 'highlights', 'attractions')
+                      if hasattr(model, field)]
+            documents = []
+            counts[kind] = 0
+            for instance in model.objects.only(*fields).order_by('pk').iterator(chunk_size=chunk_size):
+                documents.append(build_document(instance, kind))
+                if len(documents) >= chunk_size:
+                    counts[kind] += len(SearchDocument.objects.bulk_create(documents))
+                    documents = []
+            counts[kind] += len(SearchDocument.objects.bulk_create(documents))
+    optimize()
+    return counts
+
+
+def optimize():
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+# ---------- QUERY ----------
+def parse_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+class SearchResults:
+    """
+    Ленивый результат поиска: запрос выполняется при срезе results[a:b],
+    как у QuerySet, поэтому пагинация забирает только свою страницу.
+    Строки — словари {'type', 'id', 'name', 'rank'}, выше rank — релевантнее.
+    """
+
+    def __init__(self, query, kinds=None):
+        self.terms = parse_terms(query)
+        self.kinds = list(kinds or [])
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step:
+            raise TypeError("Поддерживаются только срезы без шага")
+        offset = item.start or 0
+        if not self.terms or (item.stop is not None and item.stop <= offset):
+            return []
+        limit = None if item.stop is None else item.stop - offset
+        return self.fetch(limit, offset)
+
+    def fetch(self, limit, offset):
+        if connection.vendor == 'sqlite':
+            sql, params = self.sqlite_sql()
+        elif connection.vendor == 'postgresql':
+            sql, params = self.postgres_sql()
+        else:
+            return self.fallback(limit, offset)
+        # В SQLite LIMIT -1 — без ограничения, в Postgres — LIMIT NULL
+        params += [-1 if limit is None and connection.vendor == 'sqlite' else limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [
+                {'type': kind, 'id': object_id, 'name': name, 'rank': round(rank, 6)}
+                for kind, object_id, name, rank in cursor.fetchall()
+            ]
+
+    def kinds_sql(self, column):
+        if not self.kinds:
+            return '', []
+        return f" AND {column} IN ({', '.join(['%s'] * len(self.kinds))})", list(self.kinds)
+
+    def sqlite_sql(self):
+        # Каждое слово — префиксный запрос, слова объединяются по И.
+        # Ранжирование и LIMIT внутри FTS, с документами соединяется только страница
+        match = ' '.join(f'"{term}"*' for term in self.terms)
+        kinds, params = self.kinds_sql('kind')
+        sql = (
+            f"SELECT d.kind, d.object_id, d.name, -page.score FROM ("
+            f"SELECT rowid, bm25({FTS_TABLE}, {NAME_WEIGHT}, {TEXT_WEIGHT}, 0) AS score FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s{kinds} ORDER BY score, rowid LIMIT %s OFFSET %s"
+            f") page JOIN users_searchdocument d ON d.id = page.rowid ORDER BY page.score, page.rowid"
+        )
+        return sql, [match, *params]
+
+    def postgres_sql(self):
+        query = ' & '.join(f'{term}:*' for term in self.terms)
+        kinds, params = self.kinds_sql('d.kind')
+        sql = (
+            f"SELECT d.kind, d.object_id, d.name, ts_rank({PG_VECTOR}, to_tsquery('{PG_CONFIG}', %s)) AS rank "
+            f"FROM users_searchdocument d WHERE {PG_VECTOR} @@ to_tsquery('{PG_CONFIG}', %s){kinds} "
+            f"ORDER BY rank DESC, d.id LIMIT %s OFFSET %s"
+        )
+        return sql, [query, query, *params]
+
+    def fallback(self, limit, offset):
+        # Другие СУБД: без индекса и ранжирования, только совпадение подстрок
+        documents = SearchDocument.objects.order_by('pk')
+        for term in self.terms:
+            documents = documents.filter(Q(name__icontains=term) | Q(text__icontains=term))
+        if self.kinds:
+            documents = documents.filter(kind__in=self.kinds)
+        rows = documents.values_list('kind', 'object_id', 'name')
+        rows = rows[offset:] if limit is None else rows[offset:offset + limit]
+        return [{'type': kind, 'id': object_id, 'name': name, 'rank': 0.0} for kind, object_id, name in rows]
@@ -1,6 +1,12 @@
 from django.db import models
 from rest_framework import serializers
-from .models import User, MembershipCard, UserMembership, Region, Country, City, BonusHistory
+from .models import User, MembershipCard, UserMembership, Region, Country, City, Tour, BonusHistory
+from . import services
+from .fieldsets import SparseFieldsMixin
+from .rows import Column, RelatedList, or_zero
+
+
+RECENT_BONUSES_LIMIT = 10
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -25,7 +31,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'email', 'first_name', 'last_name', 'ref_id', 'balance', 'referrer']
 
 
-class MembershipCardSerializer(serializers.ModelSerializer):
+class MembershipCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MembershipCard
         fields = [
@@ -60,6 +66,16 @@ class UserMembershipSerializer(serializers.ModelSerializer):
             "is_active",
         ]
 
+class TourSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tour
+        fields = ['id', 'city', 'title', 'price', 'created_at']
+        read_only_fields = ['price', 'created_at']
+
+    def create(self, validated_data):
+        return services.book_tour(self.context['request'].user, validated_data['city'], validated_data['title'])
+
+
 class BonusHistorySerializer(serializers.ModelSerializer):
     tour_title = serializers.CharField(source='tour.title', read_only=True)
 
@@ -68,12 +84,23 @@ class BonusHistorySerializer(serializers.ModelSerializer):
         fields = ['id', 'referrer', 'referred_user', 'tour', 'tour_title', 'amount', 'created_at']
 
 
+class BonusTotalsSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
 class ProfileSerializer(serializers.ModelSerializer):
-    user_memberships = UserMembershipSerializer(many=True, read_only=True)
+    """
+    Разделы профиля читаются из context['sections'], если вьюха загрузила их
+    заранее (асинхронный ProfileView, users/async_views.py), иначе — здесь же.
+    Запросы разделов описаны в классе один раз для обоих путей.
+    """
+    user_memberships = serializers.SerializerMethodField()
     active_membership = serializers.SerializerMethodField()
     total_referrals = serializers.SerializerMethodField()
     referral_users = serializers.SerializerMethodField()
     bonus_history = serializers.SerializerMethodField()
+    bonus_totals = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -89,19 +116,45 @@ class ProfileSerializer(serializers.ModelSerializer):
             'user_memberships',
             'referral_users',
             'bonus_history',
+            'bonus_totals',
         ]
 
+    # ---------- SECTION QUERIES ----------
+    @staticmethod
+    def memberships_queryset():
+        return UserMembership.objects.select_related('card')
+
+    @staticmethod
+    def referral_users_queryset(obj):
+        return obj.referrals.filter(tours__isnull=False).distinct()
+
+    @staticmethod
+    def bonus_history_queryset(obj):
+        # Только последние записи, полная история — /user/bonuses/
+        return obj.bonuses_received.select_related('tour').order_by('-created_at', '-pk')[:RECENT_BONUSES_LIMIT]
+
+    BONUS_TOTALS = {'count': models.Count('id'), 'amount': models.Sum('amount')}
+
+    def section(self, name, load):
+        sections = self.context.get('sections')
+        return sections[name] if sections is not None else load()
+
+    # ---------- FIELDS ----------
+    def get_user_memberships(self, obj):
+        memberships = self.section('user_memberships', lambda: obj.user_memberships.all())
+        return UserMembershipSerializer(memberships, many=True).data
+
     def get_active_membership(self, obj):
-        active_membership = obj.user_memberships.filter(is_active=True).first()
+        active_membership = self.section('active_membership', lambda: services.current_membership(obj))
         if active_membership:
             return UserMembershipSerializer(active_membership).data
         return None
 
     def get_total_referrals(self, obj):
-        return obj.referrals.count()
+        return self.section('total_referrals', lambda: obj.referrals.count())
 
     def get_referral_users(self, obj):
-        active_referrals = obj.referrals.filter(tours__isnull=False).distinct()
+        active_referrals = self.section('referral_users', lambda: self.referral_users_queryset(obj))
         return [
             {
                 'id': u.id,
@@ -111,21 +164,27 @@ class ProfileSerializer(serializers.ModelSerializer):
         ]
 
     def get_bonus_history(self, obj):
-        bonuses = BonusHistory.objects.filter(referrer=obj).order_by('-created_at')
+        bonuses = self.section('bonus_history', lambda: self.bonus_history_queryset(obj))
         return BonusHistorySerializer(bonuses, many=True).data
-    
+
+    def get_bonus_totals(self, obj):
+        totals = self.section('bonus_totals', lambda: obj.bonuses_received.aggregate(**self.BONUS_TOTALS))
+        totals = {**totals, 'amount': totals['amount'] or 0}
+        return BonusTotalsSerializer(totals).data
+
 
 # ---------- CITY SERIALIZER ----------
-class CitySerializer(serializers.ModelSerializer):
+class CitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = City
         fields = [
             'id', 'name', 'description', 'price', 'image', 'highlights', 
             'best_time', 'attractions', 'rating'
         ]
+        expandable = {'country': ('CountryListSerializer', False)}
 
 # ---------- COUNTRY SERIALIZERS ----------
-class CountrySerializer(serializers.ModelSerializer):
+class CountrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     cities = CitySerializer(many=True, read_only=True)
     max_rating = serializers.SerializerMethodField()
     min_price = serializers.SerializerMethodField()
@@ -137,15 +196,17 @@ class CountrySerializer(serializers.ModelSerializer):
             'population', 'language', 'currency', 'best_time', 
             'highlights', 'cities', 'region', 'max_rating', 'min_price'
         ]
+        expandable = {'region': ('RegionListSerializer', False)}
+        row_fields = {'max_rating': Column('max_rating', or_zero), 'min_price': Column('min_price', or_zero)}
 
     def get_max_rating(self, obj):
-        return obj.cities.aggregate(models.Max('rating'))['rating__max'] or 0
+        return obj.max_rating or 0
 
     def get_min_price(self, obj):
-        return obj.cities.aggregate(models.Min('price'))['price__min'] or 0
+        return obj.min_price or 0
 
 
-class CountryListSerializer(serializers.ModelSerializer):
+class CountryListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     max_rating = serializers.SerializerMethodField()
     min_price = serializers.SerializerMethodField()
 
@@ -156,16 +217,18 @@ class CountryListSerializer(serializers.ModelSerializer):
             'language', 'currency', 'best_time', 'highlights', 'region',
             'max_rating', 'min_price'
         ]
+        expandable = {'cities': (CitySerializer, True), 'region': ('RegionListSerializer', False)}
+        row_fields = {'max_rating': Column('max_rating', or_zero), 'min_price': Column('min_price', or_zero)}
 
     def get_max_rating(self, obj):
-        return obj.cities.aggregate(models.Max('rating'))['rating__max'] or 0
+        return obj.max_rating or 0
 
     def get_min_price(self, obj):
-        return obj.cities.aggregate(models.Min('price'))['price__min'] or 0
+        return obj.min_price or 0
 
 
 # ---------- REGION SERIALIZERS ----------
-class RegionSerializer(serializers.ModelSerializer):
+class RegionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     countries = CountryListSerializer(many=True, read_only=True)
     max_rating = serializers.SerializerMethodField()
     min_price = serializers.SerializerMethodField()
@@ -176,15 +239,16 @@ class RegionSerializer(serializers.ModelSerializer):
             'id', 'name', 'display_name', 'description', 'image',
             'countries', 'highlights', 'best_time', 'max_rating', 'min_price'
         ]
+        row_fields = {'max_rating': Column('max_rating', or_zero), 'min_price': Column('min_price', or_zero)}
 
     def get_max_rating(self, obj):
-        return City.objects.filter(country__region=obj).aggregate(models.Max('rating'))['rating__max'] or 0
+        return obj.max_rating or 0
 
     def get_min_price(self, obj):
-        return City.objects.filter(country__region=obj).aggregate(models.Min('price'))['price__min'] or 0
+        return obj.min_price or 0
 
 
-class RegionListSerializer(serializers.ModelSerializer):
+class RegionListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     countries_names = serializers.SerializerMethodField()
     max_rating = serializers.SerializerMethodField()
     min_price = serializers.SerializerMethodField()
@@ -195,12 +259,32 @@ class RegionListSerializer(serializers.ModelSerializer):
             'id', 'name', 'display_name', 'description', 'image', 'highlights',
             'best_time', 'countries_names', 'max_rating', 'min_price'
         ]
+        expandable = {'countries': (CountryListSerializer, True)}
+        method_columns = {'countries_names': ('countries', ['name'])}
+        row_fields = {
+            'countries_names': RelatedList('countries', 'name'),
+            'max_rating': Column('max_rating', or_zero),
+            'min_price': Column('min_price', or_zero),
+        }
 
     def get_countries_names(self, obj):
-        return list(obj.countries.values_list('name', flat=True))
+        return [country.name for country in obj.countries.all()]
 
     def get_max_rating(self, obj):
-        return City.objects.filter(country__region=obj).aggregate(models.Max('rating'))['rating__max'] or 0
+        return obj.max_rating or 0
 
     def get_min_price(self, obj):
-        return City.objects.filter(country__region=obj).aggregate(models.Min('price'))['price__min'] or 0
+        return obj.min_price or 0
+
+
+class CatalogSnapshotSerializer(RegionSerializer):
+    """Регион со странами и их городами — для /catalog/snapshot/."""
+    countries = CountrySerializer(many=True, read_only=True)
+
+
+# ---------- SEARCH SERIALIZER ----------
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    rank = serializers.FloatField()
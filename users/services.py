@@ -0,0 +1,117 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .cache import get_versions, model_scope
+from .models import MembershipCard, UserMembership, Tour
+
+
+# ---------- CURRENT MEMBERSHIP ----------
+MEMBERSHIP_CACHE_PREFIX = 'membership:current:'
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+NO_MEMBERSHIP = 'none'
+
+
+def membership_cache_key(user_id):
+    # Версия карт в ключе: изменение любой MembershipCard сбрасывает все записи
+    card_version, = get_versions([model_scope(MembershipCard)])
+    return f'{MEMBERSHIP_CACHE_PREFIX}{user_id}:{card_version}'
+
+
+def current_membership(user):
+    """
+    Действующая карта пользователя вместе с MembershipCard.
+    Запоминается на объекте пользователя на время запроса и в кэше Django
+    до изменения карт пользователя (см. forget_current_membership).
+    """
+    if hasattr(user, '_current_membership'):
+        return user._current_membership
+
+    key = membership_cache_key(user.pk)
+    membership = cache.get(key)
+    if membership is None:
+        membership = (
+            UserMembership.objects.select_related('card')
+            .filter(user_id=user.pk, is_active=True)
+            .order_by('-end_date')
+            .first()
+        )
+        cache.set(key, membership or NO_MEMBERSHIP, MEMBERSHIP_CACHE_TIMEOUT)
+    elif membership == NO_MEMBERSHIP:
+        membership = None
+
+    user._current_membership = membership
+    return membership
+
+
+async def acurrent_membership(user):
+    """Асинхронный current_membership: тот же кэш и то же запоминание на объекте."""
+    if hasattr(user, '_current_membership'):
+        return user._current_membership
+
+    key = membership_cache_key(user.pk)
+    membership = await cache.aget(key)
+    if membership is None:
+        membership = await (
+            UserMembership.objects.select_related('card')
+            .filter(user_id=user.pk, is_active=True)
+            .order_by('-end_date')
+            .afirst()
+        )
+        await cache.aset(key, membership or NO_MEMBERSHIP, MEMBERSHIP_CACHE_TIMEOUT)
+    elif membership == NO_MEMBERSHIP:
+        membership = None
+
+    user._current_membership = membership
+    return membership
+
+
+def forget_current_membership(*user_ids):
+    def _forget():
+        cache.delete_many([membership_cache_key(user_id) for user_id in user_ids])
+
+    # Сразу и после коммита, как forget_auth_user: иначе параллельный запрос может
+    # закэшировать карту с used_tours до фиксации транзакции бронирования
+    _forget()
+    if not transaction.get_autocommit():
+        transaction.on_commit(_forget)
+
+
+# ---------- TOUR PRICING ----------
+def claim_discount(membership):
+    """
+    Забирает один скидочный тур карты и возвращает процент скидки.
+    Счётчик увеличивается условным UPDATE ... WHERE used_tours < лимит,
+    поэтому параллельные бронирования не получат больше скидок, чем есть в карте.
+    """
+    card = membership.card
+    tiers = [
+        (card.discount_tours, card.discount_percent),
+        (card.discount_tours + card.extra_discount_tours, card.extra_discount_percent),
+    ]
+    for limit, percent in tiers:
+        eligible = UserMembership.objects.filter(pk=membership.pk, used_tours__lt=limit)
+        if percent <= 0:
+            # Уровень без скидки тур не расходует, как и раньше
+            if eligible.exists():
+                return 0
+            continue
+        if eligible.update(used_tours=F('used_tours') + 1):
+            forget_current_membership(membership.user_id)
+            return percent
+    return 0
+
+
+def tour_price(user, city):
+    """Цена тура с учётом скидки карты; вызывать внутри транзакции бронирования."""
+    membership = current_membership(user)
+    discount = claim_discount(membership) if membership else 0
+    return Decimal(city.price) * (100 - discount) / 100
+
+
+# ---------- BOOKING ----------
+def book_tour(user, city, title):
+    with transaction.atomic():
+        return Tour.objects.create(user=user, city=city, title=title)
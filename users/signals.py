@@ -0,0 +1,143 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import cache, rollups, search, services, snapshot
+from .authentication import forget_auth_user
+from .cache import model_scope
+from .models import User, BalanceEntry, MembershipCard, UserMembership, Region, Country, City
+
+
+# ---------- PREVIOUS STATE ----------
+@receiver(pre_save, sender=City)
+def remember_city_state(sender, instance, raw=False, **kwargs):
+    instance._catalog_previous = None
+    if instance.pk and not raw:
+        instance._catalog_previous = City.objects.filter(pk=instance.pk).values('country_id', 'price', 'rating').first()
+
+
+@receiver(pre_save, sender=Country)
+def remember_country_region(sender, instance, raw=False, **kwargs):
+    instance._catalog_region_id = None
+    if instance.pk and not raw:
+        instance._catalog_region_id = Country.objects.filter(pk=instance.pk).values_list('region_id', flat=True).first()
+
+
+# ---------- CATALOG ROLLUPS ----------
+@receiver(post_save, sender=City)
+def update_rollups_on_city_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_catalog_previous', None)
+    if created or previous is None:
+        rollups.add_city(instance)
+    elif previous != {'country_id': instance.country_id, 'price': instance.price, 'rating': instance.rating}:
+        rollups.refresh_countries(previous['country_id'], instance.country_id)
+
+
+@receiver(post_delete, sender=City)
+def update_rollups_on_city_delete(sender, instance, **kwargs):
+    rollups.refresh_countries(instance.country_id)
+
+
+@receiver(post_save, sender=Country)
+def update_rollups_on_country_move(sender, instance, raw=False, **kwargs):
+    previous_region_id = getattr(instance, '_catalog_region_id', None)
+    if not raw and previous_region_id and previous_region_id != instance.region_id:
+        rollups.refresh_region(previous_region_id)
+        rollups.refresh_region(instance.region_id)
+
+
+@receiver(post_delete, sender=Country)
+def update_rollups_on_country_delete(sender, instance, **kwargs):
+    rollups.refresh_region(instance.region_id)
+
+
+# ---------- CATALOG CACHE ----------
+def invalidate_countries(*country_ids):
+    country_ids = {pk for pk in country_ids if pk is not None}
+    region_ids = set(Country.objects.filter(pk__in=country_ids).values_list('region_id', flat=True))
+    cache.bump(
+        model_scope(Country), model_scope(Region),
+        *(model_scope(Country, pk) for pk in country_ids),
+        *(model_scope(Region, pk) for pk in region_ids),
+    )
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_city(sender, instance, **kwargs):
+    previous = getattr(instance, '_catalog_previous', None) or {}
+    cache.bump(model_scope(City), model_scope(City, instance.pk))
+    invalidate_countries(instance.country_id, previous.get('country_id'))
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_country(sender, instance, **kwargs):
+    region_ids = {instance.region_id, getattr(instance, '_catalog_region_id', None)} - {None}
+    cache.bump(
+        model_scope(Country), model_scope(Country, instance.pk), model_scope(Region),
+        *(model_scope(Region, pk) for pk in region_ids),
+    )
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+def invalidate_region(sender, instance, **kwargs):
+    cache.bump(model_scope(Region), model_scope(Region, instance.pk))
+
+
+@receiver(post_save, sender=MembershipCard)
+@receiver(post_delete, sender=MembershipCard)
+def invalidate_cards(sender, instance, **kwargs):
+    cache.bump(model_scope(MembershipCard))
+
+
+# ---------- CURRENT MEMBERSHIP ----------
+@receiver(post_save, sender=UserMembership)
+@receiver(post_delete, sender=UserMembership)
+def forget_current_membership(sender, instance, **kwargs):
+    services.forget_current_membership(instance.user_id)
+
+
+# ---------- SEARCH INDEX ----------
+@receiver(post_save, sender=Region)
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=City)
+def update_search_document(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not search.INDEXED_FIELDS & set(update_fields)):
+        return
+    search.index_object(instance)
+
+
+@receiver(post_delete, sender=Region)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=City)
+def remove_search_document(sender, instance, **kwargs):
+    search.unindex_object(instance)
+
+
+# ---------- CATALOG SNAPSHOT ----------
+@receiver(post_save, sender=Region)
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=Region)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=City)
+def mark_catalog_snapshot_stale(sender, raw=False, **kwargs):
+    if not raw:
+        snapshot.mark_stale()
+
+
+# ---------- AUTH USER CACHE ----------
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_auth_user(instance.pk)
+
+
+@receiver(post_save, sender=BalanceEntry)
+def forget_cached_balance(sender, instance, created, **kwargs):
+    # BalanceEntry.post меняет User.balance через UPDATE, без сигнала User
+    if created:
+        forget_auth_user(instance.user_id)
@@ -0,0 +1,176 @@
+"""
+Журнал медленных SQL (включается SLOW_QUERY_LOG, см. SlowQueryMiddleware).
+Запросы дольше SLOW_QUERY_THRESHOLD_MS пишутся JSON-строками в ротируемый файл
+SLOW_QUERY_LOG_FILE: отпечаток SQL, маршрут, место вызова в коде и план запроса.
+Отчёт в админке (/admin/slow-queries/) группирует записи по отпечатку.
+Параметры запросов не пишутся: в них бывают персональные данные.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .querybudget import fingerprint, project_frames
+
+logger = logging.getLogger('users.slow_queries')
+_handler_lock = threading.Lock()
+# Отпечатки, план которых этот процесс уже записал: EXPLAIN на каждый медленный запрос удвоил бы нагрузку
+_explained = set()
+EXPLAINED_LIMIT = 10_000
+FULL_SCAN = re.compile(r'^SCAN \S+$|Seq Scan', re.M)
+
+
+def log_path():
+    return Path(settings.SLOW_QUERY_LOG_FILE)
+
+
+def get_logger():
+    """Логгер с RotatingFileHandler на SLOW_QUERY_LOG_FILE; файл меняется вместе с настройкой."""
+    path = log_path()
+    with _handler_lock:
+        handler = logger.handlers[0] if logger.handlers else None
+        if handler is None or handler.baseFilename != str(path.resolve()):
+            if handler is not None:
+                logger.removeHandler(handler)
+                handler.close()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # При нескольких воркерах ротирует тот, кто переполнил файл; строки в момент ротации
+            # могут потеряться — для диагностики это допустимо
+            handler = RotatingFileHandler(
+                path, maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES, backupCount=settings.SLOW_QUERY_LOG_BACKUPS,
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+    return logger
+
+
+@dataclass
+class SlowQuery:
+    sql: str
+    params: object
+    many: bool
+    duration: float
+    alias: str
+    origin: list
+
+
+class SlowQueryRecorder:
+    """
+    execute_wrapper для всех БД: запоминает запросы дольше threshold секунд.
+    EXPLAIN и запись в журнал — в flush(), после ответа: внутри обёртки курсор
+    ещё не прочитан вызывающим кодом.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.slow = []
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                origin = project_frames(5, skip=(__file__,))
+                self.slow.append(SlowQuery(sql, params, many, duration, context['connection'].alias, origin))
+
+    def flush(self, view):
+        log = get_logger()
+        for query in self.slow:
+            key = fingerprint(query.sql)
+            plan = None
+            if key not in _explained and not query.many:
+                plan = explain(query.alias, query.sql, query.params)
+                if len(_explained) >= EXPLAINED_LIMIT:
+                    _explained.clear()
+                _explained.add(key)
+            log.info(json.dumps({
+                'time': timezone.now().isoformat(),
+                'fingerprint': key,
+                'duration_ms': round(query.duration * 1000, 2),
+                'view': view,
+                'alias': query.alias,
+                'origin': query.origin,
+                'plan': plan,
+            }, ensure_ascii=False))
+        self.slow = []
+
+
+def explain(alias, sql, params):
+    """План запроса: EXPLAIN QUERY PLAN для SQLite, EXPLAIN для остальных; только для чтения."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    connection = connections[alias]
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            # У SQLite текст узла в последней колонке, у PostgreSQL колонка одна
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as exc:
+        return f"EXPLAIN не выполнен: {exc}"
+
+
+# ---------- REPORT ----------
+def read_records():
+    path = log_path()
+    files = [path.with_name(f'{path.name}.{n}') for n in range(settings.SLOW_QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    for file in files:
+        if not file.exists():
+            continue
+        with file.open(encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:  # строка, оборванная ротацией
+                    continue
+
+
+def report(limit=100):
+    """Группы по отпечатку SQL, самые затратные по суммарному времени — первыми."""
+    groups = {}
+    for record in read_records():
+        group = groups.setdefault(record['fingerprint'], {
+            'fingerprint': record['fingerprint'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'views': Counter(), 'origins': Counter(), 'plan': None, 'last_seen': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+        group['views'][record['view']] += 1
+        group['origins'][' ← '.join(reversed(record['origin']))] += 1
+        group['plan'] = record['plan'] or group['plan']
+        group['last_seen'] = record['time']
+
+    rows = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:limit]
+    for group in rows:
+        group['total_ms'] = round(group['total_ms'], 2)
+        group['mean_ms'] = round(group['total_ms'] / group['count'], 2)
+        group['views'] = group['views'].most_common()
+        group['origins'] = group['origins'].most_common(3)
+        # Полный проход по таблице — кандидат на индекс
+        group['full_scan'] = bool(group['plan'] and FULL_SCAN.search(group['plan']))
+    return rows
@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Region
+from .renderers import FastJSONRenderer
+from .rows import row_serializer_for
+
+try:
+    import brotli
+except ImportError:  # без brotli отдаём только gzip
+    brotli = None
+
+
+MANIFEST_NAME = 'current.json'
+VERSION_NAME = 'version'
+STALE_HEADER = 'X-Snapshot-Stale'
+KEEP_VERSIONS = 2
+# Порядок предпочтения при согласовании Accept-Encoding
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'CATALOG_SNAPSHOT_DIR', settings.BASE_DIR / 'var' / 'catalog'))
+
+
+# ---------- BUILD ----------
+def render_catalog():
+    from .serializers import CatalogSnapshotSerializer
+
+    rows = row_serializer_for(CatalogSnapshotSerializer)
+    regions = rows.serialize(rows.values(Region.objects.order_by('pk')))
+    return FastJSONRenderer().render({'regions': regions})
+
+
+def write_atomic(path, content):
+    # Своё имя временного файла у каждого писателя: mark_stale() из разных воркеров
+    # и сборка снимка пишут одновременно и не должны обрезать чужой файл
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp', delete=False) as file:
+        temporary = Path(file.name)
+        try:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+    try:
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+def build():
+    """
+    Собирает снимок каталога и сжатые копии, затем переключает манифест.
+    Файлы версии называются по хешу содержимого, поэтому читатель старой
+    версии не увидит наполовину записанный файл.
+    """
+    # Версия читается до сборки: правка во время сборки оставит снимок устаревшим
+    version = read_version()
+    content = render_catalog()
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    base = directory / f'catalog-{digest}.json'
+
+    if not base.exists():
+        write_atomic(base.with_name(base.name + '.gz'), gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_atomic(base.with_name(base.name + '.br'), brotli.compress(content, quality=11))
+        write_atomic(base, content)
+
+    manifest = {
+        'hash': digest, 'file': base.name, 'size': len(content), 'built_at': int(time.time()), 'version': version,
+    }
+    write_atomic(directory / MANIFEST_NAME, json.dumps(manifest).encode())
+    remove_old_versions(directory, keep=base.name)
+    return manifest
+
+
+def remove_old_versions(directory, keep):
+    versions = sorted(directory.glob('catalog-*.json'), key=lambda path: path.stat().st_mtime, reverse=True)
+    old = [path for path in versions if path.name != keep][KEEP_VERSIONS - 1:]
+    for path in old:
+        for suffix in ('', '.gz', '.br'):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+# ---------- READ ----------
+def read_manifest():
+    try:
+        return json.loads((snapshot_dir() / MANIFEST_NAME).read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+def choose_file(manifest, accept_encoding):
+    """Путь к файлу и Content-Encoding под Accept-Encoding клиента."""
+    base = snapshot_dir() / manifest['file']
+    accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+    for encoding, suffix in ENCODINGS:
+        path = base.with_name(base.name + suffix)
+        if encoding in accepted and path.exists():
+            return path, encoding
+    return base, None
+
+
+# ---------- STALENESS ----------
+# Версия каталога — файл рядом со снимком, а не память процесса: правки из shell
+# и команд тоже видны, а перезапуск воркеров не теряет несобранные изменения.
+# Снимок собирает команда build_catalog_snapshot (--watch или cron с --if-stale),
+# не веб-воркеры.
+def read_version():
+    try:
+        return (snapshot_dir() / VERSION_NAME).read_text()
+    except FileNotFoundError:
+        return ''
+
+
+def mark_stale():
+    """После коммита изменения каталога записывает новую версию: снимок с другой версией устарел."""
+    def write():
+        directory = snapshot_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        write_atomic(directory / VERSION_NAME, uuid.uuid4().hex.encode())
+
+    transaction.on_commit(write)
+
+
+def is_stale(manifest):
+    return manifest is None or manifest.get('version', '') != read_version()
@@ -1,3 +1,1403 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, authentication, benchmarks, middleware, profiling, refids, rollups, routers, search, services, slowqueries, snapshot, views
+from .management.commands import bench_api
+from .models import (
+    User, RefIdSequence, MembershipCard, UserMembership, Region, Country, City, Tour, BonusHistory, BonusMonthlyCounter, BalanceEntry, BalanceSnapshot,
+)
+from .dbprofile import database_settings
+from .querybudget import QueryLog, format_queries
+from .serializers import RECENT_BONUSES_LIMIT, CatalogSnapshotSerializer
+
+
+def make_catalog(regions=2, countries=2, cities=3, prefix=""):
+    for r in range(regions):
+        region = Region.objects.create(
+            name=f"{prefix}region-{r}", display_name=f"Region {r}", description="", image="https://example.com/r.jpg",
+            best_time="summer",
+        )
+        for c in range(countries):
+            country = Country.objects.create(
+                region=region, name=f"{prefix}country-{r}-{c}", description="", image="https://example.com/c.jpg",
+                capital="capital", population="1", language="uz", currency="UZS", best_time="spring",
+            )
+            for i in range(cities):
+                City.objects.create(
+                    country=country, name=f"city-{i}", description="", image="https://example.com/ct.jpg",
+                    price=100 * (i + 1) + r, best_time="autumn", rating=Decimal("3.5") + i,
+                )
+
+
+class BaseTestCase(TestCase):
+    """Кэш LocMem переживает откат транзакции теста, а id строк в SQLite переиспользуются."""
+
+    def setUp(self):
+        cache.clear()
+        refids.allocator.discard_block()
+        self.client = APIClient()
+
+
+# ---------- CATALOG ----------
+class CatalogListTests(BaseTestCase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_region_list_values(self):
+        make_catalog(regions=1, countries=2, cities=2)
+        Region.objects.create(name="empty", display_name="Empty", description="", image="https://e.com/e.jpg", best_time="-")
+        data = self.client.get('/api/regions/').json()
+        self.assertEqual(data[0]['countries_names'], ['country-0-0', 'country-0-1'])
+        self.assertEqual(data[0]['max_rating'], 4.5)
+        self.assertEqual(data[0]['min_price'], 100)
+        self.assertEqual(data[1]['countries_names'], [])
+        self.assertEqual(data[1]['max_rating'], 0)
+        self.assertEqual(data[1]['min_price'], 0)
+
+    def test_region_detail_values(self):
+        make_catalog(regions=1, countries=2, cities=2)
+        region = Region.objects.get()
+        data = self.client.get(f'/api/regions/{region.pk}/').json()
+        self.assertEqual(data['max_rating'], 4.5)
+        self.assertEqual([c['min_price'] for c in data['countries']], [100, 100])
+
+    def test_invalid_filter_values(self):
+        for url in ('/api/cities/', '/api/countries/'):
+            for value in ('NaN', 'Infinity', '-inf', 'abc'):
+                response = self.client.get(url, {'min_rating': value})
+                self.assertEqual(response.status_code, 400, f"{url} {value}")
+                self.assertIn('min_rating', response.json())
+
+        huge = '9' * 23
+        for url, param in (('/api/cities/', 'country'), ('/api/cities/', 'region'), ('/api/countries/', 'region'),
+                           ('/api/cities/', 'min_price')):
+            response = self.client.get(url, {param: huge})
+            self.assertEqual(response.status_code, 400, f"{url} {param}")
+            self.assertIn(param, response.json())
+        self.assertEqual(self.client.get('/api/cities/', {'country': str(2 ** 63 - 1)}).status_code, 200)
+
+    def test_catalog_query_count_is_constant(self):
+        make_catalog(regions=1, countries=1, cities=1)
+        region, country = Region.objects.get(), Country.objects.get()
+        urls = ['/api/regions/', '/api/countries/', f'/api/regions/{region.pk}/',
+                f'/api/countries/{country.pk}/', f'/api/regions/{region.pk}/countries/']
+        small = [self.count_queries(url) for url in urls]
+
+        make_catalog(regions=3, countries=3, cities=3, prefix="large-")
+        cache.clear()
+        large = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, large)
+
+
+class CatalogRollupTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=2, countries=1, cities=2)
+        self.country = Country.objects.get(name="country-0-0")
+        self.other = Country.objects.get(name="country-1-0")
+
+    def assertRollups(self, obj, min_price, max_price, max_rating, cities_count):
+        obj.refresh_from_db()
+        self.assertEqual(
+            (obj.min_price, obj.max_price, obj.max_rating, obj.cities_count),
+            (min_price, max_price, max_rating, cities_count),
+        )
+
+    def test_create_update_move_delete(self):
+        self.assertRollups(self.country, 100, 200, Decimal("4.5"), 2)
+        self.assertRollups(self.country.region, 100, 200, Decimal("4.5"), 2)
+
+        city = City.objects.create(country=self.country, name="new", description="", image="https://e.com/n.jpg",
+                                   price=50, best_time="-", rating=Decimal("5.0"))
+        self.assertRollups(self.country, 50, 200, Decimal("5.0"), 3)
+
+        city.price = 500
+        city.save()
+        self.assertRollups(self.country, 100, 500, Decimal("5.0"), 3)
+
+        city.country = self.other
+        city.save()
+        self.assertRollups(self.country, 100, 200, Decimal("4.5"), 2)
+        self.assertRollups(self.other, 101, 500, Decimal("5.0"), 3)
+        self.assertRollups(self.other.region, 101, 500, Decimal("5.0"), 3)
+
+        city.delete()
+        self.assertRollups(self.other, 101, 201, Decimal("4.5"), 2)
+
+        self.other.cities.all().delete()
+        self.assertRollups(self.other, None, None, None, 0)
+        self.assertRollups(self.other.region, None, None, None, 0)
+
+    def test_country_save_keeps_rollups(self):
+        stale = Country.objects.get(pk=self.country.pk)
+        City.objects.create(country=self.country, name="new", description="", image="https://e.com/n.jpg",
+                            price=10, best_time="-")
+        stale.capital = "other"
+        stale.save()
+        self.assertRollups(self.country, 10, 200, Decimal("4.5"), 3)
+
+    def test_rebuild_command(self):
+        Country.objects.update(min_price=1, cities_count=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_catalog_rollups', '--check', stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_catalog_rollups', stdout=StringIO())
+        self.assertRollups(self.country, 100, 200, Decimal("4.5"), 2)
+
+
+class CatalogCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=2, countries=1, cities=1)
+        self.country, self.other = Country.objects.order_by('pk')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_after_miss(self):
+        first = self.get('/api/countries/')
+        second = self.get('/api/countries/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+    def test_city_change_invalidates_only_its_country(self):
+        own, other = f'/api/countries/{self.country.pk}/', f'/api/countries/{self.other.pk}/'
+        self.get(own), self.get(other), self.get('/api/regions/')
+
+        city = self.country.cities.get()
+        city.price = 1
+        city.save()
+
+        self.assertEqual(self.get(own)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(own).json()['min_price'], 1)
+        self.assertEqual(self.get(other)['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/api/regions/')['X-Cache'], 'MISS')
+
+    def test_card_change_invalidates_cards(self):
+        self.get('/api/cards/')
+        MembershipCard.objects.create(name="Gold", code="gold", duration_months=1, price=10, description="")
+        response = self.get('/api/cards/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 1)
+
+
+class CatalogPaginationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=2, countries=2, cities=3)
+        Country.objects.create(region=Region.objects.first(), name="empty", description="", image="https://e.com/e.jpg",
+                               capital="-", population="-", language="-", currency="-", best_time="-")
+
+    def walk(self, url):
+        pages, ids = [], []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        return pages, ids
+
+    def test_walk_forward_and_back(self):
+        expected = list(City.objects.order_by('-price', '-pk').values_list('pk', flat=True))
+        pages, ids = self.walk('/api/cities/?ordering=-price&limit=5')
+        self.assertEqual(ids, expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        back = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in pages[-2]['results']])
+
+    def test_nullable_ordering_keeps_empty_countries_last(self):
+        _, ids = self.walk('/api/countries/?ordering=price&limit=2')
+        self.assertEqual(len(ids), Country.objects.count())
+        self.assertEqual(ids[-1], Country.objects.get(name="empty").pk)
+
+    def test_filters(self):
+        region = Region.objects.first()
+        data = self.client.get(f'/api/cities/?region={region.pk}&min_price=200&min_rating=4.5').json()
+        expected = City.objects.filter(country__region=region, price__gte=200, rating__gte=Decimal("4.5"))
+        self.assertEqual({row['id'] for row in data['results']}, set(expected.values_list('pk', flat=True)))
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/cities/?ordering=population').status_code, 400)
+        self.assertEqual(self.client.get('/api/cities/?min_price=cheap').status_code, 400)
+        self.assertEqual(self.client.get('/api/cities/?cursor=garbage').status_code, 404)
+        for cursor_id in ('Infinity', str(2 ** 64), '-1e400'):
+            cursor = base64.urlsafe_b64encode(f'{{"v":1,"id":{cursor_id},"r":false}}'.encode()).decode()
+            self.assertEqual(self.client.get('/api/cities/', {'cursor': cursor}).status_code, 404, cursor_id)
+
+
+class SparseFieldsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=2, cities=2)
+        self.country = Country.objects.order_by('pk').first()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in ctx.captured_queries]
+
+    def test_fields_limit_payload_and_columns(self):
+        response, queries = self.get(f'/api/countries/{self.country.pk}/?fields=name,cities.name,cities.price')
+        self.assertEqual(response.json(), {
+            'name': 'country-0-0', 'cities': [{'name': 'city-0', 'price': 100}, {'name': 'city-1', 'price': 200}],
+        })
+        self.assertNotIn('description', ' '.join(queries))
+
+        response, queries = self.get('/api/cities/?fields=id,name&limit=1&ordering=-price')
+        self.assertEqual(response.json()['results'], [{'id': 4, 'name': 'city-1'}])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.client.get(response.json()['next']).json()['results'][0]['name'], 'city-1')
+
+    def test_expand_prefetches_only_requested_relations(self):
+        response, queries = self.get('/api/regions/?fields=id')
+        self.assertEqual(len(queries), 1)
+        response, queries = self.get('/api/regions/?fields=id,countries.name&expand=countries&expand=countries.cities')
+        countries = response.json()[0]['countries']
+        self.assertEqual([country['name'] for country in countries], ['country-0-0', 'country-0-1'])
+        self.assertEqual(len(countries[0]['cities']), 2)
+        self.assertEqual(len(queries), 3)
+
+        response = self.client.get(f'/api/countries/{self.country.pk}/?fields=id,region.name&expand=region')
+        self.assertEqual(response.json(), {'id': self.country.pk, 'region': {'name': 'region-0'}})
+
+    def test_expanded_parent_change_invalidates_cache(self):
+        city = self.country.cities.order_by('pk').first()
+        urls = ['/api/cities/?expand=country', f'/api/cities/{city.pk}/?expand=country']
+        for url in urls:
+            self.client.get(url)
+        self.country.name = 'renamed'
+        self.country.save()
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            data = response.json()
+            data = data['results'][0] if 'results' in data else data
+            self.assertEqual(data['country']['name'], 'renamed')
+
+        url = f'/api/countries/{self.country.pk}/?expand=region'
+        self.client.get(url)
+        region = Region.objects.get()
+        region.display_name = 'Renamed'
+        region.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['region']['display_name'], 'Renamed')
+
+    def test_unknown_names(self):
+        self.assertEqual(self.client.get('/api/cities/?fields=secret').status_code, 400)
+        self.assertEqual(self.client.get('/api/cards/?expand=users').status_code, 400)
+
+
+class FastSerializationContractTests(BaseTestCase):
+    """Быстрый путь (users/rows.py) должен отдавать те же байты, что и сериализаторы DRF."""
+
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=2, countries=2, cities=2)
+        Region.objects.create(name="empty", display_name="Пусто", description="", image="https://e.com/e.jpg", best_time="-")
+        self.city = City.objects.create(
+            country=Country.objects.order_by('pk').first(), name="Хива", description='"кавычки" \\ \u2028 \u2029 \x01 😀',
+            image="https://e.com/x.jpg", best_time="-", rating=Decimal("4.9"),
+            highlights=[{"title": "Ичан-Кала", "year": 1990, "score": 9.5}, None, True], attractions=["Кальта-Минор"],
+        )
+        make_card(bonus_amount=Decimal("1.50"), features=["скидки", {"vip": True}], monthly_limit=None)
+
+    def test_bytes_match_drf_serializers(self):
+        urls = ['/api/regions/', '/api/regions/1/', '/api/regions/1/countries/', '/api/countries/', '/api/countries/1/',
+                '/api/countries/1/cities/', '/api/cities/', '/api/cities/?ordering=-rating&limit=2',
+                f'/api/cities/{self.city.pk}/', '/api/cards/', '/api/cities/999/']
+        for url in urls:
+            cache.clear()
+            with self.settings(CATALOG_FAST_SERIALIZATION=False):
+                expected = self.client.get(url)
+            cache.clear()
+            actual = self.client.get(url)
+            self.assertEqual((actual.status_code, actual.content), (expected.status_code, expected.content), url)
+
+    def test_repeated_and_empty_fields_params(self):
+        # Пустой повтор не должен отправлять запрос быстрым путём с полным ответом
+        sparse = self.client.get('/api/cities/?fields=id&fields=').json()['results']
+        self.assertTrue(sparse)
+        self.assertTrue(all(set(row) == {'id'} for row in sparse))
+        self.assertEqual(self.client.get('/api/cities/?fields=&fields=id').json()['results'], sparse)
+        self.assertEqual(self.client.get('/api/cities/?fields=id&expand=').json()['results'], sparse)
+
+        cache.clear()
+        full = self.client.get('/api/cities/?fields=&expand=')
+        cache.clear()
+        with self.settings(CATALOG_FAST_SERIALIZATION=False):
+            self.assertEqual(full.content, self.client.get('/api/cities/').content)
+
+    def test_snapshot_matches_drf_serializers(self):
+        regions = Region.objects.order_by('pk').prefetch_related(
+            Prefetch('countries', queryset=Country.objects.order_by('pk')),
+            Prefetch('countries__cities', queryset=City.objects.order_by('pk')),
+        )
+        expected = JSONRenderer().render({'regions': CatalogSnapshotSerializer(regions, many=True).data})
+        self.assertEqual(snapshot.render_catalog(), expected)
+
+
+class AsyncCatalogViewTests(BaseTestCase):
+    """Асинхронные вьюхи (ASYNC_VIEWS под ASGI) отдают то же, что синхронные."""
+
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=2, countries=2, cities=3)
+        make_card()
+        self.factory = AsyncRequestFactory()
+
+    async def get_async(self, url, **extra):
+        match = resolve(url.split('?')[0])
+        view = next(
+            view for view in vars(async_views).values()
+            if isinstance(view, type) and getattr(view, 'sync_view', None) is match.func.view_class
+        )
+        return await view.as_view()(self.factory.get(url, **extra), *match.args, **match.kwargs)
+
+    async def test_matches_sync_views(self):
+        urls = ['/api/regions/', '/api/regions/1/', '/api/regions/1/countries/', '/api/countries/?ordering=-price',
+                '/api/countries/1/', '/api/countries/1/cities/', '/api/cities/?limit=2&min_price=150',
+                '/api/cities/1/', '/api/cards/', '/api/cities/999/', '/api/cities/?min_price=x',
+                '/api/cities/?fields=id,name']
+        for url in urls:
+            await cache.aclear()
+            expected = await self.async_client.get(url)
+            await cache.aclear()
+            actual = await self.get_async(url)
+            self.assertEqual((actual.status_code, actual.content), (expected.status_code, expected.content), url)
+
+    async def test_options_and_disallowed_methods_match_sync_views(self):
+        for url in ('/api/cities/', '/api/regions/1/'):
+            match = resolve(url)
+            view = next(view for view in vars(async_views).values()
+                        if isinstance(view, type) and getattr(view, 'sync_view', None) is match.func.view_class)
+            for method in ('options', 'post', 'delete'):
+                expected = await getattr(self.async_client, method)(url)
+                actual = await view.as_view()(getattr(self.factory, method)(url), **match.kwargs)
+                self.assertEqual(
+                    (actual.status_code, actual.content, actual.get('Allow')),
+                    (expected.status_code, expected.content, expected.get('Allow')), f"{method} {url}",
+                )
+
+    async def test_cursor_pages_and_cache(self):
+        response = await self.get_async('/api/cities/?limit=5')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual((await self.get_async('/api/cities/?limit=5'))['X-Cache'], 'HIT')
+        first = json.loads(response.content)
+        second = json.loads((await self.get_async(first['next'].split('testserver')[1])).content)
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(len(ids), 10)
+        # Браузерный API (свой CSRF-токен в каждом ответе) — через синхронную вьюху
+        browsable = await self.get_async('/api/cities/?format=api')
+        self.assertEqual((browsable.status_code, browsable['Content-Type']), (200, 'text/html; charset=utf-8'))
+
+
+# ---------- PROFILE ----------
+class BonusHistoryTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=1, cities=1)
+        self.city = City.objects.get()
+        self.referrer = User.objects.create_user("ref@example.com", "pass")
+        self.friend = User.objects.create_user("friend@example.com", "pass", referrer=self.referrer)
+        self.client.force_authenticate(self.referrer)
+
+    def add_bonuses(self, count):
+        for i in range(count):
+            tour = Tour.objects.create(user=self.friend, city=self.city, title=f"tour-{i}")
+            BonusHistory.objects.create(referrer=self.referrer, referred_user=self.friend, tour=tour, amount=Decimal("1.50"))
+
+    def profile_queries(self):
+        # Сбрасываем запомненную на объекте карту, как у нового запроса
+        self.referrer.__dict__.pop('_current_membership', None)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/user/profile/').json()
+        return data, len(ctx.captured_queries)
+
+    def test_profile_is_capped(self):
+        self.add_bonuses(3)
+        self.profile_queries()
+        _, small = self.profile_queries()
+        self.add_bonuses(RECENT_BONUSES_LIMIT)
+        data, large = self.profile_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['bonus_history']), RECENT_BONUSES_LIMIT)
+        self.assertEqual(data['bonus_totals'], {'count': RECENT_BONUSES_LIMIT + 3, 'amount': '19.50'})
+
+    def test_bonuses_endpoint_pages_newest_first(self):
+        self.add_bonuses(5)
+        expected = list(self.referrer.bonuses_received.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        ids, url = [], '/api/user/bonuses/?limit=2'
+        while url:
+            data = self.client.get(url).json()
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(ids, expected)
+        self.assertEqual(data['results'][0]['tour_title'], 'tour-0')
+
+
+# ---------- CATALOG SNAPSHOT ----------
+class CatalogSnapshotTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=2, countries=2, cities=2)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(CATALOG_SNAPSHOT_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def fetch(self, **headers):
+        response = self.client.get('/api/catalog/snapshot/', headers=headers)
+        return response, b''.join(response.streaming_content) if response.status_code == 200 else b''
+
+    def build(self, *args):
+        call_command('build_catalog_snapshot', *args, stdout=StringIO())
+
+    def test_negotiates_encoding_and_etag(self):
+        self.build()
+        response, plain = self.fetch()
+        tree = json.loads(plain)
+        self.assertEqual(len(tree['regions']), 2)
+        self.assertEqual(len(tree['regions'][0]['countries'][0]['cities']), 2)
+        self.assertEqual(tree['regions'][0]['countries'][0]['min_price'], 100)
+
+        if snapshot.brotli is not None:
+            response, body = self.fetch(accept_encoding='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertEqual(snapshot.brotli.decompress(body), plain)
+        response, body = self.fetch(accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), plain)
+        self.assertEqual(self.fetch(if_none_match=response['ETag'])[0].status_code, 304)
+
+    def test_not_built_yet(self):
+        response = self.fetch()[0]
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        # Запрос не собирает снимок сам
+        self.assertIsNone(snapshot.read_manifest())
+
+    def test_stale_until_rebuilt(self):
+        self.build()
+        first = self.fetch()[0]
+        self.assertNotIn(snapshot.STALE_HEADER, first)
+        with self.captureOnCommitCallbacks(execute=True):
+            City.objects.filter(name="city-0").first().delete()
+        # Запрос не пересобирает снимок, а отдаёт прежний с пометкой
+        stale = self.fetch()[0]
+        self.assertEqual(stale['ETag'], first['ETag'])
+        self.assertEqual(stale[snapshot.STALE_HEADER], '1')
+
+        self.build('--if-stale')
+        fresh = self.fetch()[0]
+        self.assertNotEqual(fresh['ETag'], first['ETag'])
+        self.assertNotIn(snapshot.STALE_HEADER, fresh)
+        manifest = snapshot.read_manifest()
+        self.build('--if-stale')
+        self.assertEqual(snapshot.read_manifest(), manifest)
+
+    def test_concurrent_writers(self):
+        path = Path(snapshot.snapshot_dir()) / snapshot.VERSION_NAME
+        errors = []
+
+        def writer(index):
+            try:
+                for attempt in range(50):
+                    snapshot.write_atomic(path, f'{index}-{attempt}'.encode() * 1000)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertRegex(path.read_text(), r'^(\d+-\d+)\1{999}$')
+        self.assertEqual([file.name for file in path.parent.iterdir()], [snapshot.VERSION_NAME])
+
+
+# ---------- SEARCH ----------
+class SearchTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=2, cities=2)
+        self.country = Country.objects.first()
+        self.samarkand = City.objects.create(
+            country=self.country, name="Самарканд", description="Древний город", image="https://example.com/s.jpg",
+            best_time="autumn", highlights=["Регистан"], attractions=[{"name": "Шахи-Зинда"}],
+        )
+        self.bukhara = City.objects.create(
+            country=self.country, name="Бухара", description="Рядом с Самаркандом", image="https://example.com/b.jpg",
+            best_time="autumn",
+        )
+
+    def ids(self, url):
+        return [(row['type'], row['id']) for row in self.client.get(url).json()['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.ids('/api/search/?q=самарк'), [('city', self.samarkand.pk), ('city', self.bukhara.pk)])
+        self.assertEqual(self.ids('/api/search/?q=зинда'), [('city', self.samarkand.pk)])
+        self.assertEqual(self.ids('/api/search/?q=country&type=country&limit=1'), [('country', self.country.pk)])
+        self.assertEqual(self.client.get('/api/search/?q=city&type=hotel').status_code, 400)
+        self.assertEqual(self.client.get('/api/search/?q=%20').status_code, 400)
+
+    def test_pages_and_sync(self):
+        first = self.client.get('/api/search/?q=city&limit=3').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 4)
+        self.assertIsNone(second['next'])
+
+        self.samarkand.highlights = ["Обсерватория Улугбека"]
+        self.samarkand.save()
+        self.bukhara.delete()
+        self.assertEqual(self.ids('/api/search/?q=регистан'), [])
+        self.assertEqual(self.ids('/api/search/?q=улугбек'), [('city', self.samarkand.pk)])
+        self.assertEqual(self.ids('/api/search/?q=самарк'), [('city', self.samarkand.pk)])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.ids('/api/search/?q=улугбек'), [('city', self.samarkand.pk)])
+
+
+# ---------- BOOKING ----------
+def make_card(**fields):
+    defaults = dict(name="Gold", code="gold", duration_months=12, price=100, description="",
+                    discount_tours=2, discount_percent=20, extra_discount_tours=1, extra_discount_percent=10)
+    defaults.update(fields)
+    return MembershipCard.objects.create(**defaults)
+
+
+class TourBookingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=1, cities=1)
+        self.city = City.objects.get()
+        self.user = User.objects.create_user("traveler@example.com", "pass")
+        self.membership = UserMembership.objects.create(user=self.user, card=make_card())
+        self.client.force_authenticate(self.user)
+
+    def test_discount_tiers(self):
+        prices = [self.client.post('/api/tours/', {'city': self.city.pk, 'title': 'trip'}).json()['price']
+                  for _ in range(4)]
+        self.assertEqual(prices, ['80.00', '80.00', '90.00', '100.00'])
+        self.membership.refresh_from_db()
+        self.assertEqual(self.membership.used_tours, 3)
+
+    def test_requires_auth(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/api/tours/', {'city': self.city.pk, 'title': 'trip'}).status_code, 401)
+
+
+class TourBookingConcurrencyTests(TransactionTestCase):
+    threads = 8
+    bookings_per_thread = 5
+
+    def test_discounts_are_never_over_granted(self):
+        cache.clear()
+        # Коммиты каталога отмечают снимок устаревшим — не в рабочем var/catalog
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(CATALOG_SNAPSHOT_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        make_catalog(regions=1, countries=1, cities=1)
+        city = City.objects.get()
+        user = User.objects.create_user("traveler@example.com", "pass")
+        card = make_card(discount_tours=3, extra_discount_tours=2)
+        membership = UserMembership.objects.create(user=user, card=card)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(self.bookings_per_thread):
+                    for attempt in range(50):
+                        try:
+                            services.book_tour(user, city, "trip")
+                            break
+                        except OperationalError:
+                            # SQLite отдаёт "database is locked" при конкурентной записи
+                            time.sleep(0.01)
+            except Exception as exc:  # noqa: BLE001
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        prices = list(Tour.objects.values_list('price', flat=True))
+        self.assertEqual(len(prices), self.threads * self.bookings_per_thread)
+        self.assertEqual(sum(price == Decimal("80") for price in prices), 3)
+        self.assertEqual(sum(price == Decimal("90") for price in prices), 2)
+        membership.refresh_from_db()
+        self.assertEqual(membership.used_tours, 5)
+
+
+class BonusMonthlyLimitTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=1, cities=1)
+        self.city = City.objects.get()
+        self.referrer = User.objects.create_user("ref@example.com", "pass")
+        self.friend = User.objects.create_user("friend@example.com", "pass", referrer=self.referrer)
+        UserMembership.objects.create(user=self.referrer, card=make_card(bonus_amount=5, monthly_limit=2))
+
+    def test_limit_counts_only_current_month(self):
+        old_tour = Tour.objects.create(user=self.friend, city=self.city, title="old")
+        BonusHistory.objects.filter(tour=old_tour).update(created_at=timezone.now() - timedelta(days=366))
+        BonusMonthlyCounter.objects.all().delete()
+        call_command('backfill_bonus_counters', stdout=StringIO())
+
+        for _ in range(3):
+            Tour.objects.create(user=self.friend, city=self.city, title="trip")
+
+        today = timezone.localdate()
+        self.assertEqual(BonusHistory.objects.count(), 3)
+        self.assertEqual(BonusMonthlyCounter.objects.get(year=today.year, month=today.month).count, 2)
+        self.assertEqual(BonusMonthlyCounter.objects.exclude(year=today.year, month=today.month).get().count, 1)
+
+
+class BalanceLedgerTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=1, cities=1)
+        self.referrer = User.objects.create_user("ref@example.com", "pass")
+        self.friend = User.objects.create_user("friend@example.com", "pass", referrer=self.referrer)
+        UserMembership.objects.create(user=self.referrer, card=make_card(bonus_amount=Decimal("2.50")))
+        Tour.objects.create(user=self.friend, city=City.objects.get(), title="trip")
+
+    def reconcile(self, *args):
+        call_command('reconcile_balances', '--chunk-size', '1', *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_bonus_is_posted_to_ledger(self):
+        self.referrer.refresh_from_db()
+        self.assertEqual(self.referrer.balance, Decimal("2.50"))
+        entry = BalanceEntry.objects.get()
+        self.assertEqual((entry.kind, entry.amount, entry.bonus), (BalanceEntry.Kind.BONUS, Decimal("2.50"), BonusHistory.objects.get()))
+
+    def test_debit_cannot_overdraw(self):
+        with self.assertRaises(ValueError):
+            BalanceEntry.post(self.referrer, Decimal("-3"), BalanceEntry.Kind.DEBIT)
+        BalanceEntry.post(self.referrer, Decimal("-2"), BalanceEntry.Kind.DEBIT)
+        self.referrer.refresh_from_db()
+        self.assertEqual(self.referrer.balance, Decimal("0.50"))
+
+    def test_save_does_not_overwrite_balance(self):
+        # Объект прочитан до начисления бонуса
+        stale = User.objects.get(pk=self.friend.pk)
+        BalanceEntry.post(self.friend, Decimal("4"), BalanceEntry.Kind.ADJUSTMENT)
+        stale.first_name = "Друг"
+        stale.save()
+        self.friend.refresh_from_db()
+        self.assertEqual((self.friend.first_name, self.friend.balance), ("Друг", Decimal("4")))
+
+    def test_reconcile_with_snapshots(self):
+        self.reconcile('--snapshot')
+        self.assertEqual(BalanceSnapshot.objects.get().balance, Decimal("2.50"))
+
+        BalanceEntry.post(self.referrer, Decimal("1"), BalanceEntry.Kind.ADJUSTMENT)
+        self.reconcile()
+
+        User.objects.filter(pk=self.referrer.pk).update(balance=100)
+        with self.assertRaises(CommandError):
+            self.reconcile()
+        self.reconcile('--fix')
+        self.referrer.refresh_from_db()
+        self.assertEqual(self.referrer.balance, Decimal("3.50"))
+
+
+class DeactivateExpiredCardsTests(BaseTestCase):
+    def test_deactivates_expired_and_exhausted(self):
+        user = User.objects.create_user("traveler@example.com", "pass")
+        card = make_card(discount_tours=1, extra_discount_tours=1)
+        no_discounts = make_card(code="basic", discount_tours=0, extra_discount_tours=0)
+        fresh = UserMembership.objects.create(user=user, card=card)
+        exhausted = UserMembership.objects.create(user=user, card=card, used_tours=2)
+        expired = UserMembership.objects.create(user=user, card=card)
+        untouched = UserMembership.objects.create(user=user, card=no_discounts, used_tours=3)
+        both = UserMembership.objects.create(user=user, card=card, used_tours=2)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        UserMembership.objects.filter(pk__in=[expired.pk, both.pk]).update(end_date=yesterday)
+
+        out = StringIO()
+        call_command('deactivate_expired_cards', '--dry-run', '--batch-size', '1', stdout=out)
+        # Карта и просроченная, и исчерпанная считается один раз
+        self.assertIn("Будет деактивировано 3", out.getvalue())
+        self.assertEqual(UserMembership.objects.filter(is_active=True).count(), 5)
+
+        call_command('deactivate_expired_cards', '--batch-size', '1', stdout=StringIO())
+        active = set(UserMembership.objects.filter(is_active=True).values_list('pk', flat=True))
+        self.assertEqual(active, {fresh.pk, untouched.pk})
+        self.assertNotIn(exhausted.pk, active)
+
+    def test_expired_pass_uses_end_date_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('deactivate_expired_cards', '--dry-run', stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {ctx.captured_queries[0]['sql']}")
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('membership_active_end_idx', plan)
+
+
+
+class CurrentMembershipTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("traveler@example.com", "pass")
+        self.card = make_card()
+
+    def resolve(self):
+        user = User.objects.get(pk=self.user.pk)
+        return services.current_membership(user)
+
+    def test_cached_until_memberships_change(self):
+        self.assertIsNone(self.resolve())
+        membership = UserMembership.objects.create(user=self.user, card=self.card)
+        self.assertEqual(self.resolve(), membership)
+
+        with self.assertNumQueries(1):
+            user = User.objects.get(pk=self.user.pk)
+            self.assertEqual(services.current_membership(user).card.discount_percent, 20)
+            services.current_membership(user)
+
+        membership.is_active = False
+        membership.save()
+        self.assertIsNone(self.resolve())
+
+    def test_card_change_is_visible(self):
+        UserMembership.objects.create(user=self.user, card=self.card)
+        self.resolve()
+        self.card.discount_percent = 50
+        self.card.save()
+        self.assertEqual(self.resolve().card.discount_percent, 50)
+
+    def test_claim_is_forgotten_after_commit(self):
+        membership = UserMembership.objects.create(user=self.user, card=self.card)
+        stale = self.resolve()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                services.claim_discount(membership)
+                # Параллельный запрос до коммита кладёт в кэш карту со старым used_tours
+                cache.set(services.membership_cache_key(self.user.pk), stale)
+        self.assertEqual(self.resolve().used_tours, 1)
+
+
+# ---------- AUTHENTICATION ----------
+class CachedAuthenticationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("traveler@example.com", "pass")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/user/me/')
+        return response, [q['sql'] for q in ctx.captured_queries if 'FROM "users_user"' in q['sql']]
+
+    def test_user_is_read_once(self):
+        self.user_queries()
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_changes_are_visible(self):
+        self.user_queries()
+        BalanceEntry.post(self.user, Decimal("5"), BalanceEntry.Kind.ADJUSTMENT)
+        self.assertEqual(self.client.get('/api/user/profile/').json()['balance'], '5.00')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.user_queries()[0].status_code, 401)
+
+    def test_cache_is_per_token_and_without_password(self):
+        self.user_queries()
+        other = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {other}")
+        # Другой токен того же пользователя — своя запись в кэше
+        self.assertEqual(len(self.user_queries()[1]), 1)
+        self.assertEqual(self.user_queries()[1], [])
+
+        version = authentication.get_auth_user_version(self.user.pk)
+        cached = cache.get(authentication.auth_user_cache_key(self.user.pk, version, other['jti']))
+        self.assertEqual(cached['fields']['email'], self.user.email)
+        self.assertNotIn('password', cached['fields'])
+        self.assertNotIn(self.user.password, repr(cached))
+
+    def fill_profile(self):
+        make_catalog(regions=1, countries=1, cities=1)
+        UserMembership.objects.create(
+            user=self.user, card=make_card(), start_date=timezone.localdate(), end_date=timezone.localdate() + timedelta(days=30),
+        )
+        friend = User.objects.create_user("friend@example.com", "pass", referrer=self.user)
+        tour = Tour.objects.create(user=friend, city=City.objects.get(), title="tour")
+        BonusHistory.objects.create(referrer=self.user, referred_user=friend, tour=tour, amount=Decimal("2.50"))
+
+    async def test_async_profile_matches_sync(self):
+        await sync_to_async(self.fill_profile)()
+        headers = {'Authorization': self.client._credentials['HTTP_AUTHORIZATION']}
+        expected = await sync_to_async(self.client.get)('/api/user/profile/')
+        actual = await async_views.AsyncProfileView.as_view()(AsyncRequestFactory().get('/api/user/profile/', headers=headers))
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual(actual.content, expected.content)
+        self.assertTrue(json.loads(actual.content)['bonus_history'])
+
+        anonymous = await async_views.AsyncProfileView.as_view()(AsyncRequestFactory().get('/api/user/profile/'))
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(anonymous['WWW-Authenticate'], 'Bearer realm="api"')
+
+
+# ---------- BENCHMARKS ----------
+class BenchmarkSuiteTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(bench_api.route_names(), set(bench_api.ROUTES))
+
+    def test_seeded_users_form_referral_chains(self):
+        make_catalog(regions=1, countries=1, cities=2)
+        users = benchmarks.seed_users(random.Random(1), 7, chain_length=3)
+        self.assertEqual(len(users), 7)
+        self.assertEqual(sum(user.referrer_id is None for user in users), 3)
+        self.assertEqual(UserMembership.objects.count(), 3)
+        self.assertEqual(BonusHistory.objects.count(), 2 * 4)
+        self.assertTrue(User.objects.get(pk=users[0].pk).check_password(benchmarks.BENCH_PASSWORD))
+
+
+# ---------- METRICS ----------
+class MetricsTests(BaseTestCase):
+    def setUp(self):
+        # Настройка до первого запроса клиента — middleware создаётся с ним
+        override = self.settings(METRICS_TOKEN='secret')
+        override.enable()
+        self.addCleanup(override.disable)
+        super().setUp()
+
+    def metric(self, name, **labels):
+        text = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'}).content.decode()
+        selector = ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+        match = re.search(rf'^{name}\{{{re.escape(selector)}\}} (\S+)$', text, re.M)
+        return float(match.group(1)) if match else 0.0
+
+    def test_request_is_counted_by_route(self):
+        make_catalog(regions=1, countries=1, cities=1)
+        requests = self.metric('http_requests_total', method='GET', status='200', view='regions-list')
+        queries = self.metric('http_request_db_queries_sum', view='regions-list')
+        response = self.client.get('/api/regions/')
+        self.assertEqual(
+            self.metric('http_requests_total', method='GET', status='200', view='regions-list'), requests + 1,
+        )
+        self.assertGreater(self.metric('http_request_db_queries_sum', view='regions-list'), queries)
+        self.assertGreaterEqual(
+            self.metric('http_response_size_bytes_sum', view='regions-list'), len(response.content),
+        )
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total', response.content)
+
+    def test_disabled_without_token(self):
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class SlowQueryLogTests(BaseTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Порог 0: в журнал попадает каждый запрос; настройка до первого запроса клиента — middleware создаётся с ним
+        override = self.settings(
+            SLOW_QUERY_LOG=True, SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_FILE=Path(directory.name) / 'slow.log',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        slowqueries._explained.clear()
+        super().setUp()
+        make_catalog(regions=1, countries=1, cities=3)
+
+    def test_groups_by_fingerprint_with_plan_and_origin(self):
+        for price in (0, 150, 250):
+            self.client.get('/api/cities/', {'min_price': price})
+        groups = {group['fingerprint']: group for group in slowqueries.report()}
+        cities = next(group for key, group in groups.items() if 'FROM "users_city"' in key)
+        self.assertEqual(cities['count'], 3)
+        self.assertEqual(cities['views'], [('cities-list', 3)])
+        self.assertIn('users_city', cities['plan'])
+        self.assertTrue(any('users/' in origin for origin, _ in cities['origins']))
+
+    def test_admin_report(self):
+        self.client.get('/api/regions/')
+        admin_user = User.objects.create_superuser("admin@example.com", "pass")
+        self.client.force_login(admin_user)
+        response = self.client.get('/admin/slow-queries/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'FROM &quot;users_region&quot;')
+
+
+class ProfilingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = self.settings(PROFILING_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user("traveler@example.com", "pass")
+
+    def report(self, response):
+        reference = response[profiling.RESPONSE_HEADER]
+        self.assertTrue((self.directory / f'{reference}.prof').exists())
+        return (self.directory / f'{reference}.txt').read_text(encoding='utf-8')
+
+    def test_signed_header(self):
+        token = profiling.make_token('/api/regions/')
+        response = self.client.get('/api/regions/', headers={'X-Profile-Token': token})
+        self.assertIn('GET /api/regions/ -> 200', self.report(response))
+        forged = self.client.get('/api/regions/', headers={'X-Profile-Token': 'forged'})
+        self.assertNotIn(profiling.RESPONSE_HEADER, forged)
+        # Токен выдан на один путь
+        other = self.client.get('/api/countries/', headers={'X-Profile-Token': token})
+        self.assertNotIn(profiling.RESPONSE_HEADER, other)
+
+    def test_old_reports_are_pruned(self):
+        token = profiling.make_token('/api/regions/')
+        with self.settings(PROFILING_KEEP=2):
+            references = [
+                self.client.get('/api/regions/', headers={'X-Profile-Token': token})[profiling.RESPONSE_HEADER]
+                for _ in range(4)
+            ]
+        self.assertEqual(len(list(self.directory.iterdir())), 4)
+        self.assertTrue((self.directory / f'{references[-1]}.txt').exists())
+
+        old = time.time() - 8 * 24 * 60 * 60
+        for path in self.directory.iterdir():
+            os.utime(path, (old, old))
+        response = self.client.get('/api/regions/', headers={'X-Profile-Token': token})
+        self.assertEqual(
+            sorted(path.name for path in self.directory.iterdir()),
+            [f'{response[profiling.RESPONSE_HEADER]}.prof', f'{response[profiling.RESPONSE_HEADER]}.txt'],
+        )
+
+    def test_query_flag_is_staff_only(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertNotIn(profiling.RESPONSE_HEADER, self.client.get('/api/user/profile/?_profile=1'))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        cache.clear()
+        response = self.client.get('/api/user/profile/?_profile=memory')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Память: пик', self.report(response))
+
+    async def test_async_chain(self):
+        token = profiling.make_token('/api/regions/')
+        response = await self.async_client.get('/api/regions/', headers={'X-Profile-Token': token})
+        self.assertIn('GET /api/regions/ -> 200', await sync_to_async(self.report)(response))
+        self.assertNotIn(profiling.RESPONSE_HEADER, await self.async_client.get('/api/regions/'))
+
+    def test_asgi_chain_has_no_thread_hops(self):
+        # Включённые по умолчанию middleware не должны переводить асинхронные вьюхи в поток
+        with self.settings(DEBUG=True), self.assertLogs('django.request', 'DEBUG') as logs:
+            ASGIHandler()
+        adapted = [line for line in logs.output if 'adapted' in line]
+        for name in ('ProfilingMiddleware', 'ReplicaStickinessMiddleware'):
+            self.assertFalse([line for line in adapted if name in line], name)
+
+
+# ---------- QUERY BUDGETS ----------
+class QueryBudgetTests(TestCase):
+    """
+    Потолок SQL-запросов на каждый маршрут. Один и тот же запрос меряется на маленьком и
+    большом наборе данных: если число запросов растёт с данными (N+1), тест падает
+    и печатает запросы с местом вызова в коде.
+    """
+    # имя маршрута -> (вьюха, максимум запросов); запросы строит сценарий из bench_api.ROUTES
+    BUDGETS = {
+        'register': (views.RegisterView, 10),
+        'login': (views.LoginView, 1),
+        'me': (views.MeView, 1),
+        'profile': (views.ProfileView, 7),
+        'bonuses': (views.BonusHistoryListView, 2),
+        'cards': (views.MembershipCardListView, 1),
+        'tour-booking': (views.TourBookingView, 9),
+        'regions-list': (views.RegionListView, 2),
+        'region-detail': (views.RegionDetailView, 2),
+        'region-countries': (views.RegionCountriesView, 1),
+        'countries-list': (views.CountryListView, 1),
+        'country-detail': (views.CountryDetailView, 2),
+        'country-cities': (views.CountryCitiesView, 1),
+        'cities-list': (views.CityListView, 1),
+        'city-detail': (views.CityDetailView, 1),
+        'catalog-snapshot': (views.catalog_snapshot, 0),
+        'search': (views.SearchView, 1),
+    }
+    FIXTURES = {
+        'small': dict(cities=6, countries=2, users=6, tours_per_user=1),
+        'large': dict(cities=300, countries=40, users=60, tours_per_user=6),
+    }
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(set(self.BUDGETS), bench_api.route_names())
+
+    def test_budgets_hold_on_small_and_large_data(self):
+        counts = {name: self.measure(**fixture) for name, fixture in self.FIXTURES.items()}
+        for route, (view, budget) in self.BUDGETS.items():
+            with self.subTest(route=route):
+                small, large = counts['small'][route], counts['large'][route]
+                self.assertLessEqual(len(small), budget, f"Бюджет {budget} превышен:\n{format_queries(small.queries)}")
+                self.assertEqual(len(small), len(large),
+                                 f"Число запросов растёт с данными:\n{format_queries(large.queries)}")
+
+    def measure(self, cities, countries, users, tours_per_user):
+        """Запросы каждого маршрута на свежем наборе данных; набор откатывается после замера."""
+        rng = random.Random(1)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        logs = {}
+        # Без кэша: меряем промах, то есть все запросы вьюхи и аутентификации
+        with transaction.atomic(), self.settings(
+            CATALOG_SNAPSHOT_DIR=directory.name,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        ):
+            benchmarks.seed_catalog(rng, cities, countries)
+            # Блок из другого теста: иначе строка RefIdSequence появится только при замере регистрации
+            refids.allocator.discard_block()
+            rows = benchmarks.seed_users(rng, users, tours_per_user=tours_per_user)
+            rollups.rebuild_all()
+            search.rebuild()
+            snapshot.build()
+            dataset = {
+                'users': rows,
+                'regions': list(Region.objects.values_list('pk', flat=True)),
+                'countries': list(Country.objects.values_list('pk', flat=True)),
+                'cities': list(City.objects.values_list('pk', flat=True)),
+            }
+            # Первый пользователь цепочки: у него карта, рефералы и бонусы
+            client = APIClient()
+            token = RefreshToken.for_user(rows[0]).access_token
+            for route, (view, budget) in self.BUDGETS.items():
+                method, needs_auth, make_request = bench_api.ROUTES[route]
+                path, data = make_request(rng, dataset, route)
+                self.assertIs(getattr(resolve(path).func, 'view_class', resolve(path).func), view)
+                client.credentials(**({'HTTP_AUTHORIZATION': f"Bearer {token}"} if needs_auth else {}))
+                refids.allocator.discard_block()
+                with QueryLog() as logs[route]:
+                    response = getattr(client, method)(path, data, format='json' if method == 'post' else None)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400, f"{route}: {response.status_code}")
+            transaction.set_rollback(True)
+        return logs
+
+
+# ---------- DATABASE ----------
+class DatabaseProfileTests(TestCase):
+    def test_default_profile_is_plain_sqlite(self):
+        database = database_settings({}, Path('/srv'))
+        self.assertEqual(database, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': Path('/srv/db.sqlite3')})
+        with self.assertRaises(ValueError):
+            database_settings({'DB_PROFILE': 'mysql'}, Path('/srv'))
+
+    def test_sqlite_wal_pragmas_are_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {'DB_PROFILE': 'sqlite-wal', 'SQLITE_PATH': os.path.join(directory, 'db.sqlite3'), 'SQLITE_CACHE_SIZE_KB': '1024'}
+            database = connections.configure_settings({'default': database_settings(env, Path(directory))})['default']
+            wrapper = load_backend(database['ENGINE']).DatabaseWrapper(database, 'profile')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'cache_size', 'busy_timeout'):
+                        pragmas[name] = cursor.execute(f'PRAGMA {name}').fetchone()[0]
+            finally:
+                wrapper.close()
+        # synchronous=NORMAL — 1, busy_timeout в миллисекундах
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -1024, 'busy_timeout': 20000})
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+
+    def test_postgres_persistent_or_pooled(self):
+        persistent = database_settings({'DB_PROFILE': 'postgres', 'DB_CONN_MAX_AGE': '300'}, Path('/srv'))
+        self.assertEqual((persistent['CONN_MAX_AGE'], persistent['OPTIONS']), (300, {}))
+        env = {'DB_PROFILE': 'postgres', 'DB_POOL': '1', 'DB_POOL_MAX_SIZE': '20'}
+        # Результат не зависит от того, установлен ли psycopg_pool здесь
+        with mock.patch('users.dbprofile.find_spec', return_value=object()):
+            pooled = database_settings(env, Path('/srv'))
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+        self.assertEqual(pooled['OPTIONS']['pool'], {'min_size': 2, 'max_size': 20, 'timeout': 10})
+        with mock.patch('users.dbprofile.find_spec', return_value=None):
+            with self.assertRaisesMessage(ValueError, "psycopg[pool]"):
+                database_settings(env, Path('/srv'))
+
+
+class ReplicaRouterTests(BaseTestCase):
+    """Вторая SQLite-база как реплика: в ней каталог отличается от основной."""
+    tables = ['users_region', 'users_country', 'users_city', 'users_membershipcard']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica1'] = connections.configure_settings({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')},
+        })['default']
+        # Алиас появляется только здесь, поэтому и databases задаётся здесь, а не в классе:
+        # раннер тестов создаёт тестовые БД по атрибуту класса до setUpClass
+        cls.databases = {'default', 'replica1'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        make_catalog(regions=1, countries=1, cities=1)
+        self.user = User.objects.create_user("traveler@example.com", "pass")
+        self.client.force_authenticate(self.user)
+
+        placeholders = ', '.join('%s' for _ in self.tables)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})", self.tables)
+            schema = [sql for sql, in cursor.fetchall()]
+        with connections['replica1'].cursor() as cursor:
+            for sql in schema:
+                cursor.execute(sql)
+        Region.objects.using('replica1').bulk_create([
+            Region(name="replica", display_name="Реплика", description="", image="https://e.com/r.jpg", best_time="-"),
+        ])
+
+        replicas = self.settings(DATABASE_REPLICAS=['replica1'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+
+    def region_names(self):
+        cache.clear()
+        return [region['name'] for region in self.client.get('/api/regions/').json()]
+
+    def test_catalog_reads_go_to_replica(self):
+        self.assertEqual(self.region_names(), ['replica'])
+        # Вне запроса (команды, фоновые задачи) — основная БД
+        self.assertEqual(Region.objects.all().db, 'default')
+        # Пользователи и карты пользователей не реплицируются
+        token = routers.begin()
+        try:
+            self.assertEqual((City.objects.all().db, User.objects.all().db, UserMembership.objects.all().db),
+                             ('replica1', 'default', 'default'))
+        finally:
+            routers.end(token)
+
+    def test_reads_after_write_stick_to_primary(self):
+        token = routers.begin()
+        try:
+            self.assertEqual(Region.objects.all().db, 'replica1')
+            Region.objects.filter(pk=0).update(name='x')
+            self.assertEqual(Region.objects.all().db, 'default')
+        finally:
+            routers.end(token)
+
+        response = self.client.post('/api/tours/', {'city': City.objects.get().pk, 'title': 'trip'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies['pin_primary']['max-age'], 5)
+        self.assertEqual(self.region_names(), ['region-0'])
+
+        del self.client.cookies['pin_primary']
+        self.assertEqual(self.region_names(), ['replica'])
+
+    async def test_async_middleware_sticks_to_primary(self):
+        databases = []
+
+        async def view(request):
+            databases.append(Region.objects.all().db)
+            await sync_to_async(Region.objects.filter(pk=0).update)(name='x')
+            databases.append(await sync_to_async(lambda: Region.objects.all().db)())
+            return HttpResponse()
+
+        stickiness = middleware.ReplicaStickinessMiddleware(view)
+        self.assertTrue(iscoroutinefunction(stickiness))
+        response = await stickiness(AsyncRequestFactory().get('/api/regions/'))
+        self.assertEqual(databases, ['replica1', 'default'])
+        self.assertEqual(response.cookies['pin_primary']['max-age'], 5)
+
+    def test_fresh_version_is_not_cached_from_replica(self):
+        cache.clear()
+        self.assertEqual([region['name'] for region in self.client.get('/api/regions/').json()], ['replica'])
+        # Правка с другого клиента: новая версия, а реплика её ещё не видит
+        region = Region.objects.get()
+        region.display_name = 'Новое'
+        region.save()
+        response = self.client.get('/api/regions/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['display_name'], 'Новое')
+        self.assertEqual(self.client.get('/api/regions/')['X-Cache'], 'HIT')
+
+        with self.settings(REPLICA_STICKY_SECONDS=0):
+            region.save()
+            self.assertEqual([region['name'] for region in self.client.get('/api/regions/').json()], ['replica'])
+
+    def test_one_replica_per_request(self):
+        router = routers.ReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=['replica1', 'replica2', 'replica3']):
+            token = routers.begin()
+            try:
+                self.assertEqual(len({router.db_for_read(City) for _ in range(30)}), 1)
+            finally:
+                routers.end(token)
+
+    def test_state_outside_request_is_per_thread(self):
+        router = routers.ReplicaRouter()
+        own = routers.current_state()
+        own.wrote = False
+        states = []
+        thread = threading.Thread(target=lambda: (router.db_for_write(Region), states.append(routers.current_state())))
+        thread.start()
+        thread.join()
+        self.assertTrue(states[0].wrote)
+        self.assertIsNot(states[0], own)
+        self.assertFalse(own.wrote)
+
+
+# ---------- REF ID ----------
+class RefIdTests(BaseTestCase):
+    def test_scramble_is_a_bijection(self):
+        sample = list(range(0, 20000)) + list(range(refids.REF_ID_SPACE - 1000, refids.REF_ID_SPACE))
+        scrambled = [refids.scramble(n) for n in sample]
+        self.assertEqual(len(set(scrambled)), len(sample))
+        self.assertTrue(all(0 <= value < refids.REF_ID_SPACE for value in scrambled))
+        self.assertEqual([refids.unscramble(value) for value in scrambled], sample)
+
+    def test_allocated_ids_are_unique_and_skip_legacy(self):
+        legacy = refids.format_ref_id(refids.scramble(1))
+        User.objects.create_user("legacy@example.com", ref_id=legacy)
+        users = [User.objects.create_user(f"user-{i}@example.com") for i in range(5)]
+        ref_ids = [user.ref_id for user in users]
+        self.assertEqual(len(set(ref_ids)), 5)
+        self.assertNotIn(legacy, ref_ids)
+        self.assertTrue(all(re.fullmatch(r"VT-\d{7}", ref_id) for ref_id in ref_ids))
+        self.assertEqual(RefIdSequence.objects.get().next_value, refids.allocator.block_size)
+
+    def test_block_from_rolled_back_create_is_dropped(self):
+        User.objects.create_user("taken@example.com", ref_id=refids.format_ref_id(0))
+        # Блок резервируется внутри create_user, дубликат email откатывает его вместе с UPDATE
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user("taken@example.com")
+        self.assertFalse(RefIdSequence.objects.exists())
+
+        other = refids.RefIdAllocator()
+        mine = {refids.allocator.allocate() for _ in range(5)}
+        theirs = {other.allocate() for _ in range(5)}
+        self.assertFalse(mine & theirs)
+
+
+class ImportUsersTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.card = make_card()
+        self.referrer = User.objects.create_user("partner@example.com")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "users.csv")
+        rows = [
+            ("a@example.com", "secret-a", self.referrer.ref_id, "gold", ""),
+            ("b@example.com", "", "VT-0000042", "", ""),
+            ("c@example.com", "secret-c", "", "gold", "2099-01-01"),
+            ("d@example.com", "", "", "", ""),
+        ]
+        with open(self.path, "w", newline="") as target:
+            writer = csv.writer(target)
+            writer.writerow(["email", "password", "ref_code", "card", "end_date", "ref_id"])
+            for email, password, ref_code, card, end_date in rows:
+                ref_id = "VT-0000042" if email == "d@example.com" else ""
+                writer.writerow([email, password, ref_code, card, end_date, ref_id])
+
+    def run_import(self):
+        stderr = StringIO()
+        call_command('import_users', self.path, '--batch-size', '2', '--workers', '1', stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_import_with_forward_referrals(self):
+        self.run_import()
+        users = {user.email: user for user in User.objects.all()}
+        self.assertEqual(users["a@example.com"].referrer, self.referrer)
+        self.assertEqual(users["b@example.com"].referrer, users["d@example.com"])
+        self.assertTrue(users["a@example.com"].check_password("secret-a"))
+        self.assertFalse(users["b@example.com"].has_usable_password())
+        self.assertEqual(UserMembership.objects.count(), 2)
+        self.assertEqual(str(UserMembership.objects.get(user=users["c@example.com"]).end_date), "2099-01-01")
+        self.assertFalse(os.path.exists(self.path + ".checkpoint"))
+
+    def test_bad_ref_ids_skip_only_their_rows(self):
+        with open(self.path, "a", newline="") as target:
+            writer = csv.writer(target)
+            writer.writerow(["e@example.com", "", "", "", "", "42"])
+            writer.writerow(["f@example.com", "", "", "", "", self.referrer.ref_id])
+            writer.writerow(["g@example.com", "", "", "", "", "VT-0000043"])
+        errors = self.run_import()
+        self.assertIn("e@example.com: некорректный ref_id 42", errors)
+        self.assertIn(f"f@example.com: ref_id {self.referrer.ref_id} уже занят", errors)
+        emails = set(User.objects.values_list('email', flat=True))
+        self.assertNotIn("e@example.com", emails)
+        self.assertNotIn("f@example.com", emails)
+        self.assertEqual(User.objects.get(email="g@example.com").ref_id, "VT-0000043")
+
+    def test_empty_file(self):
+        open(self.path, "w").close()
+        self.run_import()
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_resume_skips_finished_records(self):
+        with open(self.path + ".checkpoint", "w") as target:
+            json.dump({"records": 2, "pending_referrals": []}, target)
+        self.run_import()
+        self.assertEqual(set(User.objects.values_list('email', flat=True)),
+                         {"partner@example.com", "c@example.com", "d@example.com"})
+
+        self.run_import()
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(UserMembership.objects.count(), 2)
@@ -1,30 +1,52 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
-    RegisterView, LoginView, MeView, MembershipCardListView, ProfileView,
+    RegisterView, LoginView, MeView, MembershipCardListView, ProfileView, BonusHistoryListView,
+    TourBookingView,
     RegionListView, RegionDetailView, CountryListView, CountryDetailView,
-    CityListView, CityDetailView, CountryCitiesView, RegionCountriesView
+    CityListView, CityDetailView, CountryCitiesView, RegionCountriesView,
+    SearchView, catalog_snapshot,
 )
 
+
+def pick_view(view):
+    """С ASYNC_VIEWS — асинхронный двойник вьюхи из users/async_views.py."""
+    if settings.ASYNC_VIEWS:
+        from . import async_views
+        return getattr(async_views, f'Async{view.__name__}')
+    return view
+
+
 urlpatterns = [
     # ---------- User & Auth ----------
     path('user/auth/register/', RegisterView.as_view(), name='register'),
     path('user/auth/login/', LoginView.as_view(), name='login'),
     path('user/me/', MeView.as_view(), name='me'),
-    path('user/profile/', ProfileView.as_view(), name='profile'),
+    path('user/profile/', pick_view(ProfileView).as_view(), name='profile'),
+    path('user/bonuses/', BonusHistoryListView.as_view(), name='bonuses'),
 
-    path('cards/', MembershipCardListView.as_view(), name='cards'),
+    path('cards/', pick_view(MembershipCardListView).as_view(), name='cards'),
+
+    # ---------- Tours ----------
+    path('tours/', TourBookingView.as_view(), name='tour-booking'),
 
     # ---------- Regions ----------
-    path('regions/', RegionListView.as_view(), name='regions-list'),
-    path('regions/<int:pk>/', RegionDetailView.as_view(), name='region-detail'),
-    path('regions/<int:region_id>/countries/', RegionCountriesView.as_view(), name='region-countries'),
+    path('regions/', pick_view(RegionListView).as_view(), name='regions-list'),
+    path('regions/<int:pk>/', pick_view(RegionDetailView).as_view(), name='region-detail'),
+    path('regions/<int:region_id>/countries/', pick_view(RegionCountriesView).as_view(), name='region-countries'),
 
     # ---------- Countries ----------
-    path('countries/', CountryListView.as_view(), name='countries-list'),
-    path('countries/<int:pk>/', CountryDetailView.as_view(), name='country-detail'),
-    path('countries/<int:country_id>/cities/', CountryCitiesView.as_view(), name='country-cities'),
+    path('countries/', pick_view(CountryListView).as_view(), name='countries-list'),
+    path('countries/<int:pk>/', pick_view(CountryDetailView).as_view(), name='country-detail'),
+    path('countries/<int:country_id>/cities/', pick_view(CountryCitiesView).as_view(), name='country-cities'),
 
     # ---------- Cities ----------
-    path('cities/', CityListView.as_view(), name='cities-list'),
-    path('cities/<int:pk>/', CityDetailView.as_view(), name='city-detail'),
+    path('cities/', pick_view(CityListView).as_view(), name='cities-list'),
+    path('cities/<int:pk>/', pick_view(CityDetailView).as_view(), name='city-detail'),
+
+    # ---------- Catalog snapshot ----------
+    path('catalog/snapshot/', catalog_snapshot, name='catalog-snapshot'),
+
+    # ---------- Search ----------
+    path('search/', SearchView.as_view(), name='search'),
 ]
\ No newline at end of file
@@ -1,10 +1,25 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
 from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .serializers import RegisterSerializer, UserSerializer, MembershipCardSerializer, ProfileSerializer, RegionListSerializer, RegionSerializer, CountryListSerializer, CountrySerializer, CitySerializer
-from .models import MembershipCard, Region, Country, City
+from .serializers import RegisterSerializer, UserSerializer, MembershipCardSerializer, ProfileSerializer, RegionListSerializer, RegionSerializer, CountryListSerializer, CountrySerializer, CitySerializer, BonusHistorySerializer, TourSerializer, SearchResultSerializer
+from .models import MembershipCard, Region, Country, City, SearchDocument
+from . import metrics, search, snapshot
+from .cache import CachedResponseMixin
+from .filters import CatalogFilterBackend, bounded_int
+from .fieldsets import SparseFieldsViewMixin
+from .rows import FastSerializationMixin
+from .pagination import KeysetPagination, SearchPagination
 from .management.commands import deactivate_expired_cards
 
 
@@ -54,65 +69,187 @@ class ProfileView(generics.RetrieveAPIView):
 
     def get_object(self):
         # deactivate_expired_cards()  # раскомментируйте если нужно
-        return self.request.user
+        user = self.request.user
+        prefetch_related_objects(
+            [user], Prefetch('user_memberships', queryset=ProfileSerializer.memberships_queryset())
+        )
+        return user
+
+class TourBookingView(generics.CreateAPIView):
+    serializer_class = TourSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+
+class BonusHistoryListView(generics.ListAPIView):
+    serializer_class = BonusHistorySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering_fields = {'created_at': 'created_at'}
+    default_ordering = '-created_at'
+
+    def get_queryset(self):
+        return self.request.user.bonuses_received.select_related('tour')
 
-class MembershipCardListView(generics.ListAPIView):
+
+class MembershipCardListView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, generics.ListAPIView):
+    cache_scopes = ['membershipcard']
     queryset = MembershipCard.objects.all()
     serializer_class = MembershipCardSerializer
-    permission_classes = [permissions.AllowAny] 
+    permission_classes = [permissions.AllowAny]
+
+# ---------- CATALOG LISTS ----------
+class CityCatalogMixin:
+    pagination_class = KeysetPagination
+    filter_backends = [CatalogFilterBackend]
+    filter_params = {
+        'min_price': ('price__gte', bounded_int),
+        'max_price': ('price__lte', bounded_int),
+        'min_rating': ('rating__gte', Decimal),
+        'country': ('country_id', bounded_int),
+        'region': ('country__region_id', bounded_int),
+    }
+    ordering_fields = {'price': 'price', 'rating': 'rating', 'name': 'name'}
+
+
+class CountryCatalogMixin:
+    pagination_class = KeysetPagination
+    filter_backends = [CatalogFilterBackend]
+    filter_params = {
+        'min_price': ('min_price__gte', bounded_int),
+        'max_price': ('min_price__lte', bounded_int),
+        'min_rating': ('max_rating__gte', Decimal),
+        'region': ('region_id', bounded_int),
+    }
+    ordering_fields = {'price': 'min_price', 'rating': 'max_rating', 'name': 'name'}
+
 
 # ---------- REGION VIEWS ----------
-class RegionListView(generics.ListAPIView):
-    queryset = Region.objects.all()
+class RegionListView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, generics.ListAPIView):
+    cache_scopes = ['region']
+    queryset = Region.objects.order_by('pk').prefetch_related(
+        Prefetch('countries', queryset=Country.objects.only('id', 'name', 'region_id'))
+    )
     serializer_class = RegionListSerializer
     permission_classes = [permissions.AllowAny]
 
 
-class RegionDetailView(generics.RetrieveAPIView):
-    queryset = Region.objects.all()
+class RegionDetailView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, generics.RetrieveAPIView):
+    cache_scopes = ['region:{pk}']
+    queryset = Region.objects.prefetch_related(
+        Prefetch('countries', queryset=Country.objects.order_by('pk'))
+    )
     serializer_class = RegionSerializer
     permission_classes = [permissions.AllowAny]
 
 
 # ---------- COUNTRY VIEWS ----------
-class CountryListView(generics.ListAPIView):
-    queryset = Country.objects.all()
+class CountryListView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, CountryCatalogMixin, generics.ListAPIView):
+    cache_scopes = ['country']
+    queryset = Country.objects.order_by('pk')
     serializer_class = CountryListSerializer
     permission_classes = [permissions.AllowAny]
 
 
-class CountryDetailView(generics.RetrieveAPIView):
-    queryset = Country.objects.all()
+class CountryDetailView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, generics.RetrieveAPIView):
+    cache_scopes = ['country:{pk}']
+    queryset = Country.objects.prefetch_related('cities')
     serializer_class = CountrySerializer
     permission_classes = [permissions.AllowAny]
 
 
 # ---------- CITY VIEWS ----------
-class CityListView(generics.ListAPIView):
+class CityListView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, CityCatalogMixin, generics.ListAPIView):
+    cache_scopes = ['city']
     queryset = City.objects.all()
     serializer_class = CitySerializer
     permission_classes = [permissions.AllowAny]
 
 
-class CityDetailView(generics.RetrieveAPIView):
+class CityDetailView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, generics.RetrieveAPIView):
+    cache_scopes = ['city:{pk}']
     queryset = City.objects.all()
     serializer_class = CitySerializer
     permission_classes = [permissions.AllowAny]
 
 
-class RegionCountriesView(generics.ListAPIView):
+class RegionCountriesView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, CountryCatalogMixin, generics.ListAPIView):
+    cache_scopes = ['region:{region_id}']
     serializer_class = CountryListSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
         region_id = self.kwargs['region_id']
-        return Country.objects.filter(region_id=region_id)
+        return Country.objects.filter(region_id=region_id).order_by('pk')
 
 
-class CountryCitiesView(generics.ListAPIView):
+class CountryCitiesView(CachedResponseMixin, FastSerializationMixin, SparseFieldsViewMixin, CityCatalogMixin, generics.ListAPIView):
+    cache_scopes = ['country:{country_id}']
     serializer_class = CitySerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
         country_id = self.kwargs['country_id']
-        return City.objects.filter(country_id=country_id)
\ No newline at end of file
+        return City.objects.filter(country_id=country_id)
+
+# ---------- SEARCH ----------
+class SearchView(CachedResponseMixin, generics.ListAPIView):
+    """?q= — слова запроса (по префиксу), ?type=region,country,city — фильтр по типу."""
+    cache_scopes = ['region', 'country', 'city']
+    serializer_class = SearchResultSerializer
+    pagination_class = SearchPagination
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '')
+        if not search.parse_terms(query):
+            raise ValidationError({'q': 'Введите поисковый запрос'})
+        kinds = [kind for kind in self.request.query_params.get('type', '').split(',') if kind]
+        if set(kinds) - set(SearchDocument.Kind.values):
+            raise ValidationError({'type': f"Допустимые значения: {', '.join(SearchDocument.Kind.values)}"})
+        return search.SearchResults(query, kinds)
+
+
+# ---------- CATALOG SNAPSHOT ----------
+@require_GET
+def catalog_snapshot(request):
+    """
+    Весь каталог Region → Country → City одним документом.
+    Снимок собирает команда build_catalog_snapshot (см. users/snapshot.py), запрос только
+    выбирает сжатый файл под Accept-Encoding и отдаёт его. Пока снимок не собран — 503;
+    устаревший снимок отдаётся с заголовком X-Snapshot-Stale до следующей сборки.
+    """
+    manifest = snapshot.read_manifest()
+    if manifest is None:
+        response = HttpResponse(status=503)
+        response['Retry-After'] = '30'
+        return response
+
+    etag = f'"{manifest["hash"]}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        path, encoding = snapshot.choose_file(manifest, request.headers.get('Accept-Encoding', ''))
+        response = FileResponse(path.open('rb'), content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    if snapshot.is_stale(manifest):
+        response[snapshot.STALE_HEADER] = '1'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=60'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+# ---------- METRICS ----------
+@require_GET
+def metrics_view(request):
+    """Метрики MetricsMiddleware в текстовом формате Prometheus."""
+    token = settings.METRICS_TOKEN
+    if not token or metrics.prometheus_client is None:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    content, content_type = metrics.render()
+    return HttpResponse(content, content_type=content_type)